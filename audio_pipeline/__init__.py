@@ -0,0 +1,15 @@
+"""
+Shared building blocks for the Python audio generators
+(generate_audio.py, generate_audio_edge.py, generate_audio_lessons567.py).
+"""
+
+from .engines import TTSEngine, get_engine
+from .scheduler import SynthesisJob, JobResult, run_jobs
+
+__all__ = [
+    "TTSEngine",
+    "get_engine",
+    "SynthesisJob",
+    "JobResult",
+    "run_jobs",
+]
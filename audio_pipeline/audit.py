@@ -0,0 +1,366 @@
+"""
+Audio and content integrity audit.
+
+    python3 -m audio_pipeline.audit [--lessons 4 5 6] [--json audit.json]
+
+One pass over public/audio, the lesson manifests, public/data/slides-config.json
+and the lesson corpus (corpus.py), replacing the one-off JS checks
+(check-slide-audio-match.js, audit-lessons.ts, diagnose-audio-issue.js):
+
+    errors    slide count mismatches, slides with a script but no MP3,
+              zero-byte MP3s, MP3s with no frames, mixed formats or bytes
+              outside MPEG frames
+    warnings  slides whose duration is far off what their text length
+              predicts, MP3s rewritten behind the manifest's back, slides
+              whose script changed since they were generated, stale sprite
+              indexes and timing sidecars, and manifest, timing.json or
+              sprite durations that disagree with the audio frames
+
+Reading and parsing the MP3s is the expensive part, so it runs in a process
+pool and its results are kept in .tts-audit/files.json keyed by each file's
+(mtime, size): a repeat audit only re-reads files that changed. Exits 1 if
+there are errors.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+from . import mp3
+from .cache import normalize_text
+from .corpus import DEFAULT_STORE_DIR, CorpusIndex
+from .fsutil import atomic_write_bytes
+from .manifest import MANIFEST_NAME
+from .sprite import INDEX_NAME as SPRITE_INDEX
+from .timing import LESSON_INDEX, sidecar_path
+
+AUDIT_VERSION = 1
+DEFAULT_BASE_DIR = "public/audio"
+DEFAULT_SLIDES_CONFIG = "public/data/slides-config.json"
+DEFAULT_CACHE = ".tts-audit/files.json"
+DEFAULT_OUTLIER_FACTOR = 2.0
+MAX_GARBAGE_RATIO = 0.01  # a truncated last frame is fine, a spliced-in HTML error page is not
+MIN_OUTLIER_SAMPLES = 8
+DURATION_TOLERANCE = 0.0015  # indexes round to milliseconds
+
+_LESSON_DIR = re.compile(r"^lesson(\d+)$")
+_SLIDE_FILE = re.compile(r"^slide(\d+)\.mp3$")
+
+
+@dataclass
+class Issue:
+    severity: str  # "error" or "warning"
+    kind: str
+    path: str
+    message: str
+
+    def __str__(self):
+        mark = "✗" if self.severity == "error" else "⚠"
+        return f"   {mark} {self.path}: {self.message}"
+
+
+def file_facts(path):
+    """Everything the audit needs from one MP3. Runs in a worker process."""
+    with open(path, "rb") as f:
+        data = f.read()
+    frames = list(mp3.iter_frames(data))
+    audio = frames[1:] if frames and mp3.is_info_frame(data, frames[0]) else frames
+    framed = sum(f.length for f in frames) + mp3.id3v2_size(data)
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        framed += 128
+    return {
+        "bytes": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "frames": len(audio),
+        "durationSec": round(sum(f.duration for f in audio), 3),
+        "formats": sorted({f"{f.sample_rate}/{f.channels}" for f in audio}),
+        "garbageBytes": max(0, len(data) - framed),
+    }
+
+
+class FactCache:
+    """{relative path: [mtime_ns, size, facts]} for every MP3 audited before."""
+
+    def __init__(self, path):
+        self.path = path
+        data = (_load_json(path) if path else None) or {}
+        self.files = data.get("files", {}) if data.get("version") == AUDIT_VERSION else {}
+
+    def save(self):
+        if self.path:
+            payload = json.dumps({"version": AUDIT_VERSION, "files": self.files}, separators=(",", ":"))
+            atomic_write_bytes(self.path, payload.encode("utf-8"))
+
+
+def find_mp3s(base_dir):
+    """{relative path: stat} for every MP3 under `base_dir`."""
+    found = {}
+    for dirpath, dirnames, filenames in os.walk(base_dir):
+        dirnames.sort()
+        for name in filenames:
+            if name.endswith(".mp3") and not name.startswith(".tmp-"):
+                path = os.path.join(dirpath, name)
+                found[os.path.relpath(path, base_dir)] = os.stat(path)
+    return found
+
+
+def collect_facts(base_dir, cache, workers=None):
+    """{relative path: facts}, re-reading only files whose (mtime, size) changed. Returns (facts, reread)."""
+    files = find_mp3s(base_dir)
+    facts, todo = {}, []
+    for rel, st in files.items():
+        cached = cache.files.get(rel)
+        if cached and cached[:2] == [st.st_mtime_ns, st.st_size]:
+            facts[rel] = cached[2]
+        else:
+            todo.append(rel)
+    if todo:
+        paths = [os.path.join(base_dir, rel) for rel in todo]
+        if len(todo) < 16:  # not worth starting processes for
+            results = list(map(file_facts, paths))
+        else:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+                results = list(pool.map(file_facts, paths, chunksize=8))
+        for rel, result in zip(todo, results):
+            facts[rel] = result
+            st = files[rel]
+            cache.files[rel] = [st.st_mtime_ns, st.st_size, result]
+    for rel in set(cache.files) - set(files):
+        del cache.files[rel]
+    return facts, len(todo)
+
+
+def _natural(rel):
+    """Sort key that puts slide2 before slide10."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", rel)]
+
+
+def _load_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def check_file(rel, facts):
+    if facts["bytes"] == 0:
+        return [Issue("error", "empty", rel, "zero-byte file")]
+    if not facts["frames"]:
+        return [Issue("error", "corrupt", rel, f"no MPEG audio frames in {facts['bytes']} bytes")]
+    issues = []
+    if facts["garbageBytes"] > facts["bytes"] * MAX_GARBAGE_RATIO:
+        issues.append(Issue("error", "corrupt", rel,
+                            f"{facts['garbageBytes']} of {facts['bytes']} bytes are outside MPEG frames"))
+    if len(facts["formats"]) > 1:
+        issues.append(Issue("error", "corrupt", rel, f"mixed formats {', '.join(facts['formats'])} (Hz/channels)"))
+    return issues
+
+
+class LessonAudit:
+    """The slide-level checks for one public/audio/lessonN directory."""
+
+    def __init__(self, base_dir, lesson, facts, corpus, expected):
+        self.lesson = lesson
+        self.dir = f"lesson{lesson}"
+        self.lesson_dir = os.path.join(base_dir, self.dir)
+        self.facts = facts
+        self.texts = corpus.lesson_texts(lesson) if corpus and lesson in corpus.lessons() else {}
+        self.expected = expected
+        self.manifest = _load_json(os.path.join(self.lesson_dir, MANIFEST_NAME)) or {}
+        self.owned = {int(info["slide"]): info for info in self.manifest.get("slidesInfo", [])}
+        self.sprite = _load_json(os.path.join(self.lesson_dir, SPRITE_INDEX))
+        self.timing = _load_json(os.path.join(self.lesson_dir, LESSON_INDEX))
+        self.slides = {}
+        for rel in facts:
+            directory, name = os.path.split(rel)
+            match = _SLIDE_FILE.match(name)
+            if directory == self.dir and match:
+                self.slides[int(match.group(1))] = rel
+
+    def chars(self, slide):
+        if slide in self.texts:
+            return len(normalize_text(self.texts[slide]))
+        return self.owned.get(slide, {}).get("characterCount")
+
+    def check(self):
+        issues = self.check_counts()
+        for slide, rel in sorted(self.slides.items()):
+            issues.extend(self.check_drift(slide, rel))
+            issues.extend(self.check_durations(slide, rel))
+        issues.extend(self.check_sprite())
+        return issues
+
+    def check_counts(self):
+        issues = []
+        counts = {"audio files": len(self.slides)}
+        if self.expected is not None:
+            counts["slides-config.json"] = self.expected
+        if self.texts:
+            counts["audio script"] = len(self.texts)
+        if len(set(counts.values())) > 1:
+            issues.append(Issue("error", "count", self.dir,
+                                "slide counts disagree: " + ", ".join(f"{n} in {k}" for k, n in counts.items())))
+        wanted = set(self.texts) or set(range(1, (self.expected or 0) + 1))
+        for slide in sorted(wanted - set(self.slides)):
+            issues.append(Issue("error", "missing", f"{self.dir}/slide{slide}.mp3", "no audio for this slide"))
+        return issues
+
+    def check_drift(self, slide, rel):
+        facts, issues = self.facts[rel], []
+        info = self.owned.get(slide)
+        if info is not None and info.get("outputHash") not in (None, facts["sha256"]):
+            issues.append(Issue("warning", "drift", rel, "changed since the manifest recorded it"))
+        if info is not None and slide in self.texts:
+            text_hash = hashlib.sha256(normalize_text(self.texts[slide]).encode("utf-8")).hexdigest()
+            if info.get("textHash") != text_hash:
+                issues.append(Issue("warning", "stale", rel, "script text changed since it was generated"))
+        timing = _load_json(sidecar_path(os.path.join(self.lesson_dir, os.path.basename(rel))))
+        if timing is not None and facts["frames"] and abs(timing.get("durationSec", 0) - facts["durationSec"]) > 0.1:
+            issues.append(Issue("warning", "drift", rel, f"timing sidecar says {timing['durationSec']:.1f}s, "
+                                                         f"audio is {facts['durationSec']:.1f}s"))
+        return issues
+
+    def check_durations(self, slide, rel):
+        """
+        The manifest, timing.json and the sprite index must all give a slide
+        the duration measured from its audio frames (no Xing/Info frame).
+        Only entries that describe the current file are compared.
+        """
+        facts = self.facts[rel]
+        if not facts["frames"]:
+            return []
+        recorded = {}
+        info = self.owned.get(slide)
+        if info is not None and info.get("outputHash") == facts["sha256"]:
+            recorded[MANIFEST_NAME] = info.get("durationSec")
+        if self.timing is not None:
+            entry = next((e for e in self.timing.get("slides", []) if e.get("slide") == slide), None)
+            recorded[LESSON_INDEX] = entry and entry.get("durationSec")
+        if self.sprite is not None and self.sprite.get("sources", {}).get(str(slide)) == facts["sha256"]:
+            entry = next((e for e in self.sprite.get("slides", []) if e.get("slide") == slide), None)
+            recorded[SPRITE_INDEX] = entry and entry.get("durationSec")
+        off = [f"{name} says {'nothing' if value is None else f'{value:.3f}s'}" for name, value in recorded.items()
+               if value is None or abs(value - facts["durationSec"]) > DURATION_TOLERANCE]
+        if not off:
+            return []
+        return [Issue("warning", "index", rel, f"audio is {facts['durationSec']:.3f}s but {', '.join(off)}")]
+
+    def check_sprite(self):
+        index = self.sprite
+        if index is None:
+            return []
+        current = {str(slide): self.facts[rel]["sha256"] for slide, rel in self.slides.items()}
+        stale = [s for s, sha in index.get("sources", {}).items() if current.get(s) != sha]
+        if stale:
+            return [Issue("warning", "drift", f"{self.dir}/{SPRITE_INDEX}",
+                          f"built from older audio for slide(s) {', '.join(sorted(stale, key=int))}")]
+        return []
+
+
+def duration_outliers(audits, factor=DEFAULT_OUTLIER_FACTOR):
+    """Slides whose seconds per character are more than `factor` off the median of every audited slide."""
+    rates = []
+    for audit in audits:
+        for slide, rel in audit.slides.items():
+            chars, facts = audit.chars(slide), audit.facts[rel]
+            if chars and facts["frames"]:
+                rates.append((facts["durationSec"] / chars, rel, chars, facts["durationSec"]))
+    if len(rates) < MIN_OUTLIER_SAMPLES:
+        return []
+    median = statistics.median(rate for rate, *_ in rates)
+    issues = []
+    for rate, rel, chars, seconds in rates:
+        if rate > median * factor or rate < median / factor:
+            expected = chars * median
+            issues.append(Issue("warning", "duration", rel,
+                                f"{seconds:.1f}s for {chars} characters (about {expected:.1f}s expected)"))
+    return issues
+
+
+def run_audit(base_dir=DEFAULT_BASE_DIR, lessons=None, slides_config=DEFAULT_SLIDES_CONFIG, corpus=None,
+              cache_path=DEFAULT_CACHE, workers=None, outlier_factor=DEFAULT_OUTLIER_FACTOR):
+    """Returns (issues, stats). `lessons` limits the slide-level checks (default: every lessonN directory)."""
+    started = time.perf_counter()
+    cache = FactCache(cache_path)
+    facts, reread = collect_facts(base_dir, cache, workers)
+    cache.save()
+
+    config = _load_json(slides_config) or {}
+    dirs = {int(m.group(1)) for m in map(_LESSON_DIR.match, os.listdir(base_dir)) if m}
+    selected = sorted(dirs if lessons is None else set(lessons))
+    prefixes = None if lessons is None else tuple(f"lesson{n}{os.sep}" for n in selected)
+
+    issues = []
+    for rel, file_facts_ in sorted(facts.items(), key=lambda item: _natural(item[0])):
+        if prefixes is None or rel.startswith(prefixes):
+            issues.extend(check_file(rel, file_facts_))
+    audits = [LessonAudit(base_dir, lesson, facts, corpus, config.get(str(lesson))) for lesson in selected]
+    for audit in audits:
+        if not os.path.isdir(audit.lesson_dir):
+            issues.append(Issue("error", "missing", audit.dir, "no audio directory"))
+            continue
+        issues.extend(audit.check())
+    issues.extend(duration_outliers(audits, outlier_factor))
+
+    stats = {
+        "files": len(facts) if prefixes is None else sum(rel.startswith(prefixes) for rel in facts),
+        "reread": reread,
+        "lessons": len(audits),
+        "errors": sum(i.severity == "error" for i in issues),
+        "warnings": sum(i.severity == "warning" for i in issues),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    return issues, stats
+
+
+def print_report(issues, stats, verbose=False):
+    by_kind = {}
+    for issue in issues:
+        by_kind.setdefault(issue.kind, []).append(issue)
+    for kind, items in sorted(by_kind.items()):
+        print(f"\n{kind} ({len(items)})")
+        for issue in items if verbose else items[:20]:
+            print(issue)
+        if not verbose and len(items) > 20:
+            print(f"   ... {len(items) - 20} more (--verbose)")
+    mark = "✓" if not stats["errors"] else "✗"
+    print(f"\n{mark} Audited {stats['files']} MP3s in {stats['lessons']} lessons in {stats['seconds']:.2f}s "
+          f"({stats['reread']} read, the rest from cache): {stats['errors']} errors, {stats['warnings']} warnings")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m audio_pipeline.audit", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lessons", "--lesson", type=int, nargs="+",
+                        help="only these lessons' slides (default: every lessonN directory)")
+    parser.add_argument("--base-dir", default=DEFAULT_BASE_DIR)
+    parser.add_argument("--slides-config", default=DEFAULT_SLIDES_CONFIG)
+    parser.add_argument("--corpus-dir", default=DEFAULT_STORE_DIR, help="where the compiled lesson corpus is kept")
+    parser.add_argument("--audit-cache", default=DEFAULT_CACHE, help="per-file results keyed by (mtime, size)")
+    parser.add_argument("--no-cache", action="store_true", help="re-read every file")
+    parser.add_argument("--workers", type=int, help="processes for reading MP3s (default: CPU count)")
+    parser.add_argument("--outlier-factor", type=float, default=DEFAULT_OUTLIER_FACTOR,
+                        help="flag slides this many times longer or shorter than their text predicts")
+    parser.add_argument("--json", help="also write the issues and stats to this file")
+    parser.add_argument("--verbose", "-v", action="store_true", help="list every issue")
+    args = parser.parse_args(argv)
+
+    with CorpusIndex.open(store_dir=args.corpus_dir) as corpus:
+        issues, stats = run_audit(args.base_dir, args.lessons, args.slides_config, corpus,
+                                  None if args.no_cache else args.audit_cache, args.workers, args.outlier_factor)
+    print_report(issues, stats, args.verbose)
+    if args.json:
+        report = {"stats": stats, "issues": [asdict(issue) for issue in issues]}
+        atomic_write_bytes(args.json, (json.dumps(report, ensure_ascii=False, indent=1) + "\n").encode("utf-8"))
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
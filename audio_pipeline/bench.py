@@ -0,0 +1,238 @@
+"""
+Benchmark harness for the audio generation pipeline.
+
+Runs the real generation path (runner.generate: manifests, journal, cache,
+limiter, chunking) against a simulated TTS backend with configurable latency,
+jitter and failure rate, next to a replica of the original one-slide-at-a-time
+loop from generate_audio_lessons567.py. Each (mode, concurrency) case runs in
+its own process so peak RSS is per case.
+
+    python3 -m audio_pipeline.bench run --out bench/baseline.json
+    python3 -m audio_pipeline.bench run --out /tmp/current.json
+    python3 -m audio_pipeline.bench compare bench/baseline.json /tmp/current.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .corpus import CorpusIndex
+from .engines import LocalEngine
+from .scheduler import SynthesisJob
+
+MODES = ("serial", "scheduler", "chunked", "sentences")
+
+
+class SimulatedEngine(LocalEngine):
+    """
+    LocalEngine output with provider-like timing: `latency` seconds (+/- up to
+    `jitter`) before the first byte, then audio at `chars_per_sec`, failing
+    with probability `failure_rate`.
+    """
+    name = "sim"
+
+    def __init__(self, latency=0.4, jitter=0.2, chars_per_sec=1500.0, failure_rate=0.0, seed=1):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.chars_per_sec = chars_per_sec
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    async def stream(self, text):
+        await asyncio.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)))
+        if self._random.random() < self.failure_rate:
+            raise ConnectionError("simulated websocket failure")
+        chunks = [c async for c in super().stream(text)]
+        audio = [c for c in chunks if c["type"] == "audio"]
+        per_chunk = len(text) / self.chars_per_sec / max(1, len(audio))
+        for chunk in chunks:
+            if chunk["type"] == "audio":
+                await asyncio.sleep(per_chunk)
+            yield chunk
+
+
+def load_corpus(lessons=(4, 5, 6, 7)):
+    """Slide texts the generator scripts use: {lesson: {slide: text}}."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory(prefix="tts-bench-corpus-") as store_dir:
+        with CorpusIndex.open(root, store_dir) as corpus:
+            return {lesson: corpus.lesson_texts(lesson) for lesson in lessons if lesson in corpus.lessons()}
+
+
+def build_jobs(corpus, out_dir):
+    return [SynthesisJob(lesson, slide, text, os.path.join(out_dir, f"lesson{lesson}", f"slide{slide}.mp3"))
+            for lesson, slides in sorted(corpus.items()) for slide, text in slides.items()]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    low, high = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+async def _serial(jobs, engine):
+    """The pre-scheduler loop: one slide at a time, abort on the first error."""
+    from .streaming import stream_to_file
+    latencies, chars = [], 0
+    for done, job in enumerate(jobs):
+        os.makedirs(os.path.dirname(job.output_path), exist_ok=True)
+        started = time.perf_counter()
+        try:
+            await stream_to_file(engine.stream(job.text), job.output_path)
+        except ConnectionError:
+            return latencies, chars, len(jobs) - done
+        latencies.append(time.perf_counter() - started)
+        chars += len(job.text)
+    return latencies, chars, 0
+
+
+async def _pipeline(jobs, engine, mode, concurrency, work_dir):
+    from .runner import add_run_arguments, generate
+    parser = argparse.ArgumentParser()
+    add_run_arguments(parser, engine="local")
+    args = parser.parse_args([
+        "--concurrency", str(concurrency),
+        "--cache-dir", os.path.join(work_dir, "cache"),
+        "--journal", os.path.join(work_dir, "journal.jsonl"),
+        "--backoff", "0.05",
+        "--rate-profile", "local",
+        "--no-metrics",
+    ] + (["--max-chunk-chars", "0"] if mode == "scheduler" else [])
+      + (["--sentence-cache"] if mode == "sentences" else []))
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, results, _ = await generate(jobs, engine, args, "bench")
+    ok = [r for r in results if r.ok]
+    return [r.elapsed for r in ok], sum(len(r.job.text) for r in ok), len(results) - len(ok)
+
+
+def run_case(mode, concurrency, sim):
+    """Run one benchmark case in the current process and return its metrics."""
+    corpus = load_corpus()
+    with tempfile.TemporaryDirectory(prefix="tts-bench-") as work_dir:
+        jobs = build_jobs(corpus, os.path.join(work_dir, "audio"))
+        engine = SimulatedEngine(**sim)
+        started = time.perf_counter()
+        if mode == "serial":
+            latencies, chars, failures = asyncio.run(_serial(jobs, engine))
+        else:
+            latencies, chars, failures = asyncio.run(_pipeline(jobs, engine, mode, concurrency, work_dir))
+        wall = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "concurrency": 1 if mode == "serial" else concurrency,
+        "slides": len(jobs),
+        "chars": chars,
+        "failures": failures,
+        "wallSec": round(wall, 3),
+        "slidesPerSec": round(len(latencies) / wall, 3),
+        "charsPerSec": round(chars / wall, 1),
+        "p50Sec": round(percentile(latencies, 50), 3),
+        "p95Sec": round(percentile(latencies, 95), 3),
+        "p99Sec": round(percentile(latencies, 99), 3),
+        "peakRssKb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run(modes, levels, sim):
+    cases = []
+    context = multiprocessing.get_context("spawn")
+    for mode in modes:
+        for concurrency in ([1] if mode == "serial" else levels):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                case = pool.submit(run_case, mode, concurrency, sim).result()
+            print(f"  {mode:<10} c={case['concurrency']:<3} {case['slidesPerSec']:7.2f} slides/s "
+                  f"{case['charsPerSec']:9.0f} chars/s  p50 {case['p50Sec']:.2f}s  p95 {case['p95Sec']:.2f}s  "
+                  f"p99 {case['p99Sec']:.2f}s  rss {case['peakRssKb'] / 1024:.0f} MB  failed {case['failures']}")
+            cases.append(case)
+    return cases
+
+
+def compare(baseline, current, tolerance):
+    """Regressions of `current` against `baseline`: throughput drops or p95 rises beyond `tolerance`."""
+    index = {(c["mode"], c["concurrency"]): c for c in baseline["cases"]}
+    regressions = []
+    for case in current["cases"]:
+        base = index.get((case["mode"], case["concurrency"]))
+        if base is None:
+            continue
+        label = f"{case['mode']} c={case['concurrency']}"
+        if case["slidesPerSec"] < base["slidesPerSec"] * (1 - tolerance):
+            regressions.append(f"{label}: {base['slidesPerSec']} -> {case['slidesPerSec']} slides/s")
+        if case["p95Sec"] > base["p95Sec"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {base['p95Sec']}s -> {case['p95Sec']}s")
+        if case["failures"] > base["failures"]:
+            regressions.append(f"{label}: failures {base['failures']} -> {case['failures']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m audio_pipeline.bench", description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="run the benchmark and write a JSON baseline")
+    run_parser.add_argument("--out", default="bench/baseline.json")
+    run_parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    run_parser.add_argument("--latency", type=float, default=0.4, help="seconds to first byte")
+    run_parser.add_argument("--jitter", type=float, default=0.2)
+    run_parser.add_argument("--chars-per-sec", type=float, default=1500.0, help="streaming speed after first byte")
+    run_parser.add_argument("--failure-rate", type=float, default=0.0)
+    run_parser.add_argument("--seed", type=int, default=1)
+
+    compare_parser = sub.add_parser("compare", help="check a run against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative change")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.tolerance)
+        for line in regressions:
+            print(f"✗ {line}")
+        if not regressions:
+            print("✓ No regressions")
+        return 1 if regressions else 0
+
+    if args.failure_rate and "serial" in args.modes:
+        print("note: the serial loop aborts on the first failure, as the original script did")
+    sim = {"latency": args.latency, "jitter": args.jitter, "chars_per_sec": args.chars_per_sec,
+           "failure_rate": args.failure_rate, "seed": args.seed}
+    print(f"Benchmarking against simulated TTS: {sim}")
+    cases = run(args.modes, args.concurrency, sim)
+    report = {
+        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "simulation": sim,
+        "cases": cases,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""
+Background-music mixing for lesson audio (lessonN -> lessonN_with_bg).
+
+Replaces the per-slide ffprobe + ffmpeg filter graph of
+scripts/add-bg-music-lesson1.sh for any lesson. The music bed is decoded and
+resampled once into shared memory; a process pool then mixes the slides in
+parallel, each worker reading the bed in place. Per slide, ffmpeg is only used
+as a codec (MP3 -> float PCM on a pipe, PCM -> libmp3lame on a pipe); volume,
+bed looping, fades, the mix gain and the peak limiter are vectorized NumPy.
+
+The defaults reproduce the shell script: voice 1.0, bed 0.35 starting 20 s
+into the music and looping, 0.25 s / 0.35 s fades on the bed when the slide
+is long enough, mix gain 1.15, limiter at 0.97, libmp3lame -q:a 2.
+
+    python3 -m audio_pipeline.bgmix --lesson 1 --music "/path/to/music.mp3"
+
+Needs NumPy and ffmpeg; the rest of the pipeline does not. mix.json in the
+output directory records what each output was made from, so unchanged
+slides are skipped on the next run.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from multiprocessing import shared_memory
+
+from .fsutil import atomic_write_bytes, file_sha256
+
+STATE_NAME = "mix.json"
+
+_bed = None  # (shared memory, ndarray) attached in each worker
+
+
+@dataclass
+class MixSettings:
+    voice_volume: float = 1.0
+    bg_volume: float = 0.35
+    mix_gain: float = 1.15
+    music_offset: float = 20.0  # seconds into the music where every slide's bed starts
+    fade_in: float = 0.25
+    fade_out: float = 0.35
+    limit: float = 0.97
+    sample_rate: int = 44100
+    channels: int = 2
+    quality: int = 2  # libmp3lame VBR quality (-q:a)
+
+
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("background mixing needs NumPy (pip install numpy)")
+    return numpy
+
+
+def _ffmpeg():
+    path = shutil.which("ffmpeg")
+    if path is None:
+        raise RuntimeError("ffmpeg not found in PATH")
+    return path
+
+
+def decode(path, sample_rate, channels):
+    """Decode any audio file to float32 PCM of shape (samples, channels)."""
+    np = load_numpy()
+    pcm = subprocess.run([_ffmpeg(), "-v", "error", "-i", path, "-f", "f32le", "-ac", str(channels),
+                          "-ar", str(sample_rate), "-"], check=True, capture_output=True).stdout
+    return np.frombuffer(pcm, dtype=np.float32).reshape(-1, channels)
+
+
+def encode_mp3(pcm, sample_rate, quality=2, bitrate=None):
+    """libmp3lame at VBR `quality`, or at a constant `bitrate` (bits/s) when given."""
+    np = load_numpy()
+    rate = ["-b:a", str(bitrate)] if bitrate else ["-q:a", str(quality)]
+    return subprocess.run([_ffmpeg(), "-v", "error", "-f", "f32le", "-ac", str(pcm.shape[1]),
+                           "-ar", str(sample_rate), "-i", "-", "-c:a", "libmp3lame"] + rate + ["-f", "mp3", "-"],
+                          input=np.ascontiguousarray(pcm, dtype=np.float32).tobytes(),
+                          check=True, capture_output=True).stdout
+
+
+def bed_segment(bed, start, length):
+    """`length` samples of the looping bed, beginning at sample `start`."""
+    np = load_numpy()
+    return bed[(start + np.arange(length)) % len(bed)]
+
+
+def fade_envelope(length, sample_rate, fade_in, fade_out):
+    """Linear fade-in/out gain curve, or None when the slide is too short (as in the shell script)."""
+    np = load_numpy()
+    if length / sample_rate <= fade_in + fade_out + 0.4:
+        return None
+    envelope = np.ones(length, dtype=np.float32)
+    n_in, n_out = int(fade_in * sample_rate), int(fade_out * sample_rate)
+    if n_in:
+        envelope[:n_in] = np.linspace(0.0, 1.0, n_in, endpoint=False, dtype=np.float32)
+    if n_out:
+        envelope[-n_out:] = np.linspace(1.0, 0.0, n_out, dtype=np.float32)
+    return envelope
+
+
+def limit_peaks(pcm, limit, sample_rate, block_ms=10):
+    """
+    Look-ahead peak limiter. Gain is computed per 10 ms block, each block takes
+    the lowest gain of itself and its neighbours, and the curve is interpolated
+    per sample, so no sample exceeds `limit` and gain changes stay smooth.
+    Returns (pcm, max_reduction_db).
+    """
+    np = load_numpy()
+    block = max(1, sample_rate * block_ms // 1000)
+    blocks = -(-len(pcm) // block)
+    peaks = np.zeros(blocks * block, dtype=np.float32)
+    peaks[:len(pcm)] = np.abs(pcm).max(axis=1)
+    peaks = peaks.reshape(blocks, block).max(axis=1)
+    gain = np.minimum(1.0, limit / np.maximum(peaks, 1e-9))
+    if gain.min() >= 1.0:
+        return pcm, 0.0
+    padded = np.concatenate(([1.0], gain, [1.0]))
+    gain = np.minimum(np.minimum(padded[:-2], padded[1:-1]), padded[2:])
+    centers = np.arange(blocks) * block + block / 2
+    curve = np.interp(np.arange(len(pcm)), centers, gain).astype(np.float32)
+    limited = np.clip(pcm * curve[:, None], -limit, limit)
+    return limited, float(-20 * np.log10(gain.min()))
+
+
+def mix(voice, bed, settings):
+    """Voice over the looping bed, gained and limited. Returns (pcm, max_reduction_db)."""
+    s = settings
+    background = bed_segment(bed, int(s.music_offset * s.sample_rate), len(voice)) * s.bg_volume
+    envelope = fade_envelope(len(voice), s.sample_rate, s.fade_in, s.fade_out)
+    if envelope is not None:
+        background *= envelope[:, None]
+    mixed = (voice * s.voice_volume + background) * s.mix_gain
+    return limit_peaks(mixed, s.limit, s.sample_rate)
+
+
+def _attach_bed(name, shape):
+    global _bed
+    np = load_numpy()
+    shm = shared_memory.SharedMemory(name=name)
+    _bed = (shm, np.ndarray(shape, dtype=np.float32, buffer=shm.buf))
+
+
+def _mix_slide(source, dest, settings):
+    started = time.perf_counter()
+    voice = decode(source, settings.sample_rate, settings.channels)
+    pcm, reduction = mix(voice, _bed[1], settings)
+    atomic_write_bytes(dest, encode_mp3(pcm, settings.sample_rate, settings.quality))
+    return len(voice) / settings.sample_rate, reduction, time.perf_counter() - started
+
+
+def _slide_number(path):
+    match = re.search(r"(\d+)", os.path.basename(path))
+    return int(match.group(1)) if match else 0
+
+
+def find_slides(source_dir):
+    names = [n for n in os.listdir(source_dir) if n.startswith("slide") and n.endswith(".mp3")]
+    return sorted(names, key=_slide_number)
+
+
+def _load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def mix_lesson(source_dir, output_dir, music, settings=None, workers=None, force=False):
+    """
+    Mix every slide*.mp3 of `source_dir` over `music` into `output_dir`.
+    Returns (mixed, skipped, failed) lists of file names.
+    """
+    np = load_numpy()
+    settings = settings or MixSettings()
+    names = find_slides(source_dir)
+    if not names:
+        raise RuntimeError(f"no slide*.mp3 found in {source_dir}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    previous = _load_state(output_dir)
+    recipe = {"settings": asdict(settings), "music": file_sha256(music)}
+    state = dict(recipe, slides={})
+    same_recipe = not force and all(previous.get(k) == v for k, v in recipe.items())
+    todo, skipped = [], []
+    for name in names:
+        source_hash = file_sha256(os.path.join(source_dir, name))
+        state["slides"][name] = source_hash
+        if (same_recipe and previous.get("slides", {}).get(name) == source_hash
+                and os.path.exists(os.path.join(output_dir, name))):
+            skipped.append(name)
+        else:
+            todo.append(name)
+    print(f"   {len(skipped)} unchanged, mixing {len(todo)} of {len(names)} slides")
+
+    mixed, failed = [], []
+    if todo:
+        started = time.perf_counter()
+        bed = decode(music, settings.sample_rate, settings.channels)
+        if not len(bed):
+            raise RuntimeError(f"no audio decoded from {music}")
+        print(f"   Music bed decoded once: {len(bed) / settings.sample_rate:.1f}s "
+              f"({bed.nbytes / 1e6:.0f} MB PCM) in {time.perf_counter() - started:.1f}s")
+        shape = bed.shape
+        shm = shared_memory.SharedMemory(create=True, size=bed.nbytes)
+        try:
+            np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[:] = bed
+            del bed
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_attach_bed,
+                                     initargs=(shm.name, shape)) as pool:
+                futures = {name: pool.submit(_mix_slide, os.path.join(source_dir, name),
+                                             os.path.join(output_dir, name), settings) for name in todo}
+                for name, future in futures.items():
+                    try:
+                        seconds, reduction, elapsed = future.result()
+                    except Exception as exc:
+                        failed.append(name)
+                        del state["slides"][name]
+                        print(f"    ✗ {name}: {type(exc).__name__}: {exc}")
+                        continue
+                    mixed.append(name)
+                    limiter = f", limiter -{reduction:.1f} dB" if reduction else ""
+                    print(f"    ✓ {name} ({seconds:.1f}s audio in {elapsed:.1f}s{limiter})")
+        finally:
+            shm.close()
+            shm.unlink()
+
+    payload = json.dumps(state, indent=2) + "\n"
+    atomic_write_bytes(os.path.join(output_dir, STATE_NAME), payload.encode("utf-8"))
+    return mixed, skipped, failed
+
+
+def add_bgmix_arguments(parser):
+    parser.add_argument("--bg-music", help="after generating, mix each lesson over this music into lessonN_with_bg")
+    parser.add_argument("--bg-workers", type=int, help="mixing processes (default: CPU count)")
+
+
+def mix_lessons(lesson_dirs, music, workers=None):
+    """Mix each lessonN directory into lessonN_with_bg beside it. Returns True if nothing failed."""
+    ok = True
+    for lesson_dir in lesson_dirs:
+        output_dir = os.path.normpath(lesson_dir) + "_with_bg"
+        print(f"\n🎵 Mixing {lesson_dir} over {os.path.basename(music)} -> {output_dir}")
+        try:
+            _, _, failed = mix_lesson(lesson_dir, output_dir, music, workers=workers)
+        except (OSError, RuntimeError, subprocess.CalledProcessError) as exc:
+            print(f"   ✗ Background mix failed: {exc}")
+            return False
+        ok = ok and not failed
+    return ok
+
+
+def main(argv=None):
+    defaults = MixSettings()
+    parser = argparse.ArgumentParser(prog="python3 -m audio_pipeline.bgmix", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--music", required=True, help="background music file (any format ffmpeg reads)")
+    parser.add_argument("--lesson", type=int, help="mix public/audio/lessonN into public/audio/lessonN_with_bg")
+    parser.add_argument("--source-dir", help="directory with slide*.mp3 (instead of --lesson)")
+    parser.add_argument("--output-dir", help="where mixed slides go (default: <source-dir>_with_bg)")
+    parser.add_argument("--workers", type=int, help="mixing processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="remix slides mix.json says are up to date")
+    for field, value in asdict(defaults).items():
+        parser.add_argument("--" + field.replace("_", "-"), type=type(value), default=value)
+    args = parser.parse_args(argv)
+
+    if args.source_dir is None and args.lesson is None:
+        parser.error("give --lesson N or --source-dir")
+    source_dir = args.source_dir or f"public/audio/lesson{args.lesson}"
+    output_dir = args.output_dir or source_dir.rstrip("/") + "_with_bg"
+    for path, kind in ((source_dir, "source dir"), (args.music, "background music file")):
+        if not os.path.exists(path):
+            print(f"Error: {kind} not found: {path}")
+            return 1
+    settings = MixSettings(**{field: getattr(args, field) for field in asdict(defaults)})
+
+    print(f"Source dir : {source_dir}")
+    print(f"Output dir : {output_dir}")
+    print(f"Music file : {args.music}")
+    started = time.perf_counter()
+    try:
+        mixed, skipped, failed = mix_lesson(source_dir, output_dir, args.music, settings, args.workers, args.force)
+    except (RuntimeError, subprocess.CalledProcessError) as exc:
+        print(f"Error: {exc}")
+        return 1
+    print(f"\n   {len(mixed)} mixed, {len(skipped)} unchanged, {len(failed)} failed "
+          f"in {time.perf_counter() - started:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
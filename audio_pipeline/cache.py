@@ -0,0 +1,186 @@
+"""
+Content-addressed on-disk cache for synthesized audio.
+
+Entries are keyed by sha256(normalized text, engine, voice, rate) and stored as
+<root>/<k[:2]>/<k>.mp3 with a <k>.json metadata file beside it (other kinds of
+files can pass their own suffix). Both are published with write-then-rename,
+so a killed run never leaves a torn entry. Reading an entry bumps its mtime;
+when the cache grows past `max_bytes` the least recently used entries are
+evicted first. Only the <k[:2]> shard directories count, so another cache can
+live in a subdirectory of the root with its own budget.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+
+from .fsutil import atomic_copy, atomic_write_bytes, file_sha256, same_file
+from .streaming import StreamStats, stream_to_file
+from .telemetry import add_bytes, span
+
+CACHE_VERSION = 1
+_SHARD = re.compile(r"[0-9a-f]{2}")
+DEFAULT_CACHE_DIR = ".tts-cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TTSCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # running total, so put() does not rescan the tree every time
+
+    @staticmethod
+    def key(text, engine, voice, rate):
+        payload = json.dumps([CACHE_VERSION, normalize_text(text), engine, voice, rate],
+                             ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _paths(self, key, suffix=".mp3"):
+        directory = os.path.join(self.root, key[:2])
+        return os.path.join(directory, f"{key}{suffix}"), os.path.join(directory, f"{key}.json")
+
+    def get(self, key):
+        audio_path, _ = self._paths(key)
+        try:
+            with open(audio_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(audio_path)
+        self.hits += 1
+        return data
+
+    def get_path(self, key, suffix=".mp3"):
+        """Path of the cached file for `key` (marked as recently used), or None."""
+        audio_path, _ = self._paths(key, suffix)
+        try:
+            os.utime(audio_path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return audio_path
+
+    def metadata(self, key):
+        _, meta_path = self._paths(key)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key, data, meta=None):
+        audio_path, meta_path = self._paths(key)
+        self._write_meta(meta_path, key, len(data), hashlib.sha256(data).hexdigest(), meta)
+        atomic_write_bytes(audio_path, data)
+        self._added(len(data))
+
+    def put_file(self, key, path, meta=None, suffix=".mp3"):
+        """Like put(), but copies an already written file without loading it into memory."""
+        audio_path, meta_path = self._paths(key, suffix)
+        size = os.path.getsize(path)
+        self._write_meta(meta_path, key, size, file_sha256(path), meta)
+        atomic_copy(path, audio_path)
+        self._added(size)
+
+    def _write_meta(self, meta_path, key, size, sha256, meta):
+        # Metadata first, audio last: an entry only counts once its .mp3 exists.
+        entry = dict(meta or {})
+        entry.update(key=key, bytes=size, sha256=sha256,
+                     createdAt=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        atomic_write_bytes(meta_path, json.dumps(entry, ensure_ascii=False, indent=2).encode("utf-8"))
+
+    def _added(self, size):
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        try:
+            shards = [name for name in os.listdir(self.root) if _SHARD.fullmatch(name)]
+        except FileNotFoundError:
+            return
+        for shard in shards:
+            directory = os.path.join(self.root, shard)
+            for name in os.listdir(directory):
+                if not name.endswith(".json") and not name.startswith(".tmp-"):
+                    path = os.path.join(directory, name)
+                    st = os.stat(path)
+                    yield path, st.st_size, st.st_mtime
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = list(self.entries())
+        total = sum(size for _, size, _ in entries)
+        self._size = total
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= self.max_bytes:
+                break
+            for victim in (path, os.path.splitext(path)[0] + ".json"):
+                try:
+                    os.unlink(victim)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        self._size = total
+        return removed
+
+
+def cache_from_args(args):
+    """Build a TTSCache from the --cache-dir/--cache-max-mb/--no-cache flags (None if disabled)."""
+    if getattr(args, "no_cache", False):
+        return None
+    return TTSCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+
+
+def add_cache_arguments(parser):
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="content-addressed TTS cache")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / 1024 ** 2)
+    parser.add_argument("--no-cache", action="store_true", help="always call the TTS provider")
+
+
+async def stream_cached(cache, text, output_path, engine, voice, rate, stream):
+    """
+    Publish audio for `text` at `output_path`. On a cache miss `stream()` is
+    called for a fresh provider chunk stream, which is written straight to
+    disk; on a hit the cached MP3 is copied into place only if it differs.
+    Returns StreamStats with status "cached" or "synthesized".
+    """
+    key = TTSCache.key(text, engine, voice, rate) if cache else None
+    cached_path = cache.get_path(key) if cache else None
+    if cached_path is not None:
+        with span("cache_copy"):
+            if not same_file(cached_path, output_path):
+                atomic_copy(cached_path, output_path)
+        meta = cache.metadata(key) or {}
+        size = os.path.getsize(output_path)
+        add_bytes(size)
+        return StreamStats(status="cached", bytes=size, boundaries=meta.get("boundaries", []))
+    stats = await stream_to_file(stream(), output_path)
+    if cache:
+        with span("publish"):
+            cache.put_file(key, output_path, {"engine": engine, "voice": voice, "rate": rate,
+                                              "chars": len(normalize_text(text)),
+                                              "boundaries": stats.boundaries})
+    return stats
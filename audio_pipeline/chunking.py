@@ -0,0 +1,151 @@
+"""
+Sentence-level chunking for long slides.
+
+A long slide is split at paragraph, then sentence, boundaries into pieces of
+at most `max_chars`; the pieces are synthesized in parallel (each with its own
+retries) and joined at MPEG frame level with a configurable run of silent
+frames between them. Nothing is decoded or re-encoded. The result is exposed
+as an ordinary chunk stream, so it plugs into stream_to_file() and the cache
+unchanged: piece 1 is written as soon as it is ready while the rest are still
+rendering, and boundary offsets are shifted onto the joined timeline.
+"""
+
+import asyncio
+import re
+
+from . import mp3
+from .scheduler import RetryPolicy
+
+DEFAULT_MAX_CHARS = 600
+DEFAULT_GAP_MS = 350
+TICKS_PER_SECOND = 10_000_000  # Edge TTS boundary offsets are in 100 ns ticks
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])[\"'”’»)]*\s+")
+_CLAUSE_END = re.compile(r"(?<=[,;:—–])\s+")
+
+
+def _fit(unit, max_chars):
+    """Break one paragraph into sentences, then clauses, then words, only as far as needed."""
+    if len(unit) <= max_chars:
+        return [unit]
+    for pattern in (SENTENCE_END, _CLAUSE_END):
+        parts = [p.strip() for p in pattern.split(unit) if p.strip()]
+        if len(parts) > 1:
+            return [piece for part in parts for piece in _fit(part, max_chars)]
+    cut = unit.rfind(" ", 1, max_chars)
+    if cut <= 0:
+        cut = max_chars
+    return [unit[:cut].strip()] + _fit(unit[cut:].strip(), max_chars)
+
+
+def _units(text, max_chars):
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        for i, unit in enumerate(_fit(paragraph, max_chars) if paragraph else []):
+            yield unit, "\n\n" if i == 0 else " "
+
+
+def split_text(text, max_chars=DEFAULT_MAX_CHARS):
+    """Greedily pack paragraphs/sentences into pieces of at most `max_chars`."""
+    pieces, current = [], ""
+    for unit, separator in _units(text, max_chars):
+        if current and len(current) + len(separator) + len(unit) <= max_chars:
+            current += separator + unit
+        else:
+            if current:
+                pieces.append(current)
+            current = unit
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+async def render(piece, stream, semaphore, retry):
+    """Collect one piece's audio and boundaries, retrying just this piece on failure."""
+    for attempt in range(retry.retries + 1):
+        async with semaphore:
+            try:
+                audio, boundaries = bytearray(), []
+                async for chunk in stream(piece):
+                    if chunk["type"] == "audio":
+                        audio.extend(chunk["data"])
+                    elif chunk["type"] in ("WordBoundary", "SentenceBoundary"):
+                        boundaries.append(chunk)
+                if not audio:
+                    raise RuntimeError("TTS stream ended without audio")
+                return bytes(audio), boundaries
+            except Exception:
+                if attempt == retry.retries:
+                    raise
+        await asyncio.sleep(retry.delay(attempt))
+
+
+async def join_rendered(renders, gaps):
+    """
+    Join rendered pieces into one chunk stream. `renders` are awaitables that
+    resolve to (mp3_bytes, boundaries); `gaps[i]` is the silence in seconds
+    inserted before piece i + 1. Pieces are yielded in order as soon as each
+    is ready; whatever is still pending is cancelled if the stream is abandoned.
+    """
+    tasks = [asyncio.ensure_future(r) for r in renders]
+    try:
+        offset = 0.0
+        reference = None
+        for i, task in enumerate(tasks):
+            audio, boundaries = await task
+            frames = mp3.audio_frames(audio)
+            if not frames:
+                raise RuntimeError("TTS returned no MPEG frames")
+            if reference is None:
+                reference = (audio, frames[0])
+            else:
+                first = frames[0]
+                if (first.sample_rate, first.channels) != (reference[1].sample_rate, reference[1].channels):
+                    raise RuntimeError("pieces came back in different audio formats")
+                gap, gap_seconds = mp3.silence(reference[0], reference[1], gaps[i - 1])
+                yield {"type": "audio", "data": gap}
+                offset += gap_seconds
+            shift = round(offset * TICKS_PER_SECOND)
+            for boundary in boundaries:
+                yield dict(boundary, offset=boundary["offset"] + shift)
+            yield {"type": "audio", "data": b"".join(audio[f.offset:f.offset + f.length] for f in frames)}
+            offset += sum(f.duration for f in frames)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def chunked_stream(text, stream, max_chars=DEFAULT_MAX_CHARS, gap_ms=DEFAULT_GAP_MS,
+                         concurrency=4, retry=None):
+    """
+    Chunk stream for `text`: short texts pass straight through `stream(text)`,
+    long ones are split, rendered in parallel and joined with `gap_ms` of
+    silence. Pieces are yielded in order as soon as each is ready.
+    """
+    pieces = split_text(text, max_chars) if max_chars else [text]
+    if len(pieces) <= 1:
+        async for chunk in stream(text):
+            yield chunk
+        return
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    retry = retry or RetryPolicy(retries=2)
+    renders = [render(piece, stream, semaphore, retry) for piece in pieces]
+    async for chunk in join_rendered(renders, [gap_ms / 1000] * (len(pieces) - 1)):
+        yield chunk
+
+
+def cache_variant(engine, text, max_chars, gap_ms):
+    """Engine label for cache keys: split slides sound different from unsplit ones."""
+    if not max_chars or len(split_text(text, max_chars)) <= 1:
+        return engine
+    return f"{engine};chunks={max_chars};gap={gap_ms}"
+
+
+def add_chunking_arguments(parser):
+    parser.add_argument("--max-chunk-chars", type=int, default=DEFAULT_MAX_CHARS,
+                        help="split longer slides into pieces synthesized in parallel (0 = never split)")
+    parser.add_argument("--sentence-gap-ms", type=int, default=DEFAULT_GAP_MS,
+                        help="silence inserted between joined pieces")
+    parser.add_argument("--chunk-concurrency", type=int, default=4, help="parallel pieces per slide")
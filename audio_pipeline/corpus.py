@@ -0,0 +1,225 @@
+"""
+Lesson text corpus.
+
+Slide texts live in Markdown audio scripts, one file per lesson, instead of
+dict literals in the generator scripts:
+
+    content/lessons/lessonN.md         (preferred)
+    public/audio/lessonN/scripts.md    (next to the audio, as for lesson 4)
+
+    # Lesson N: Title - Audio Scripts
+
+    ## Slide 1 (slide1.mp3)
+    Text of slide 1...
+
+CorpusIndex compiles them into one store under .tts-corpus/: corpus.dat holds
+the UTF-8 slide texts back to back, corpus.idx.json maps lesson and slide to
+(offset, length, sha256) and remembers each source's (mtime, size). The store
+is rebuilt only when a source changed; texts are sliced lazily out of an mmap
+of corpus.dat, so selecting one slide touches only that slide's pages.
+Adding lesson 8 means adding content/lessons/lesson8.md.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+import re
+
+from .fsutil import atomic_write_bytes
+from .scheduler import SynthesisJob
+
+DEFAULT_STORE_DIR = ".tts-corpus"
+INDEX_VERSION = 1
+SOURCE_PATTERNS = ("content/lessons/lesson*.md", "public/audio/lesson*/scripts.md")
+
+_TITLE = re.compile(r"^#\s+(.*?)\s*$", re.M)
+_SLIDE = re.compile(r"^##\s+Slide\s+(\d+)\b.*$", re.M)
+_LESSON = re.compile(r"lesson(\d+)")
+
+
+def parse_scripts(text):
+    """(title, {slide: text}) from an audio scripts Markdown file."""
+    title = _TITLE.search(text)
+    title = title.group(1) if title else ""
+    parts = _SLIDE.split(text)
+    slides = {}
+    for i in range(1, len(parts), 2):
+        slides[int(parts[i])] = parts[i + 1].strip()
+    return title, slides
+
+
+def parse_slide_range(spec):
+    """'3-5,8' -> {3, 4, 5, 8}."""
+    slides = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        try:
+            first, last = int(first), int(last or first)
+        except ValueError:
+            raise ValueError(f"bad slide range {part!r} (expected e.g. 3 or 3-5)")
+        if first > last:
+            raise ValueError(f"bad slide range {part!r}")
+        slides.update(range(first, last + 1))
+    return slides
+
+
+def find_sources(root="."):
+    """{lesson: path}. content/lessons/ wins over a scripts.md for the same lesson."""
+    sources = {}
+    for pattern in reversed(SOURCE_PATTERNS):
+        for path in glob.glob(os.path.join(root, pattern)):
+            lesson = _LESSON.search(os.path.relpath(path, root))
+            if lesson:
+                sources[int(lesson.group(1))] = path
+    return sources
+
+
+def _fingerprint(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+class CorpusIndex:
+    """Read-only view of the compiled corpus. Use `CorpusIndex.open()`."""
+
+    def __init__(self, store_dir, index):
+        self.store_dir = store_dir
+        self._index = index
+        self._file = None
+        self._map = None
+
+    @classmethod
+    def open(cls, root=".", store_dir=None):
+        """Open the store for the sources under `root`, rebuilding it first if any source changed."""
+        store_dir = store_dir or os.path.join(root, DEFAULT_STORE_DIR)
+        sources = find_sources(root)
+        fingerprints = {str(lesson): [os.path.relpath(path, root)] + _fingerprint(path)
+                        for lesson, path in sources.items()}
+        index = cls._load_index(store_dir)
+        if index is None or index.get("sources") != fingerprints:
+            index = cls.build(sources, store_dir, fingerprints)
+        return cls(store_dir, index)
+
+    @staticmethod
+    def _load_index(store_dir):
+        try:
+            with open(os.path.join(store_dir, "corpus.idx.json"), encoding="utf-8") as f:
+                index = json.load(f)
+            data_bytes = os.path.getsize(os.path.join(store_dir, "corpus.dat"))
+        except (OSError, ValueError):
+            return None
+        if index.get("version") != INDEX_VERSION or index.get("dataBytes") != data_bytes:
+            return None
+        return index
+
+    @staticmethod
+    def build(sources, store_dir, fingerprints):
+        data = bytearray()
+        lessons = {}
+        for lesson, path in sorted(sources.items()):
+            with open(path, encoding="utf-8") as f:
+                title, slides = parse_scripts(f.read())
+            entries = {}
+            for slide, text in sorted(slides.items()):
+                encoded = text.encode("utf-8")
+                entries[str(slide)] = [len(data), len(encoded), hashlib.sha256(encoded).hexdigest()]
+                data.extend(encoded)
+            lessons[str(lesson)] = {"title": title, "source": fingerprints[str(lesson)][0], "slides": entries}
+        index = {"version": INDEX_VERSION, "dataBytes": len(data), "sources": fingerprints, "lessons": lessons}
+        # Data first, index last: a crash in between leaves an index whose
+        # dataBytes no longer matches, which forces a rebuild.
+        atomic_write_bytes(os.path.join(store_dir, "corpus.dat"), bytes(data))
+        atomic_write_bytes(os.path.join(store_dir, "corpus.idx.json"),
+                           json.dumps(index, ensure_ascii=False, indent=1).encode("utf-8"))
+        return index
+
+    def lessons(self):
+        return sorted(int(lesson) for lesson in self._index["lessons"])
+
+    def _lesson(self, lesson):
+        try:
+            return self._index["lessons"][str(lesson)]
+        except KeyError:
+            raise KeyError(f"no audio scripts for lesson {lesson} (add content/lessons/lesson{lesson}.md)")
+
+    def title(self, lesson):
+        return self._lesson(lesson)["title"]
+
+    def source(self, lesson):
+        return self._lesson(lesson)["source"]
+
+    def slides(self, lesson):
+        return sorted(int(slide) for slide in self._lesson(lesson)["slides"])
+
+    def text_hash(self, lesson, slide):
+        return self._lesson(lesson)["slides"][str(slide)][2]
+
+    def text(self, lesson, slide):
+        offset, length, _ = self._lesson(lesson)["slides"][str(slide)]
+        if not length:
+            return ""
+        if self._map is None:
+            self._file = open(os.path.join(self.store_dir, "corpus.dat"), "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length].decode("utf-8")
+
+    def lesson_texts(self, lesson):
+        return {slide: self.text(lesson, slide) for slide in self.slides(lesson)}
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def build_jobs(corpus, lessons, base_dir, slides=None):
+    """SynthesisJobs for `lessons`, limited to the `slides` set if given. Only those texts are read."""
+    jobs = []
+    for lesson in lessons:
+        output_dir = f"{base_dir}/lesson{lesson}"
+        os.makedirs(output_dir, exist_ok=True)
+        for slide in corpus.slides(lesson):
+            if slides is None or slide in slides:
+                jobs.append(SynthesisJob(lesson, slide, corpus.text(lesson, slide), f"{output_dir}/slide{slide}.mp3"))
+    return jobs
+
+
+def corpus_from_args(args, parser=None):
+    """Open the corpus in --corpus-dir; with `parser`, reject --lessons it has no scripts for."""
+    corpus = CorpusIndex.open(store_dir=args.corpus_dir)
+    unknown = sorted(set(getattr(args, "lessons", None) or ()) - set(corpus.lessons()))
+    if parser is not None and unknown:
+        parser.error(f"no audio scripts for lesson(s) {', '.join(map(str, unknown))} "
+                     f"(add content/lessons/lessonN.md)")
+    return corpus
+
+
+def _slide_range_arg(spec):
+    try:
+        return parse_slide_range(spec)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+
+
+def add_corpus_arguments(parser, lessons=None):
+    """--slides, plus --lessons/--lesson when the script covers more than one lesson."""
+    if lessons is not None:
+        parser.add_argument("--lessons", "--lesson", type=int, nargs="+", default=lessons,
+                            help=f"lessons to generate (default: {' '.join(map(str, lessons))})")
+    parser.add_argument("--slides", type=_slide_range_arg,
+                        help="only these slides, e.g. 3-5 or 1,4,7-9")
+    parser.add_argument("--corpus-dir", default=DEFAULT_STORE_DIR, help="where the compiled lesson corpus is kept")
@@ -0,0 +1,498 @@
+"""
+Sharded builds: many worker processes, one queue.
+
+A full rebuild is more than one process and one provider account get
+through in a reasonable window, so the (lesson, slide) jobs go into a SQLite
+queue in a work directory every worker can reach (one host, or several hosts
+sharing the checkout over NFS/SMB):
+
+    python3 -m audio_pipeline.distributed init --lessons 4 5 6 7 --engine edge
+    python3 -m audio_pipeline.distributed work --concurrency 6     # on every worker, as many as you like
+    python3 -m audio_pipeline.distributed status
+    python3 -m audio_pipeline.distributed merge                    # the last worker does this itself
+
+`init` plans against the lesson manifests and enqueues only what needs
+building, together with the build settings (engine, voice, rate, chunking),
+so every worker produces identical audio whatever its own defaults are.
+
+A worker claims one job at a time per slot under a lease. Its heartbeat
+extends its leases. A job whose lease ran out (the worker crashed, hung or
+lost the share) is reclaimed by whoever asks next, and a completion carrying
+a stale lease token is ignored. A failed attempt goes back to the queue with
+jittered backoff until it runs out of attempts. Outputs are published with
+write-then-rename through the TTS cache (runner.synthesize_job), so a killed
+worker leaves at most a .tmp- file, never a torn MP3.
+
+Workers never touch manifest.json. `merge` checks each finished slide's
+output against the hash its worker reported, records the slides in
+(lesson, slide) order, prunes, and saves the manifests and timing indexes.
+The result does not depend on which worker built what or in which order.
+
+The queue uses SQLite's rollback journal (WAL needs shared memory, which
+network filesystems don't provide) with short immediate transactions, and
+lease times are wall-clock, so hosts need synchronized clocks (NTP).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import add_cache_arguments, cache_from_args
+from .chunking import DEFAULT_GAP_MS, DEFAULT_MAX_CHARS
+from .corpus import DEFAULT_STORE_DIR, CorpusIndex, build_jobs
+from .engines import add_engine_arguments, engine_from_args, get_engine
+from .fsutil import file_sha256
+from .manifest import LessonManifest, plan_lessons
+from .ratelimit import add_ratelimit_arguments, limiter_for
+from .runner import slide_variant, synthesize_job
+from .scheduler import RetryPolicy, SynthesisJob
+from .timing import write_lesson_timing
+
+DEFAULT_WORK_DIR = ".tts-work"
+QUEUE_NAME = "queue.db"
+DEFAULT_LEASE = 90.0
+DEFAULT_HEARTBEAT = 15.0
+DEFAULT_MAX_ATTEMPTS = 4
+POLL_SECONDS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS build (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS jobs (
+    lesson INTEGER NOT NULL,
+    slide INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',      -- pending, leased, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    token TEXT,
+    lease_expires REAL,
+    error TEXT,
+    output_hash TEXT,
+    finished_at REAL,
+    PRIMARY KEY (lesson, slide)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    started REAL,
+    heartbeat REAL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    state TEXT
+);
+"""
+
+
+class WorkQueue:
+    """The shared job table. Every method is one short transaction."""
+
+    def __init__(self, work_dir=DEFAULT_WORK_DIR):
+        self.path = os.path.join(work_dir, QUEUE_NAME)
+        os.makedirs(work_dir, exist_ok=True)
+        # Workers call in from one dedicated thread (see Worker._db), so the connection may change threads.
+        self.db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=DELETE")
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.executescript(SCHEMA)
+
+    def _write(self):
+        """BEGIN IMMEDIATE: take the write lock up front, so two claimers can't both read a job as free."""
+        return _Transaction(self.db)
+
+    def close(self):
+        self.db.close()
+
+    # -- build -----------------------------------------------------------------
+
+    def settings(self):
+        row = self.db.execute("SELECT value FROM build WHERE key = 'settings'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def unfinished(self):
+        return self.db.execute("SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'leased')").fetchone()[0]
+
+    def reset(self, settings, jobs):
+        with self._write():
+            self.db.execute("DELETE FROM jobs")
+            self.db.execute("DELETE FROM workers")
+            self.db.execute("DELETE FROM build")
+            self.db.execute("INSERT INTO build VALUES ('settings', ?)", (json.dumps(settings),))
+            self.db.executemany(
+                "INSERT INTO jobs (lesson, slide, text, output_path, source_hash) VALUES (?, ?, ?, ?, ?)",
+                [(j.lesson, j.slide, j.text, j.output_path, j.meta["sourceHash"]) for j in jobs])
+
+    # -- workers ---------------------------------------------------------------
+
+    def register(self, worker_id):
+        now = time.time()
+        with self._write():
+            self.db.execute("INSERT OR REPLACE INTO workers (id, host, pid, started, heartbeat, state) "
+                            "VALUES (?, ?, ?, ?, ?, 'working')", (worker_id, socket.gethostname(), os.getpid(), now, now))
+
+    def heartbeat(self, worker_id, lease):
+        """Mark the worker alive and push its leases forward."""
+        now = time.time()
+        with self._write():
+            self.db.execute("UPDATE workers SET heartbeat = ? WHERE id = ?", (now, worker_id))
+            self.db.execute("UPDATE jobs SET lease_expires = ? WHERE state = 'leased' AND worker = ?",
+                            (now + lease, worker_id))
+
+    def retire(self, worker_id, state="exited"):
+        """Stop working: hand back whatever this worker still holds."""
+        with self._write():
+            self.db.execute("UPDATE jobs SET state = 'pending', worker = NULL, token = NULL, lease_expires = NULL "
+                            "WHERE state = 'leased' AND worker = ?", (worker_id,))
+            self.db.execute("UPDATE workers SET state = ?, heartbeat = ? WHERE id = ?", (state, time.time(), worker_id))
+
+    # -- jobs ------------------------------------------------------------------
+
+    def claim(self, worker_id, lease, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Lease the next runnable job (pending, or leased with an expired lease). Returns a row dict or None."""
+        now = time.time()
+        with self._write():
+            # A slide that keeps taking its worker down with it must not be handed out forever.
+            self.db.execute("UPDATE jobs SET state = 'failed', error = 'lease expired on every attempt', "
+                            "worker = NULL, token = NULL, lease_expires = NULL "
+                            "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, max_attempts))
+            row = self.db.execute(
+                "SELECT lesson, slide, text, output_path, source_hash, attempts, state FROM jobs "
+                "WHERE (state = 'pending' AND not_before <= ?) OR (state = 'leased' AND lease_expires < ?) "
+                "ORDER BY lesson, slide LIMIT 1", (now, now)).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            self.db.execute("UPDATE jobs SET state = 'leased', worker = ?, token = ?, lease_expires = ?, "
+                            "attempts = attempts + 1 WHERE lesson = ? AND slide = ?",
+                            (worker_id, token, now + lease, row[0], row[1]))
+        keys = ("lesson", "slide", "text", "output_path", "source_hash", "attempts", "state")
+        return dict(zip(keys, row), token=token, reclaimed=row[6] == "leased")
+
+    def complete(self, claim, worker_id, output_hash):
+        """Record a finished job. False if the lease was lost in the meantime (the result is then ignored)."""
+        with self._write():
+            updated = self.db.execute(
+                "UPDATE jobs SET state = 'done', output_hash = ?, error = NULL, finished_at = ?, lease_expires = NULL "
+                "WHERE lesson = ? AND slide = ? AND token = ? AND state = 'leased'",
+                (output_hash, time.time(), claim["lesson"], claim["slide"], claim["token"])).rowcount
+            if updated:
+                self.db.execute("UPDATE workers SET done = done + 1 WHERE id = ?", (worker_id,))
+        return bool(updated)
+
+    def fail(self, claim, worker_id, error, retry, max_attempts):
+        """Put a failed attempt back with backoff, or mark it failed for good. Returns the new state."""
+        attempts = claim["attempts"] + 1
+        state = "failed" if attempts >= max_attempts else "pending"
+        with self._write():
+            updated = self.db.execute(
+                "UPDATE jobs SET state = ?, error = ?, not_before = ?, worker = NULL, token = NULL, "
+                "lease_expires = NULL WHERE lesson = ? AND slide = ? AND token = ?",
+                (state, error, time.time() + retry.delay(attempts - 1), claim["lesson"], claim["slide"],
+                 claim["token"])).rowcount
+            if updated and state == "failed":
+                self.db.execute("UPDATE workers SET failed = failed + 1 WHERE id = ?", (worker_id,))
+        return state if updated else None
+
+    def next_wakeup(self):
+        """Seconds until something may become claimable, or None if nothing is left to do."""
+        now = time.time()
+        row = self.db.execute(
+            "SELECT MIN(CASE state WHEN 'pending' THEN not_before ELSE lease_expires END) FROM jobs "
+            "WHERE state IN ('pending', 'leased')").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - now)
+
+    def counts(self):
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def finished_jobs(self):
+        return self.db.execute("SELECT lesson, slide, text, output_path, source_hash, output_hash, finished_at "
+                               "FROM jobs WHERE state = 'done' ORDER BY lesson, slide").fetchall()
+
+    def requeue(self, lesson, slide, error):
+        with self._write():
+            self.db.execute("UPDATE jobs SET state = 'pending', error = ?, output_hash = NULL, not_before = 0 "
+                            "WHERE lesson = ? AND slide = ?", (error, lesson, slide))
+
+    def workers(self):
+        return self.db.execute("SELECT id, host, pid, heartbeat, done, failed, state FROM workers "
+                               "ORDER BY started").fetchall()
+
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+# -- init ------------------------------------------------------------------------
+
+def init_build(args):
+    queue = WorkQueue(args.work_dir)
+    if queue.unfinished() and not args.reset:
+        print(f"❌ {queue.path} still has {queue.unfinished()} unfinished jobs; "
+              f"let the workers finish, or pass --reset to start over")
+        return 1
+    tts = engine_from_args(args)
+    with CorpusIndex.open(store_dir=args.corpus_dir) as corpus:
+        lessons = args.lessons or corpus.lessons()
+        unknown = sorted(set(lessons) - set(corpus.lessons()))
+        if unknown:
+            print(f"❌ No audio scripts for lesson(s) {', '.join(map(str, unknown))} (add content/lessons/lessonN.md)")
+            return 1
+        jobs = build_jobs(corpus, lessons, args.base_dir)
+        lesson_slides = {str(lesson): corpus.slides(lesson) for lesson in lessons}
+    _, todo, unchanged = plan_lessons(jobs, tts.name, tts.voice, tts.rate, args.force,
+                                      slide_variant(tts.name, args))
+    settings = {
+        "engine": tts.name, "voice": tts.voice, "rate": tts.rate,
+        "maxChunkChars": args.max_chunk_chars, "sentenceGapMs": args.sentence_gap_ms,
+        "baseDir": args.base_dir, "lessonSlides": lesson_slides, "prune": not args.no_prune,
+        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    queue.reset(settings, todo)
+    print(f"📋 {queue.path}: {len(todo)} jobs queued, {len(unchanged)} slides unchanged "
+          f"(lessons {', '.join(map(str, lessons))}, {tts})")
+    queue.close()
+    return 0
+
+
+# -- work ------------------------------------------------------------------------
+
+class Worker:
+    def __init__(self, queue, args):
+        self.queue = queue
+        self.args = args
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        settings = queue.settings()
+        if settings is None:
+            raise RuntimeError(f"no build in {queue.path}; run `init` first")
+        self.settings = settings
+        self.tts = get_engine(settings["engine"], settings["voice"], settings["rate"])
+        self.stream = self.tts.stream
+        self.limiter = None if args.no_rate_limit else limiter_for(self.tts.name, args.rate_profile)
+        if self.limiter is not None:
+            self.stream = self.limiter.wrap(self.stream)
+        self.cache = cache_from_args(args)
+        # What runner.synthesize_job reads: build-wide settings, plus this worker's own retry knobs.
+        self.job_args = Namespace(max_chunk_chars=settings["maxChunkChars"], sentence_gap_ms=settings["sentenceGapMs"],
+                                  chunk_concurrency=args.chunk_concurrency, retries=1, backoff=args.backoff)
+        self.retry = RetryPolicy(base_delay=args.backoff)
+        self.done = 0
+        self.failed = 0
+        self._db_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="queue")
+
+    async def _db(self, method, *args):
+        """Queue calls can wait on the SQLite lock; keep them off the event loop, one at a time."""
+        return await asyncio.get_running_loop().run_in_executor(self._db_thread, method, *args)
+
+    async def _heartbeat(self):
+        delay = self.args.heartbeat
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self._db(self.queue.heartbeat, self.id, self.args.lease)
+                delay = self.args.heartbeat
+            except sqlite3.OperationalError as exc:
+                # e.g. "database is locked" past the busy timeout; the leases
+                # still have until --lease runs out, so retry soon.
+                print(f"    ⚠ Worker {self.id}: heartbeat failed ({exc}); retrying")
+                delay = min(POLL_SECONDS, self.args.heartbeat)
+
+    async def _slot(self):
+        while True:
+            claim = await self._db(self.queue.claim, self.id, self.args.lease, self.args.max_attempts)
+            if claim is None:
+                wait = await self._db(self.queue.next_wakeup)
+                if wait is None:
+                    return
+                # Others' jobs may finish (or their leases lapse) any moment; poll, don't sleep the lease out.
+                await asyncio.sleep(min(max(wait, 0.1), POLL_SECONDS))
+                continue
+            job = SynthesisJob(claim["lesson"], claim["slide"], claim["text"], claim["output_path"])
+            note = " (reclaimed)" if claim["reclaimed"] else ""
+            started = time.perf_counter()
+            try:
+                stats = await asyncio.wait_for(
+                    synthesize_job(job, self.stream, self.cache, self.tts.name, self.tts.voice, self.tts.rate,
+                                   self.job_args), self.args.timeout)
+            except Exception as exc:
+                error = f"timed out after {self.args.timeout:.0f}s" if isinstance(exc, asyncio.TimeoutError) \
+                    else f"{type(exc).__name__}: {exc}"
+                state = await self._db(self.queue.fail, claim, self.id, error, self.retry, self.args.max_attempts)
+                self.failed += state == "failed"
+                mark = "✗" if state == "failed" else "↻"
+                print(f"    {mark} {job.label}{note}: {error} (attempt {claim['attempts'] + 1}, now {state or 'lost'})")
+                continue
+            output_hash = file_sha256(job.output_path)
+            if await self._db(self.queue.complete, claim, self.id, output_hash):
+                self.done += 1
+                print(f"    ✓ {job.label}{note} ({time.perf_counter() - started:.1f}s, {stats})")
+            else:
+                print(f"    ⚠ {job.label}: lease was lost while building; another worker owns it now")
+
+    async def run(self):
+        await self._db(self.queue.register, self.id)
+        print(f"👷 Worker {self.id} on {self.queue.path}: {self.tts}, {self.args.concurrency} slots")
+        heartbeat = asyncio.ensure_future(self._heartbeat())
+        slots = asyncio.ensure_future(asyncio.gather(*(self._slot() for _ in range(max(1, self.args.concurrency)))))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait([slots, heartbeat], return_when=asyncio.FIRST_COMPLETED)
+            if not slots.done():
+                # Without a heartbeat our leases lapse and other workers rebuild
+                # these jobs, so stop rather than race them.
+                slots.cancel()
+                await asyncio.gather(slots, return_exceptions=True)
+                heartbeat.result()
+            await slots
+        finally:
+            for task in (slots, heartbeat):
+                task.cancel()
+            await asyncio.gather(slots, heartbeat, return_exceptions=True)
+            await self._db(self.queue.retire, self.id)
+            self._db_thread.shutdown()
+        elapsed = time.perf_counter() - started
+        print(f"   Worker {self.id}: {self.done} built, {self.failed} failed in {elapsed:.1f}s")
+        if self.limiter is not None:
+            print(f"   Rate limiter settled at {self.limiter}")
+
+
+# -- merge -----------------------------------------------------------------------
+
+def merge_build(queue):
+    """
+    Fold finished jobs into the lesson manifests in (lesson, slide) order,
+    prune and save. Returns the number of slides that had to be requeued
+    (output missing, or not what its worker reported).
+    """
+    settings = queue.settings()
+    engine, voice, rate = settings["engine"], settings["voice"], settings["rate"]
+    manifests = {int(lesson): LessonManifest.load(os.path.join(settings["baseDir"], f"lesson{lesson}"), int(lesson))
+                 for lesson in settings["lessonSlides"]}
+    requeued = 0
+    for lesson, slide, text, output_path, source_hash, output_hash, finished_at in queue.finished_jobs():
+        try:
+            actual = file_sha256(output_path)
+        except OSError:
+            actual = None
+        if actual != output_hash:
+            queue.requeue(lesson, slide, "output changed or vanished after it was built")
+            print(f"   ↻ lesson{lesson}/slide{slide}.mp3: output doesn't match what its worker reported; requeued")
+            requeued += 1
+            continue
+        job = SynthesisJob(lesson, slide, text, output_path, {"sourceHash": source_hash})
+        manifests[lesson].record(job, engine, voice, rate)
+        manifests[lesson].slides[slide]["generatedAt"] = time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                                                                       time.gmtime(finished_at))
+    for lesson, manifest in sorted(manifests.items()):
+        if settings["prune"]:
+            for path in manifest.prune(settings["lessonSlides"][str(lesson)]):
+                print(f"   🗑  Pruned {path}")
+        manifest.save()
+        write_lesson_timing(manifest)
+        print(f"   📝 {manifest.path}: {len(manifest.slides)} slides")
+    if requeued:
+        print(f"   {requeued} slide(s) requeued; start a worker to rebuild them")
+    return requeued
+
+
+def print_status(queue):
+    counts = queue.counts()
+    total = sum(counts.values())
+    print(f"📋 {queue.path}: {total} jobs — " + ", ".join(f"{counts.get(s, 0)} {s}"
+                                                          for s in ("pending", "leased", "done", "failed")))
+    now = time.time()
+    for worker_id, host, pid, heartbeat, done, failed, state in queue.workers():
+        print(f"   {worker_id}: {state}, {done} built, {failed} failed, heartbeat {now - heartbeat:.0f}s ago")
+    for lesson, slide, error in queue.db.execute(
+            "SELECT lesson, slide, error FROM jobs WHERE state = 'failed' ORDER BY lesson, slide"):
+        print(f"   ✗ lesson{lesson}/slide{slide}.mp3: {error}")
+
+
+def _work(args):
+    queue = WorkQueue(args.work_dir)
+    try:
+        worker = Worker(queue, args)
+    except RuntimeError as exc:
+        print(f"❌ {exc}")
+        return 1
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        print("   Interrupted; leases handed back")
+        return 130
+    counts = queue.counts()
+    if args.merge and not counts.get("pending") and not counts.get("leased"):
+        print("   Queue drained, merging manifests")
+        merge_build(queue)
+    queue.close()
+    return 1 if counts.get("failed") else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m audio_pipeline.distributed", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="shared directory holding the queue")
+    parser.add_argument("--base-dir", default="public/audio")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init = commands.add_parser("init", help="plan a build and fill the queue")
+    init.add_argument("--lessons", "--lesson", type=int, nargs="+", help="default: every lesson in the corpus")
+    init.add_argument("--corpus-dir", default=DEFAULT_STORE_DIR)
+    init.add_argument("--force", action="store_true", help="queue every slide, not only the changed ones")
+    init.add_argument("--no-prune", action="store_true", help="keep slide files that were removed from the lesson")
+    init.add_argument("--reset", action="store_true", help="discard an unfinished build")
+    init.add_argument("--max-chunk-chars", type=int, default=DEFAULT_MAX_CHARS)
+    init.add_argument("--sentence-gap-ms", type=int, default=DEFAULT_GAP_MS)
+    add_engine_arguments(init, "edge")
+
+    work = commands.add_parser("work", help="claim and build jobs until the queue is drained")
+    work.add_argument("--concurrency", type=int, default=6, help="jobs in flight in this worker")
+    work.add_argument("--chunk-concurrency", type=int, default=4, help="parallel pieces per long slide")
+    work.add_argument("--timeout", type=float, default=120, help="seconds per slide attempt")
+    work.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    work.add_argument("--backoff", type=float, default=1.0, help="base backoff delay in seconds")
+    work.add_argument("--lease", type=float, default=DEFAULT_LEASE, help="seconds a claim stays valid without a heartbeat")
+    work.add_argument("--heartbeat", type=float, default=DEFAULT_HEARTBEAT, help="seconds between heartbeats")
+    work.add_argument("--no-merge", dest="merge", action="store_false", help="don't merge manifests when the queue drains")
+    add_cache_arguments(work)
+    add_ratelimit_arguments(work)
+
+    commands.add_parser("status", help="show queue and worker state")
+    commands.add_parser("merge", help="fold finished jobs into the lesson manifests")
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        return init_build(args)
+    if args.command == "work":
+        return _work(args)
+    queue = WorkQueue(args.work_dir)
+    if queue.settings() is None:
+        print(f"❌ no build in {queue.path}; run `init` first")
+        return 1
+    if args.command == "status":
+        print_status(queue)
+        return 0
+    return 1 if merge_build(queue) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Pluggable TTS engines.
+
+Every engine exposes the same two calls:
+
+    engine.stream(text)            -> async iterator of chunk dicts (see streaming.py)
+    await engine.synthesize(text)  -> MP3 bytes
+
+plus `name`, `voice` and `rate`, which together with the text form the cache
+and manifest keys. `word_boundaries` says whether the stream carries
+WordBoundary events (questions.py needs them to cut packed requests apart).
+Provider libraries are imported lazily, so a box without edge-tts or gTTS
+can still run the `local` engine.
+
+    edge   Microsoft Edge TTS (pip install edge-tts), native async streaming
+    gtts   Google Translate TTS (pip install gtts), run in a thread pool
+    local  deterministic offline stand-in: no network, no dependencies
+"""
+
+import asyncio
+import hashlib
+import io
+import math
+import struct
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from . import mp3
+from .chunking import TICKS_PER_SECOND
+
+_EXECUTOR = None
+
+
+def _executor():
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tts")
+    return _EXECUTOR
+
+
+class TTSEngine:
+    name = None
+    default_voice = None
+    default_rate = None
+    word_boundaries = False
+
+    def __init__(self, voice=None, rate=None):
+        self.voice = voice or self.default_voice
+        self.rate = rate or self.default_rate
+
+    def stream(self, text):
+        raise NotImplementedError
+
+    async def synthesize(self, text):
+        audio = bytearray()
+        async for chunk in self.stream(text):
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+        return bytes(audio)
+
+    def __str__(self):
+        return f"{self.name} ({self.voice}, {self.rate})"
+
+
+class EdgeEngine(TTSEngine):
+    name = "edge"
+    default_voice = "en-US-GuyNeural"
+    default_rate = "-5%"
+    word_boundaries = True
+
+    def __init__(self, voice=None, rate=None):
+        super().__init__(voice, rate)
+        import edge_tts
+        self._edge_tts = edge_tts
+
+    def stream(self, text):
+        try:
+            communicate = self._edge_tts.Communicate(text, self.voice, rate=self.rate, boundary="WordBoundary")
+        except TypeError:  # edge-tts < 7 has no `boundary` option and always sends WordBoundary
+            communicate = self._edge_tts.Communicate(text, self.voice, rate=self.rate)
+        return communicate.stream()
+
+
+class GTTSEngine(TTSEngine):
+    """gTTS is blocking; each network round trip runs on the shared thread pool."""
+    name = "gtts"
+    default_voice = "en"
+    default_rate = "normal"
+
+    def __init__(self, voice=None, rate=None):
+        super().__init__(voice, rate)
+        from gtts import gTTS
+        self._gtts = gTTS
+
+    async def stream(self, text):
+        loop = asyncio.get_running_loop()
+        tts = self._gtts(text=text, lang=self.voice, slow=self.rate == "slow")
+        parts = await loop.run_in_executor(_executor(), tts.stream)
+        done = object()
+        while True:
+            data = await loop.run_in_executor(_executor(), next, parts, done)
+            if data is done:
+                return
+            yield {"type": "audio", "data": data}
+
+
+class LocalEngine(TTSEngine):
+    """
+    Offline stand-in for CI and air-gapped build boxes. Output depends only on
+    the text and rate: each word gets a duration from its length, the MP3 is
+    that many seconds of silent frames (valid, decodable, frame-accurate), and
+    WordBoundary events are emitted exactly like Edge TTS does. `wav()` renders
+    the same timeline as audible tones for listening tests.
+    """
+    name = "local"
+    default_voice = "local-24k"
+    default_rate = "+0%"
+    word_boundaries = True
+    sample_rate = 24000
+    chunk_seconds = 0.5
+
+    def _speed(self):
+        try:
+            return 1 + float(str(self.rate).rstrip("%")) / 100
+        except ValueError:
+            return 1.0
+
+    def timeline(self, text):
+        """[(word, offset_seconds, duration_seconds)] and the total length."""
+        words, offset = [], 0.0
+        for word in text.split():
+            seconds = (0.12 + 0.055 * len(word)) / self._speed()
+            words.append((word, offset, seconds))
+            offset += seconds + (0.25 if word[-1] in ".!?" else 0.05) / self._speed()
+        return words, offset
+
+    async def stream(self, text):
+        words, total = self.timeline(text)
+        for word, offset, seconds in words:
+            yield {"type": "WordBoundary", "offset": round(offset * TICKS_PER_SECOND),
+                   "duration": round(seconds * TICKS_PER_SECOND), "text": word}
+        audio = mp3.silent_stream(max(total, 0.1), self.sample_rate)
+        step = len(mp3.silent_stream(self.chunk_seconds, self.sample_rate))
+        for i in range(0, len(audio), step):
+            await asyncio.sleep(0)
+            yield {"type": "audio", "data": audio[i:i + step]}
+
+    def wav(self, text):
+        """16-bit mono WAV: one short tone per word, pitch derived from the word."""
+        words, total = self.timeline(text)
+        samples = bytearray(2 * int(total * self.sample_rate + 1))
+        for word, offset, seconds in words:
+            pitch = 180 + int(hashlib.md5(word.lower().encode("utf-8")).hexdigest()[:2], 16)
+            start = int(offset * self.sample_rate)
+            for n in range(int(seconds * self.sample_rate)):
+                value = int(6000 * math.sin(2 * math.pi * pitch * n / self.sample_rate))
+                struct.pack_into("<h", samples, 2 * (start + n), value)
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(self.sample_rate)
+            out.writeframes(bytes(samples))
+        return buffer.getvalue()
+
+
+ENGINES = {engine.name: engine for engine in (EdgeEngine, GTTSEngine, LocalEngine)}
+
+
+def get_engine(name, voice=None, rate=None):
+    try:
+        engine_class = ENGINES[name]
+    except KeyError:
+        raise ValueError(f"unknown TTS engine {name!r} (choose from {', '.join(sorted(ENGINES))})")
+    return engine_class(voice, rate)
+
+
+def add_engine_arguments(parser, default):
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=default, help="TTS backend")
+    parser.add_argument("--voice", help="engine voice (default: the engine's own)")
+    parser.add_argument("--rate", help="speaking rate, e.g. -5%% for edge or slow for gtts")
+
+
+def engine_from_args(args):
+    return get_engine(args.engine, args.voice, args.rate)
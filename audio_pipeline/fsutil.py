@@ -0,0 +1,80 @@
+"""
+Small filesystem helpers shared by the cache and the generators.
+"""
+
+import filecmp
+import hashlib
+import os
+import shutil
+import tempfile
+
+# mkstemp() creates files as 0600 and os.replace() keeps that; published files
+# get the mode a plain open() would have given them instead. Read once, since
+# os.umask() can only be queried by setting it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def publish_mode(fd, path):
+    """
+    Give the temp file `fd` the mode of the file it replaces at `path`, or
+    0666 minus the umask. Read bits the umask allows are always added, which
+    also repairs outputs earlier versions left at 0600.
+    """
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.fchmod(fd, mode | (0o444 & ~_UMASK))
+
+
+def atomic_write_bytes(path, data):
+    """Write `data` to a temp file next to `path`, fsync it and rename it into place."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=os.path.splitext(path)[1], dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            publish_mode(f.fileno(), path)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def atomic_copy(src, dest):
+    """Stream-copy `src` to a temp file beside `dest`, fsync it and rename it into place."""
+    directory = os.path.dirname(dest) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=os.path.splitext(dest)[1], dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+            publish_mode(out.fileno(), dest)
+            shutil.copyfileobj(f, out, 1 << 20)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, dest)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def same_file(a, b):
+    """True if both files exist and hold identical bytes (compared in chunks)."""
+    try:
+        return filecmp.cmp(a, b, shallow=False)
+    except OSError:
+        return False
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,110 @@
+"""
+Persistent job journal for long TTS runs.
+
+Every completed slide is checkpointed as one fsync'd JSON line, so a run that
+dies halfway (a provider error, Ctrl-C, a closed laptop) can be continued with
+--resume instead of starting again from the first slide. Failed attempts and
+jobs that exhausted their retries (the dead-letter list) are journaled too;
+the dead letters are also written to <journal>.dead.json at the end of a run.
+"""
+
+import json
+import os
+import time
+
+from .fsutil import atomic_write_bytes
+
+DEFAULT_JOURNAL_DIR = ".tts-journal"
+
+
+def _job_key(job):
+    return f"{job.lesson}/{job.slide}"
+
+
+class JobJournal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.completed = {}
+        self.dead = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if resume:
+            self._replay()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        self._write({"event": "run", "resume": resume})
+
+    def _replay(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from a crash
+            if entry.get("event") == "done":
+                self.completed[entry["key"]] = entry
+                self.dead.pop(entry["key"], None)
+            elif entry.get("event") == "dead":
+                self.dead[entry["key"]] = entry
+
+    def _write(self, entry):
+        entry["at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def is_done(self, job):
+        """True if a previous run finished this job with the same source and the file is still there."""
+        entry = self.completed.get(_job_key(job))
+        return (entry is not None
+                and entry.get("sourceHash") == job.meta.get("sourceHash")
+                and os.path.exists(job.output_path))
+
+    def split(self, jobs):
+        """Split `jobs` into (pending, already_done)."""
+        pending, done = [], []
+        for job in jobs:
+            (done if self.is_done(job) else pending).append(job)
+        return pending, done
+
+    def record_result(self, result):
+        job = result.job
+        key = _job_key(job)
+        if result.ok:
+            entry = {"event": "done", "key": key, "sourceHash": job.meta.get("sourceHash"),
+                     "path": job.output_path, "attempts": result.attempts}
+            self.completed[key] = entry
+            self.dead.pop(key, None)
+        else:
+            entry = {"event": "dead", "key": key, "path": job.output_path,
+                     "attempts": result.attempts, "error": result.error}
+            self.dead[key] = entry
+        self._write(entry)
+
+    def record_retry(self, job, attempt, error, delay):
+        self._write({"event": "retry", "key": _job_key(job), "attempt": attempt,
+                     "error": error, "delay": round(delay, 2)})
+
+    def close(self):
+        self._write({"event": "end", "completed": len(self.completed), "dead": len(self.dead)})
+        self._file.close()
+        dead_path = self.path + ".dead.json"
+        if self.dead:
+            payload = json.dumps(sorted(self.dead.values(), key=lambda e: e["key"]), ensure_ascii=False, indent=2)
+            atomic_write_bytes(dead_path, payload.encode("utf-8"))
+        elif os.path.exists(dead_path):
+            os.unlink(dead_path)
+
+
+def default_journal_path(script_path):
+    name = os.path.splitext(os.path.basename(script_path))[0]
+    return os.path.join(DEFAULT_JOURNAL_DIR, f"{name}.jsonl")
+
+
+def add_journal_arguments(parser):
+    parser.add_argument("--resume", action="store_true", help="skip slides the last run already finished")
+    parser.add_argument("--journal", help="job journal path (default .tts-journal/<script>.jsonl)")
+    parser.add_argument("--retries", type=int, default=3, help="retries per slide before it is dead-lettered")
+    parser.add_argument("--backoff", type=float, default=1.0, help="base backoff delay in seconds")
@@ -0,0 +1,271 @@
+"""
+Encoding ladder: smaller renditions of every slide for slow connections.
+
+After synthesis each slideN.mp3 can be transcoded into a configurable ladder
+of formats, by default 32 and 64 kbps Opus (speech-tuned) plus a 64 kbps MP3
+fallback for players without Opus:
+
+    public/audio/lesson6/variants/slide3.opus-32.opus
+    public/audio/lesson6/variants/slide3.mp3-64.mp3
+    public/audio/lesson6/variants.json
+
+variants.json lists the formats (with MIME types for canPlayType()) and,
+per slide, every rendition's file and size, so the frontend can pick the
+smallest format the browser plays. The original slideN.mp3 stays the
+full-quality default.
+
+Transcodes run in a process pool (one ffmpeg per job). Outputs are keyed by
+the source file's content hash: a slide whose MP3 didn't change is skipped,
+and renditions are also kept in .tts-cache/renditions/ (under their own
+extension, with their own size limit, so they never evict synthesized speech),
+so a rebuilt lesson or another checkout reuses them without transcoding. No
+TTS is regenerated.
+
+    python3 -m audio_pipeline.ladder 5 6 7 [--ladder opus:32,opus:64,mp3:64]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from .cache import DEFAULT_CACHE_DIR, TTSCache
+from .fsutil import atomic_copy, atomic_write_bytes, file_sha256
+from .sprite import lesson_slide_files
+
+LADDER_VERSION = 1
+DEFAULT_LADDER = "opus:32,opus:64,mp3:64"
+VARIANTS_DIR = "variants"
+INDEX_NAME = "variants.json"
+RENDITIONS_CACHE = "renditions"
+DEFAULT_CACHE_MAX_MB = 1024
+
+CODECS = {
+    "opus": ("opus", 'audio/ogg; codecs="opus"', ["-c:a", "libopus", "-vbr", "on", "-application", "voip"]),
+    "aac": ("m4a", 'audio/mp4; codecs="mp4a.40.2"', ["-c:a", "aac", "-movflags", "+faststart"]),
+    "mp3": ("mp3", "audio/mpeg", ["-c:a", "libmp3lame"]),
+}
+
+
+@dataclass(frozen=True)
+class Rendition:
+    codec: str
+    kbps: int
+
+    @property
+    def id(self):
+        return f"{self.codec}-{self.kbps}"
+
+    @property
+    def extension(self):
+        return CODECS[self.codec][0]
+
+    @property
+    def mime(self):
+        return CODECS[self.codec][1]
+
+    def filename(self, slide_file):
+        return f"{os.path.splitext(slide_file)[0]}.{self.id}.{self.extension}"
+
+    def ffmpeg_args(self):
+        return CODECS[self.codec][2] + ["-b:a", f"{self.kbps}k"]
+
+
+def parse_ladder(spec):
+    """'opus:32,opus:64,mp3:64' -> [Rendition, ...]."""
+    ladder = []
+    for part in spec.split(","):
+        codec, _, kbps = part.strip().partition(":")
+        if codec not in CODECS or not kbps.isdigit():
+            raise ValueError(f"bad rendition {part!r} (expected codec:kbps, codec one of {', '.join(CODECS)})")
+        ladder.append(Rendition(codec, int(kbps)))
+    return ladder
+
+
+def _transcode(source, dest, args):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg not found in PATH")
+    directory = os.path.dirname(dest)
+    tmp = os.path.join(directory, f".tmp-{os.getpid()}-{os.path.basename(dest)}")
+    try:
+        subprocess.run([ffmpeg, "-v", "error", "-y", "-i", source, "-map_metadata", "-1", "-vn"] + args + [tmp],
+                       check=True, capture_output=True)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return os.path.getsize(dest)
+
+
+def _cache_key(source_hash, rendition):
+    payload = json.dumps([LADDER_VERSION, source_hash, rendition.codec, rendition.kbps, rendition.ffmpeg_args()])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _load_index(lesson_dir):
+    try:
+        with open(os.path.join(lesson_dir, INDEX_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_ladder(lesson_dir, lesson_id, ladder, files=None, cache=None, pool=None):
+    """
+    Bring lesson_dir/variants/ and variants.json up to date for `files`
+    ({slide: filename}, default every slideN.mp3). Other slides keep their
+    entries; renditions are only pruned once their slide's MP3 is gone.
+    Returns (transcoded, reused, failed) counts.
+    """
+    files = files if files is not None else lesson_slide_files(lesson_dir)
+    variants_dir = os.path.join(lesson_dir, VARIANTS_DIR)
+    os.makedirs(variants_dir, exist_ok=True)
+    previous = {s["slide"]: s for s in _load_index(lesson_dir).get("slides", [])}
+
+    slides, work, reused = {}, [], 0
+    for slide, name in sorted(files.items()):
+        source = os.path.join(lesson_dir, name)
+        source_hash = file_sha256(source)
+        old = previous.get(slide, {})
+        entry = {"slide": slide, "file": name, "sourceHash": source_hash, "bytes": os.path.getsize(source),
+                 "variants": {}}
+        slides[slide] = entry
+        for rendition in ladder:
+            filename = rendition.filename(name)
+            dest = os.path.join(variants_dir, filename)
+            known = old.get("variants", {}).get(rendition.id)
+            if old.get("sourceHash") == source_hash and known and os.path.exists(dest):
+                entry["variants"][rendition.id] = known
+                reused += 1
+                continue
+            key = _cache_key(source_hash, rendition)
+            cached = cache.get_path(key, f".{rendition.extension}") if cache else None
+            if cached is not None:
+                atomic_copy(cached, dest)
+                entry["variants"][rendition.id] = {"file": f"{VARIANTS_DIR}/{filename}", "bytes": os.path.getsize(dest)}
+                reused += 1
+                continue
+            work.append((slide, rendition, source, dest, key))
+
+    # Slides outside `files` keep their renditions as long as their MP3 is still there.
+    present = lesson_slide_files(lesson_dir)
+    ids = {r.id for r in ladder}
+    for slide, old in previous.items():
+        if slide not in slides and present.get(slide) == old.get("file"):
+            slides[slide] = dict(old, variants={k: v for k, v in old.get("variants", {}).items() if k in ids})
+
+    failed = 0
+    own_pool = pool is None
+    pool = pool or ProcessPoolExecutor()
+    try:
+        futures = [(job, pool.submit(_transcode, job[2], job[3], job[1].ffmpeg_args())) for job in work]
+        for (slide, rendition, source, dest, key), future in futures:
+            try:
+                size = future.result()
+            except Exception as exc:
+                failed += 1
+                detail = exc.stderr.decode(errors="replace").strip() if getattr(exc, "stderr", None) else exc
+                print(f"    ✗ {os.path.basename(dest)}: {detail}")
+                continue
+            if cache:
+                cache.put_file(key, dest, {"source": slides[slide]["sourceHash"], "rendition": rendition.id},
+                               f".{rendition.extension}")
+            slides[slide]["variants"][rendition.id] = {"file": f"{VARIANTS_DIR}/{os.path.basename(dest)}",
+                                                       "bytes": size}
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+    # Renditions of removed slides or dropped formats.
+    wanted = {v["file"] for s in slides.values() for v in s["variants"].values()}
+    for old in previous.values():
+        for variant in old.get("variants", {}).values():
+            if variant["file"] not in wanted and os.path.exists(os.path.join(lesson_dir, variant["file"])):
+                os.unlink(os.path.join(lesson_dir, variant["file"]))
+
+    totals = {r.id: sum(s["variants"].get(r.id, {}).get("bytes", 0) for s in slides.values()) for r in ladder}
+    index = {
+        "lessonId": lesson_id,
+        "formats": [{"id": r.id, "codec": r.codec, "mime": r.mime, "bitrate": r.kbps * 1000,
+                     "totalBytes": totals[r.id]} for r in ladder],
+        "originalBytes": sum(s["bytes"] for s in slides.values()),
+        "updatedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "slides": [slides[k] for k in sorted(slides)],
+    }
+    atomic_write_bytes(os.path.join(lesson_dir, INDEX_NAME),
+                       (json.dumps(index, ensure_ascii=False, indent=1) + "\n").encode("utf-8"))
+    return len(work) - failed, reused, failed
+
+
+def rendition_cache(cache_dir=DEFAULT_CACHE_DIR, max_mb=DEFAULT_CACHE_MAX_MB):
+    """The renditions cache inside the TTS cache directory; it has its own size limit."""
+    return TTSCache(os.path.join(cache_dir, RENDITIONS_CACHE), int(max_mb * 1024 * 1024))
+
+
+def build_ladders(lessons, ladder, cache=None, workers=None):
+    """
+    `lessons` is [(lesson_dir, lesson_id, files or None)]; `cache` is a
+    rendition_cache(), not the TTS cache. Returns True if nothing failed.
+    """
+    if shutil.which("ffmpeg") is None:
+        print("   ✗ Encoding ladder needs ffmpeg in PATH")
+        return False
+    ok = True
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for lesson_dir, lesson_id, files in lessons:
+            started = time.perf_counter()
+            transcoded, reused, failed = build_ladder(lesson_dir, lesson_id, ladder, files, cache, pool)
+            index = _load_index(lesson_dir)
+            sizes = ", ".join(f"{f['id']} {f['totalBytes'] / 1e6:.1f} MB" for f in index.get("formats", []))
+            print(f"   🎚  {lesson_dir}: {transcoded} transcoded, {reused} reused, {failed} failed "
+                  f"in {time.perf_counter() - started:.1f}s (original {index.get('originalBytes', 0) / 1e6:.1f} MB; "
+                  f"{sizes})")
+            ok = ok and not failed
+    return ok
+
+
+def _ladder_arg(spec):
+    try:
+        return parse_ladder(spec)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+
+
+def add_ladder_arguments(parser):
+    parser.add_argument("--ladder", nargs="?", type=_ladder_arg, const=parse_ladder(DEFAULT_LADDER),
+                        help=f"after generating, transcode every slide into these renditions "
+                             f"(default when given without a value: {DEFAULT_LADDER})")
+    parser.add_argument("--ladder-workers", type=int, help="transcode processes (default: CPU count)")
+    parser.add_argument("--ladder-cache-mb", type=float, default=DEFAULT_CACHE_MAX_MB,
+                        help=f"size limit of --cache-dir/{RENDITIONS_CACHE}/")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m audio_pipeline.ladder", description=__doc__.split("\n\n")[0])
+    parser.add_argument("lessons", type=int, nargs="+", help="lesson numbers under --base-dir")
+    parser.add_argument("--base-dir", default="public/audio")
+    parser.add_argument("--ladder", type=_ladder_arg, default=parse_ladder(DEFAULT_LADDER))
+    parser.add_argument("--workers", type=int, help="transcode processes (default: CPU count)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_MAX_MB,
+                        help=f"size limit of --cache-dir/{RENDITIONS_CACHE}/")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args(argv)
+    cache = None if args.no_cache else rendition_cache(args.cache_dir, args.cache_max_mb)
+    lessons = [(os.path.join(args.base_dir, f"lesson{n}"), n, None) for n in args.lessons]
+    missing = [d for d, _, _ in lessons if not os.path.isdir(d)]
+    if missing:
+        print(f"Error: no such lesson directory: {', '.join(missing)}")
+        return 1
+    return 0 if build_ladders(lessons, args.ladder, cache, args.workers) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+"""
+Batch loudness normalization and silence trimming for public/audio.
+
+The course audio comes from gTTS, Edge, GCP, ElevenLabs and bg-mixed
+sources, so levels and leading/trailing silence vary between lessons. This
+pass evens them out in two passes over a process pool:
+
+    1. analyse   decode each MP3 to float PCM and measure integrated loudness
+                 (EBU R128 / ITU-R BS.1770: K-weighting, 400 ms blocks,
+                 absolute and relative gates), sample peak and the silence
+                 at either end, all vectorized NumPy
+    2. apply     cut the silence down to a short pad, apply one gain so the
+                 file lands on the target loudness without its peak passing
+                 the ceiling, and re-encode at the source bitrate
+
+Analyses are cached by file content hash, and every file the pass writes is
+recorded as done, so reruns only decode new or changed files. Outputs are
+replaced atomically. Where a lesson manifest owns a file its hash, size and
+duration are refreshed (so the generators don't see it as stale), the TTS
+cache entry it was published from (the manifest's sourceHash) is replaced by
+the normalized file, so a later cache hit doesn't bring the old audio back,
+and word timings in sidecars and cache metadata are shifted by the trimmed
+head. Lesson sprites (sprite.py) are left out and rebuilt from the rewritten
+slides.
+
+    python3 -m audio_pipeline.loudness --dry-run          # report only
+    python3 -m audio_pipeline.loudness public/audio/lesson6
+
+Needs NumPy and ffmpeg (see bgmix.py).
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+from . import mp3
+from .bgmix import decode, encode_mp3, load_numpy
+from .cache import add_cache_arguments, cache_from_args
+from .chunking import TICKS_PER_SECOND
+from .fsutil import atomic_write_bytes, file_sha256
+from .ladder import VARIANTS_DIR
+from .manifest import MANIFEST_NAME, LessonManifest
+from .sprite import SPRITE_NAME, refresh_sprite
+from .timing import retime_sidecar, write_lesson_timing
+
+DEFAULT_ROOT = "public/audio"
+DEFAULT_CACHE = ".tts-loudness/analysis.json"
+ANALYSIS_VERSION = 1
+
+
+@dataclass
+class LoudnessSettings:
+    target_lufs: float = -16.0
+    ceiling_db: float = -1.0         # sample peak after gain
+    tolerance_db: float = 0.5        # smaller corrections are not worth a re-encode
+    silence_db: float = -50.0        # 10 ms windows quieter than this count as silence
+    head_pad: float = 0.15           # silence kept before the first sound
+    tail_pad: float = 0.30           # ... and after the last
+    min_trim: float = 0.05           # trims shorter than this are left alone
+
+
+def _biquad_response(b, a, w):
+    """Complex response of a biquad at normalized angular frequencies `w`."""
+    np = load_numpy()
+    z = np.exp(-1j * w)
+    return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+
+def k_weighting(sample_rate):
+    """BS.1770 pre-filter (high shelf) and RLB high-pass as (b, a) biquads for `sample_rate`."""
+    gain, q, fc = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+    a_ = 10 ** (gain / 40)
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos, root = math.cos(w0), 2 * math.sqrt(a_) * alpha
+    shelf = ((a_ * ((a_ + 1) + (a_ - 1) * cos + root), -2 * a_ * ((a_ - 1) + (a_ + 1) * cos),
+              a_ * ((a_ + 1) + (a_ - 1) * cos - root)),
+             ((a_ + 1) - (a_ - 1) * cos + root, 2 * ((a_ - 1) - (a_ + 1) * cos), (a_ + 1) - (a_ - 1) * cos - root))
+    q, fc = 0.5003270373238773, 38.13547087602444
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha, cos = math.sin(w0) / (2 * q), math.cos(w0)
+    highpass = (((1 + cos) / 2, -(1 + cos), (1 + cos) / 2), (1 + alpha, -2 * cos, 1 - alpha))
+    return shelf, highpass
+
+
+def integrated_loudness(pcm, sample_rate):
+    """
+    Gated integrated loudness in LUFS (-inf for silence). The K-weighting
+    filters are applied in the frequency domain (one FFT per channel) and the
+    block energies come from a cumulative sum, so nothing loops per sample.
+    """
+    np = load_numpy()
+    n = len(pcm)
+    if not n:
+        return float("-inf")
+    size = 1 << (n + sample_rate // 2 - 1).bit_length()  # zero padding absorbs the filter tail
+    w = 2 * np.pi * np.fft.rfftfreq(size)
+    response = np.ones(len(w), dtype=complex)
+    for b, a in k_weighting(sample_rate):
+        response *= _biquad_response(b, a, w)
+    weighted = np.fft.irfft(np.fft.rfft(pcm, size, axis=0) * response[:, None], size, axis=0)[:n]
+    energy = np.concatenate((np.zeros((1, pcm.shape[1])), np.cumsum(weighted ** 2, axis=0)))
+    block, hop = int(0.4 * sample_rate), int(0.1 * sample_rate)
+    if n < block:
+        starts, block = np.array([0]), n
+    else:
+        starts = np.arange(0, n - block + 1, hop)
+    power = ((energy[starts + block] - energy[starts]) / block).sum(axis=1)  # channel weights are 1.0
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(power)
+    gated = power[loudness > -70.0]
+    if not len(gated):
+        return float("-inf")
+    relative = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+    with np.errstate(divide="ignore"):
+        gated = gated[-0.691 + 10 * np.log10(gated) > relative]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def silence_bounds(pcm, sample_rate, threshold_db):
+    """(leading, trailing) silence in seconds, from the RMS of 10 ms windows."""
+    np = load_numpy()
+    window = max(1, sample_rate // 100)
+    count = len(pcm) // window
+    if not count:
+        return 0.0, 0.0
+    frames = pcm[:count * window].reshape(count, window, pcm.shape[1])
+    rms = np.sqrt((frames ** 2).mean(axis=1)).max(axis=1)
+    loud = np.flatnonzero(rms > 10 ** (threshold_db / 20))
+    if not len(loud):
+        return len(pcm) / sample_rate, 0.0
+    return float(loud[0] * window / sample_rate), float((len(pcm) - (loud[-1] + 1) * window) / sample_rate)
+
+
+def _source_format(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    frames = mp3.audio_frames(data)
+    if not frames:
+        raise ValueError("no MPEG audio frames")
+    seconds = sum(frame.duration for frame in frames)
+    bitrate = sum(frame.length for frame in frames) * 8 / seconds
+    return frames[0].sample_rate, frames[0].channels, int(round(bitrate / 8000) * 8000), seconds
+
+
+def _rounded(value):
+    return round(value, 2) if math.isfinite(value) else None  # None: silent file
+
+
+def analyse(path, settings):
+    np = load_numpy()
+    sample_rate, channels, bitrate, seconds = _source_format(path)
+    pcm = decode(path, sample_rate, channels)
+    peak = float(np.abs(pcm).max()) if len(pcm) else 0.0
+    head, tail = silence_bounds(pcm, sample_rate, settings.silence_db)
+    return {
+        "version": ANALYSIS_VERSION,
+        "sampleRate": sample_rate,
+        "channels": channels,
+        "bitrate": bitrate,
+        "durationSec": round(len(pcm) / sample_rate, 3),
+        "loudnessLufs": _rounded(integrated_loudness(pcm, sample_rate)),
+        "peakDb": _rounded(20 * math.log10(peak)) if peak else None,
+        "headSilenceSec": round(head, 3),
+        "tailSilenceSec": round(tail, 3),
+    }
+
+
+def plan(analysis, settings):
+    """{"gainDb", "trimHead", "trimTail"} for one analysed file, or None if it is fine as it is."""
+    if analysis["loudnessLufs"] is None:
+        return None
+    gain = settings.target_lufs - analysis["loudnessLufs"]
+    gain = min(gain, settings.ceiling_db - analysis["peakDb"])
+    if abs(gain) < settings.tolerance_db:
+        gain = 0.0
+    head = max(0.0, analysis["headSilenceSec"] - settings.head_pad)
+    tail = max(0.0, analysis["tailSilenceSec"] - settings.tail_pad)
+    head = head if head >= settings.min_trim else 0.0
+    tail = tail if tail >= settings.min_trim else 0.0
+    if not gain and not head and not tail:
+        return None
+    return {"gainDb": round(gain, 2), "trimHead": round(head, 3), "trimTail": round(tail, 3)}
+
+
+def apply(path, analysis, change):
+    np = load_numpy()
+    sample_rate = analysis["sampleRate"]
+    pcm = decode(path, sample_rate, analysis["channels"])
+    start = int(change["trimHead"] * sample_rate)
+    end = len(pcm) - int(change["trimTail"] * sample_rate)
+    pcm = pcm[start:end] * np.float32(10 ** (change["gainDb"] / 20))
+    np.clip(pcm, -1.0, 1.0, out=pcm)
+    atomic_write_bytes(path, encode_mp3(pcm, sample_rate, bitrate=analysis["bitrate"]))
+    return os.path.getsize(path)
+
+
+def _analyse_job(path, settings):
+    return file_sha256(path), analyse(path, settings)
+
+
+def _apply_job(path, analysis, change):
+    size = apply(path, analysis, change)
+    return file_sha256(path), size
+
+
+def find_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for directory, subdirs, names in os.walk(path):
+            subdirs[:] = [d for d in subdirs if d != VARIANTS_DIR]  # encoding ladder outputs
+            files.extend(os.path.join(directory, n) for n in sorted(names)
+                         if n.lower().endswith(".mp3") and n != SPRITE_NAME)
+    return sorted(files)
+
+
+class AnalysisCache:
+    """{sha256: analysis} plus {sha256: recipe} for files this pass already wrote."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.analyses = data.get("analyses", {})
+        self.done = data.get("done", {})
+
+    def save(self):
+        payload = json.dumps({"analyses": self.analyses, "done": self.done}, indent=1) + "\n"
+        atomic_write_bytes(self.path, payload.encode("utf-8"))
+
+
+def _refresh_cache(tts_cache, key, path, change):
+    """Replace the TTS cache entry `key` with the normalized file at `path`."""
+    meta = tts_cache.metadata(key) or {}
+    shift = round(change["trimHead"] * TICKS_PER_SECOND)
+    boundaries = [dict(b, offset=max(0, b["offset"] - shift)) for b in meta.get("boundaries", [])]
+    tts_cache.put_file(key, path, dict(meta, boundaries=boundaries, loudness=change))
+
+
+def _refresh_owners(changed, tts_cache=None):
+    """
+    Keep manifests, timing sidecars and the TTS cache in step with rewritten
+    files. `changed` is {path: change}.
+    """
+    by_dir = {}
+    for path, change in changed.items():
+        by_dir.setdefault(os.path.dirname(path), []).append((path, change))
+    for directory, items in by_dir.items():
+        for path, change in items:
+            if change["trimHead"]:
+                retime_sidecar(path, change["trimHead"], mp3.file_duration(path))
+        refresh_sprite(directory)
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            continue
+        with open(manifest_path, encoding="utf-8") as f:
+            lesson_id = json.load(f).get("lessonId")
+        manifest = LessonManifest.load(directory, lesson_id)
+        owned = [manifest.refresh_output(os.path.basename(path), loudness=change) for path, change in items]
+        if tts_cache is not None:
+            by_file = {info["filename"]: info for info in manifest.slides.values()}
+            for (path, change), is_owned in zip(items, owned):
+                key = by_file.get(os.path.basename(path), {}).get("sourceHash") if is_owned else None
+                if key:
+                    _refresh_cache(tts_cache, key, path, change)
+        if any(owned):
+            manifest.save()
+            write_lesson_timing(manifest)
+
+
+def normalize(paths, settings=None, cache_path=DEFAULT_CACHE, workers=None, dry_run=False, tts_cache=None):
+    """
+    Run both passes over the MP3s under `paths`. Rewritten slides replace
+    their entries in `tts_cache` (a TTSCache) when given. Returns True if
+    nothing failed.
+    """
+    settings = settings or LoudnessSettings()
+    recipe = json.dumps(asdict(settings), sort_keys=True)
+    cache = AnalysisCache(cache_path)
+    files = find_files(paths)
+    hashes = {path: file_sha256(path) for path in files}
+    pending = [p for p in files if cache.done.get(hashes[p]) != recipe
+               and cache.analyses.get(hashes[p], {}).get("version") != ANALYSIS_VERSION]
+    settled = sum(1 for p in files if cache.done.get(hashes[p]) == recipe)
+    print(f"   {len(files)} files, {settled} already normalized, {len(pending)} to analyse")
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        started = time.perf_counter()
+        futures = {path: pool.submit(_analyse_job, path, settings) for path in pending}
+        for path, future in futures.items():
+            try:
+                sha, analysis = future.result()
+            except Exception as exc:
+                failed += 1
+                print(f"    ✗ {path}: {type(exc).__name__}: {exc}")
+                continue
+            cache.analyses[sha] = analysis
+        if pending:
+            cache.save()
+            print(f"   Analysed {len(pending) - failed} files in {time.perf_counter() - started:.1f}s")
+
+        changes = {}
+        for path in files:
+            sha = hashes[path]
+            if cache.done.get(sha) == recipe or sha not in cache.analyses:
+                continue
+            change = plan(cache.analyses[sha], settings)
+            if change is None:
+                cache.done[sha] = recipe
+            else:
+                changes[path] = change
+        _report(files, hashes, cache, changes)
+        if dry_run or not changes:
+            cache.save()
+            return not failed
+
+        started = time.perf_counter()
+        sizes = {path: os.path.getsize(path) for path in changes}
+        futures = {path: pool.submit(_apply_job, path, cache.analyses[hashes[path]], change)
+                   for path, change in changes.items()}
+        saved, written = 0, {}
+        for path, future in futures.items():
+            try:
+                sha, size = future.result()
+            except Exception as exc:
+                failed += 1
+                print(f"    ✗ {path}: {type(exc).__name__}: {exc}")
+                continue
+            cache.done[sha] = recipe
+            written[path] = changes[path]
+            saved += sizes[path] - size
+        cache.save()
+        _refresh_owners(written, tts_cache)
+        print(f"   Rewrote {len(written)} files in {time.perf_counter() - started:.1f}s "
+              f"({saved / 1e6:+.1f} MB saved)" if written else "   Nothing rewritten")
+    return not failed
+
+
+def _report(files, hashes, cache, changes):
+    measured = [cache.analyses[hashes[p]]["loudnessLufs"] for p in files
+                if cache.analyses.get(hashes[p], {}).get("loudnessLufs") is not None]
+    if measured:
+        print(f"   Loudness before: {min(measured):.1f} .. {max(measured):.1f} LUFS "
+              f"(median {sorted(measured)[len(measured) // 2]:.1f})")
+    trimmed = sum(c["trimHead"] + c["trimTail"] for c in changes.values())
+    gained = sum(1 for c in changes.values() if c["gainDb"])
+    print(f"   {len(changes)} files to rewrite: {gained} gain changes, {trimmed:.1f}s of silence to trim")
+
+
+def main(argv=None):
+    defaults = LoudnessSettings()
+    parser = argparse.ArgumentParser(prog="python3 -m audio_pipeline.loudness", description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_ROOT], help="MP3 files or directories (default: public/audio)")
+    parser.add_argument("--dry-run", action="store_true", help="analyse and report, change nothing")
+    parser.add_argument("--workers", type=int, help="processes (default: CPU count)")
+    parser.add_argument("--analysis-cache", default=DEFAULT_CACHE)
+    add_cache_arguments(parser)
+    for field, value in asdict(defaults).items():
+        parser.add_argument("--" + field.replace("_", "-"), type=float, default=value)
+    args = parser.parse_args(argv)
+    settings = LoudnessSettings(**{field: getattr(args, field) for field in asdict(defaults)})
+    try:
+        ok = normalize(args.paths, settings, args.analysis_cache, args.workers, args.dry_run,
+                       cache_from_args(args))
+    except RuntimeError as exc:
+        print(f"Error: {exc}")
+        return 1
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
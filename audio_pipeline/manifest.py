@@ -0,0 +1,193 @@
+"""
+Per-lesson generation manifest (public/audio/lessonN/manifest.json).
+
+Records, for every slide a generator produced, the hash of what it was asked
+to say (text + engine variant + voice + rate, where the variant is the cache
+label that also covers chunking and pause settings), the hash/size of the MP3
+it wrote and the audio duration. The next run compares against it and only
+regenerates slides that are new, changed, or whose output went missing, then
+prunes slideN.mp3 files (and their timing sidecars) that this manifest owned
+but that are no longer in the lesson. Slides the manifest never recorded
+(e.g. written by the JS generators) are never touched.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from . import mp3
+from .cache import TTSCache, normalize_text
+from .fsutil import atomic_write_bytes
+from .timing import sidecar_path
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+class LessonManifest:
+    def __init__(self, lesson_dir, lesson_id):
+        self.lesson_dir = lesson_dir
+        self.path = os.path.join(lesson_dir, MANIFEST_NAME)
+        self.lesson_id = lesson_id
+        self.slides = {}
+        self.extra = {}
+
+    @classmethod
+    def load(cls, lesson_dir, lesson_id):
+        manifest = cls(lesson_dir, lesson_id)
+        try:
+            with open(manifest.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return manifest
+        for info in data.get("slidesInfo", []):
+            manifest.slides[int(info["slide"])] = info
+        manifest.extra = {k: v for k, v in data.items()
+                          if k not in ("lessonId", "slides", "slidesInfo", "totalDurationSec", "updatedAt")}
+        return manifest
+
+    @staticmethod
+    def source_hash(text, engine, voice, rate):
+        """`engine` is the cache variant label the slide is built under (see runner.slide_variant)."""
+        return TTSCache.key(text, engine, voice, rate)
+
+    def is_current(self, slide, source_hash):
+        info = self.slides.get(slide)
+        if not info or info.get("sourceHash") != source_hash:
+            return False
+        try:
+            return os.path.getsize(os.path.join(self.lesson_dir, info["filename"])) == info["bytes"]
+        except OSError:
+            return False
+
+    def plan(self, jobs, engine, voice, rate, force=False, variant=None):
+        """
+        Split `jobs` into (to_generate, unchanged). `variant(text)` gives the
+        engine label to hash with; without it the plain engine name is used.
+        """
+        dirty, unchanged = [], []
+        for job in jobs:
+            label = variant(job.text) if variant else engine
+            job.meta["sourceHash"] = self.source_hash(job.text, label, voice, rate)
+            if not force and self.is_current(job.slide, job.meta["sourceHash"]):
+                unchanged.append(job)
+            else:
+                dirty.append(job)
+        return dirty, unchanged
+
+    def record(self, job, engine, voice, rate):
+        """Store the current state of `job.output_path` after a successful build."""
+        with open(job.output_path, "rb") as f:
+            data = f.read()
+        text = normalize_text(job.text)
+        self.slides[job.slide] = {
+            "slide": job.slide,
+            "filename": os.path.basename(job.output_path),
+            "sourceHash": job.meta.get("sourceHash") or self.source_hash(job.text, engine, voice, rate),
+            "textHash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            "outputHash": hashlib.sha256(data).hexdigest(),
+            "bytes": len(data),
+            "durationSec": round(mp3.duration(data), 3),
+            "characterCount": len(text),
+            "wordCount": len(text.split()),
+            "engine": engine,
+            "voice": voice,
+            "rate": rate,
+            "generatedAt": _now(),
+        }
+
+    def refresh_output(self, filename, **extra):
+        """
+        Re-record hash, size and duration of an owned output that was rewritten
+        in place (e.g. by the loudness pass), so it still counts as current.
+        Returns False if this manifest doesn't own `filename`.
+        """
+        for info in self.slides.values():
+            if info["filename"] == filename:
+                with open(os.path.join(self.lesson_dir, filename), "rb") as f:
+                    data = f.read()
+                info.update(outputHash=hashlib.sha256(data).hexdigest(), bytes=len(data),
+                            durationSec=round(mp3.duration(data), 3), **extra)
+                return True
+        return False
+
+    def prune(self, current_slides, dry_run=False):
+        """Delete outputs this manifest owns for slides no longer in `current_slides`."""
+        removed = []
+        for slide in sorted(set(self.slides) - set(current_slides)):
+            path = os.path.join(self.lesson_dir, self.slides[slide]["filename"])
+            if not dry_run:
+                for owned in (path, sidecar_path(path)):
+                    try:
+                        os.unlink(owned)
+                    except FileNotFoundError:
+                        pass
+                del self.slides[slide]
+            removed.append(path)
+        return removed
+
+    def to_dict(self):
+        slides = [self.slides[k] for k in sorted(self.slides)]
+        data = {"lessonId": self.lesson_id}
+        data.update(self.extra)
+        data.update({
+            "slides": len(slides),
+            "totalDurationSec": round(sum(s.get("durationSec", 0) for s in slides), 3),
+            "updatedAt": _now(),
+            "slidesInfo": slides,
+        })
+        return data
+
+    def save(self):
+        payload = json.dumps(self.to_dict(), ensure_ascii=False, indent=2) + "\n"
+        atomic_write_bytes(self.path, payload.encode("utf-8"))
+
+
+def plan_lessons(jobs, engine, voice, rate, force=False, variant=None):
+    """
+    Load one manifest per lesson directory touched by `jobs` and return
+    (manifests, to_generate, unchanged). `manifests` is keyed by lesson number;
+    `variant` is passed on to LessonManifest.plan().
+    """
+    manifests, dirty, unchanged = {}, [], []
+    by_lesson = {}
+    for job in jobs:
+        by_lesson.setdefault(job.lesson, []).append(job)
+    for lesson, lesson_jobs in sorted(by_lesson.items()):
+        lesson_dir = os.path.dirname(lesson_jobs[0].output_path)
+        manifest = LessonManifest.load(lesson_dir, lesson)
+        manifests[lesson] = manifest
+        d, u = manifest.plan(lesson_jobs, engine, voice, rate, force, variant)
+        dirty.extend(d)
+        unchanged.extend(u)
+    return manifests, dirty, unchanged
+
+
+def finish_lessons(manifests, jobs, results, engine, voice, rate, prune=True, lesson_slides=None):
+    """
+    Record successful results, prune orphans and save every manifest. Returns
+    pruned paths. `lesson_slides` ({lesson: slides}) is the full slide list
+    when `jobs` only covers some of them; by default it comes from `jobs`.
+    """
+    for result in results:
+        if result.ok:
+            manifests[result.job.lesson].record(result.job, engine, voice, rate)
+    pruned = []
+    for lesson, manifest in manifests.items():
+        if prune:
+            if lesson_slides is not None:
+                current = lesson_slides.get(lesson, ())
+            else:
+                current = {j.slide for j in jobs if j.lesson == lesson}
+            pruned.extend(manifest.prune(current))
+        manifest.save()
+    return pruned
+
+
+def add_manifest_arguments(parser):
+    parser.add_argument("--force", action="store_true", help="regenerate slides even if the manifest says they are current")
+    parser.add_argument("--no-prune", action="store_true", help="keep slide files that were removed from the lesson")
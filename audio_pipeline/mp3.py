@@ -0,0 +1,161 @@
+"""
+Minimal MPEG audio frame parser.
+
+Enough to walk the frames of the MP3s our TTS providers return (MPEG-1/2/2.5,
+layers I-III, with or without an ID3v2 tag) so we can measure duration, check
+integrity and cut/concatenate at frame boundaries without decoding or
+re-encoding anything.
+"""
+
+from dataclasses import dataclass
+
+# Bitrates in kbps indexed by [version_is_mpeg1][layer][index]
+_BITRATES = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+_LAYERS = {3: 1, 2: 2, 1: 3}
+
+
+@dataclass
+class Frame:
+    offset: int
+    length: int
+    sample_rate: int
+    samples: int
+    bitrate: int
+    channels: int
+
+    @property
+    def duration(self):
+        return self.samples / self.sample_rate
+
+
+def id3v2_size(data):
+    """Length of a leading ID3v2 tag (0 if there is none)."""
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def parse_header(data, offset):
+    """Decode the 4-byte frame header at `offset`, or return None if it is not one."""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version_bits = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = (b2 >> 4) & 0x0F
+    rate_index = (b2 >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    layer = _LAYERS[layer_bits]
+    bitrate = _BITRATES[mpeg1][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][rate_index]
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 3 else 2
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return Frame(offset, length, sample_rate, samples, bitrate, channels)
+
+
+def iter_frames(data, strict=False):
+    """
+    Yield every frame in `data`. Garbage between frames is skipped by
+    resyncing on the next valid header unless `strict`, in which case a
+    ValueError is raised at the first byte that is not a frame.
+    """
+    offset = id3v2_size(data)
+    end = len(data)
+    if end >= 128 and data[-128:-125] == b"TAG":
+        end -= 128
+    while offset + 4 <= end:
+        frame = parse_header(data, offset)
+        if frame is None or frame.length <= 0 or offset + frame.length > end:
+            if strict:
+                raise ValueError(f"no MPEG frame at byte {offset}")
+            offset += 1
+            continue
+        yield frame
+        offset += frame.length
+
+
+def is_info_frame(data, frame):
+    """True for the Xing/Info/VBRI header frame encoders put first; it carries no audio."""
+    body = data[frame.offset + 4:frame.offset + min(frame.length, 48)]
+    return b"Xing" in body or b"Info" in body or b"VBRI" in body
+
+
+def audio_frames(data):
+    """Frames that carry audio: no ID3 tags, no Xing/Info header frame."""
+    frames = list(iter_frames(data))
+    if frames and is_info_frame(data, frames[0]):
+        frames = frames[1:]
+    return frames
+
+
+def silent_frame(data, frame):
+    """
+    A frame with the same format as `frame` that decodes to silence: the
+    header without CRC or padding, followed by zeroed side info and main data.
+    """
+    b1 = data[frame.offset + 1] | 0x01          # protection bit set = no CRC
+    b2 = data[frame.offset + 2] & ~0x02 & 0xFF  # no padding
+    header = bytes((0xFF, b1, b2, data[frame.offset + 3]))
+    unpadded = parse_header(header + bytes(4), 0)
+    return header + bytes(unpadded.length - 4)
+
+
+def silence(data, frame, seconds):
+    """Whole number of silent frames closest to `seconds`, matching `frame`'s format."""
+    count = round(seconds * frame.sample_rate / frame.samples)
+    return silent_frame(data, frame) * max(0, count), count * frame.samples / frame.sample_rate
+
+
+def silent_stream(seconds, sample_rate=24000, bitrate=48000, channels=1):
+    """
+    Silent MPEG-2/2.5 Layer III frames (or MPEG-1 for 32-48 kHz) of roughly
+    `seconds`, without needing an encoder or a reference file.
+    """
+    version_bits = next(v for v, rates in _SAMPLE_RATES.items() if sample_rate in rates)
+    rate_index = _SAMPLE_RATES[version_bits].index(sample_rate)
+    bitrate_index = _BITRATES[version_bits == 3][3].index(bitrate // 1000)
+    header = bytes((0xFF, 0xE0 | (version_bits << 3) | (1 << 1) | 0x01,
+                    (bitrate_index << 4) | (rate_index << 2),
+                    0xC0 if channels == 1 else 0x00))
+    frame = parse_header(header + bytes(4), 0)
+    data, _ = silence(header + bytes(frame.length - 4), frame, seconds)
+    return data
+
+
+def duration(data):
+    """Seconds of audio: the Xing/Info frame is not counted, as in audio_frames()."""
+    return sum(frame.duration for frame in audio_frames(data))
+
+
+def strip_to_frames(data):
+    """Audio frames only: drops ID3 tags, the Xing/Info frame and anything that is not a frame."""
+    return b"".join(data[f.offset:f.offset + f.length] for f in audio_frames(data))
+
+
+def file_duration(path):
+    with open(path, "rb") as f:
+        return duration(f.read())
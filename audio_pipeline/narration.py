@@ -0,0 +1,391 @@
+"""
+Progressive narration of long documents.
+
+    python3 -m audio_pipeline.narration content/lessons/contract-sovereignty.en.txt [--engine edge]
+
+The generators only know slide scripts. A paper like
+contract-sovereignty.en.txt (title, author line, JEL codes, abstract,
+numbered sections, references) is narrated here instead:
+
+    public/audio/documents/contract-sovereignty.en/section01.mp3   (Abstract)
+    public/audio/documents/contract-sovereignty.en/section02.mp3   (1. Introduction)
+    ...
+    public/audio/documents/contract-sovereignty.en/narration.json
+
+The file is read line by line and turned into pieces on the fly: the title,
+top-level headings (each starting a section file), subheadings and
+paragraphs. Lines nobody wants read aloud are dropped: e-mail and
+affiliation lines, JEL codes and keywords, URLs, author-year citations, and
+the declarations and references at the end.
+
+Synthesis runs ahead of playback. Up to --ahead pieces are queued, each
+rendered (through the TTS cache and rate limiter) as soon as it is queued,
+with at most --concurrency at a time. A single writer takes them in order
+and appends their frames, with pauses, to the current section's temp file.
+Each section is published with write-then-rename as soon as its last
+paragraph lands, and narration.json is rewritten to list it, so section 1
+is playable within seconds while the rest still renders. Only the queue
+holds audio in memory, so memory use doesn't grow with the document.
+narration.json lists the published sections with their durations and the
+start time of every heading and paragraph; "complete" turns true at the end.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+
+from . import mp3
+from .cache import TTSCache, add_cache_arguments, cache_from_args
+from .chunking import DEFAULT_GAP_MS, DEFAULT_MAX_CHARS, render, split_text
+from .engines import add_engine_arguments, engine_from_args
+from .fsutil import atomic_write_bytes
+from .ratelimit import add_ratelimit_arguments, limiter_for
+from .scheduler import RetryPolicy
+from .streaming import AtomicFileWriter
+
+DEFAULT_OUTPUT_DIR = "public/audio/documents"
+INDEX_NAME = "narration.json"
+DEFAULT_AHEAD = 8
+
+# Seconds of silence after each kind of piece (split paragraphs use --sentence-gap-ms).
+PAUSES = {"title": 1.2, "heading": 0.8, "subheading": 0.6, "paragraph": 0.7}
+
+SKIP_SECTIONS = {
+    "references", "bibliography", "works cited", "statements and declarations", "declarations",
+    "funding", "competing interests", "conflict of interest", "conflicts of interest",
+    "data availability", "acknowledgements", "acknowledgments", "author contributions",
+}
+
+_NUMBERED = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+(\S.*)$")
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+_META = re.compile(r"^(JEL(\s+codes?)?|Key\s*words|DOI|ORCID|Received|Accepted|Published|Corresponding author)\s*:", re.I)
+_URL = re.compile(r"\s*(https?://|doi\.org/)\S+")
+_CITATION = re.compile(r"\s*\([^()]*[A-Za-z][^()]*,\s*(?:1[5-9]|20)\d\d[a-z]?\b[^()]*\)")  # (Hayek, 1945; North, 1990)
+
+
+@dataclass
+class Piece:
+    section: int  # 1-based; a new number starts a new section file
+    section_title: str
+    kind: str     # title, heading, subheading, paragraph or continued
+    text: str
+
+
+def _is_metadata(block):
+    return bool(_EMAIL.search(block) or _META.match(block) or block.count("•") >= 2)
+
+
+def _heading(block):
+    """(level, spoken text) if `block` is a heading line, else None. Level 1 starts a section."""
+    if "\n" in block or len(block) > 100:
+        return None
+    numbered = _NUMBERED.match(block)
+    if numbered and not numbered.group(2).rstrip().endswith((".", "?", "!")):
+        return numbered.group(1).count(".") + 1, f"{numbered.group(1)}. {numbered.group(2)}"
+    words = block.split()
+    if len(words) <= 8 and block[0].isupper() and not block.endswith((".", "!", "?", ";", ",")):
+        return 1, block.rstrip(":")
+    return None
+
+
+def clean_text(text):
+    """Text as it should be spoken: no URLs or author-year citations, bullets read as commas."""
+    text = _URL.sub("", text)
+    text = _CITATION.sub("", text)
+    text = text.replace(" • ", ", ")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def read_blocks(lines):
+    """Blank-line separated blocks; only the block being read is held in memory."""
+    block = []
+    for line in lines:
+        line = line.strip()
+        if line:
+            block.append(line)
+        elif block:
+            yield "\n".join(block)
+            block = []
+    if block:
+        yield "\n".join(block)
+
+
+def parse_document(lines):
+    """
+    Yield the spoken Pieces of a document, reading `lines` lazily. Front
+    matter runs until "Abstract" or the first numbered heading: its blocks up
+    to the first metadata line (author, e-mail, JEL codes...) are the title,
+    the rest (affiliations and the like) is skipped.
+    """
+    title, front, in_meta, skipping, section, section_title = [], True, False, False, 0, ""
+    for block in read_blocks(lines):
+        heading = _heading(block)
+        if front:
+            if _is_metadata(block):
+                in_meta = True
+                continue
+            starts_body = heading is not None and (block.lower() == "abstract" or _NUMBERED.match(block))
+            if not starts_body and (heading is not None or not title):
+                if not in_meta:
+                    title.append(block.rstrip(":"))
+                continue
+            front = False
+        if heading is not None and heading[0] > 1 and not section:
+            heading = 1, heading[1]
+        if heading is not None:
+            level, text = heading
+            if level == 1:
+                skipping = re.sub(r"^[\d.]+\s*", "", text).strip().lower() in SKIP_SECTIONS
+                if skipping:
+                    continue
+                section, section_title = section + 1, text
+                if title:
+                    yield Piece(section, section_title, "title", clean_text(". ".join(title)) + ".")
+                    title = []
+                yield Piece(section, section_title, "heading", text + ".")
+            elif not skipping:
+                yield Piece(section, section_title, "subheading", text + ".")
+            continue
+        if skipping or _is_metadata(block):
+            continue
+        if not section:  # text before any heading: the title opens section 1
+            section, section_title = 1, title[0] if title else "Introduction"
+            if title:
+                yield Piece(section, section_title, "title", clean_text(". ".join(title)) + ".")
+                title = []
+        text = clean_text(block)
+        if text:
+            yield Piece(section, section_title, "paragraph", text)
+
+
+def split_pieces(pieces, max_chars):
+    """Split paragraphs longer than `max_chars` into "continued" pieces, lazily."""
+    for piece in pieces:
+        parts = split_text(piece.text, max_chars) if max_chars else [piece.text]
+        for i, part in enumerate(parts):
+            yield Piece(piece.section, piece.section_title, "continued" if i else piece.kind, part)
+
+
+class SectionWriter:
+    """Appends pieces to one section's temp file; publish() renames it into place."""
+
+    def __init__(self, path, index, title):
+        self.path = path
+        self.index = index
+        self.title = title
+        self.seconds = 0.0
+        self.paragraphs = []
+        self._writer = AtomicFileWriter(path)
+
+    def append(self, piece, audio, gap):
+        frames = mp3.audio_frames(audio)
+        if not frames:
+            raise RuntimeError("TTS returned no MPEG frames")
+        if self.paragraphs:
+            silence, seconds = mp3.silence(audio, frames[0], gap)
+            self._writer.write(silence)
+            self.seconds += seconds
+        if piece.kind == "continued":
+            self.paragraphs[-1]["chars"] += len(piece.text) + 1
+        else:
+            self.paragraphs.append({"kind": piece.kind, "startSec": round(self.seconds, 3), "chars": len(piece.text)})
+        for frame in frames:
+            self._writer.write(audio[frame.offset:frame.offset + frame.length])
+            self.seconds += frame.duration
+
+    def publish(self):
+        self._writer.commit()
+        return {"index": self.index, "title": self.title, "file": os.path.basename(self.path),
+                "durationSec": round(self.seconds, 3), "paragraphs": self.paragraphs}
+
+    def abort(self):
+        self._writer.abort()
+
+
+class Narrator:
+    """
+    Renders pieces through the cache up to `ahead` pieces in front of the
+    writer, which publishes each section as soon as it is complete.
+    """
+
+    def __init__(self, tts, output_dir, cache=None, limiter=None, ahead=DEFAULT_AHEAD, concurrency=4,
+                 retry=None, max_chars=DEFAULT_MAX_CHARS, continued_gap=DEFAULT_GAP_MS / 1000):
+        self.tts = tts
+        self.output_dir = output_dir
+        self.cache = cache
+        self.stream = limiter.wrap(tts.stream) if limiter is not None else tts.stream
+        self.ahead = max(1, ahead)
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.retry = retry or RetryPolicy(retries=2)
+        self.max_chars = max_chars
+        self.continued_gap = continued_gap
+        self.sections = []
+        self.synthesized = 0
+        self.cached = 0
+
+    def section_path(self, index):
+        return os.path.join(self.output_dir, f"section{index:02d}.mp3")
+
+    async def render(self, piece):
+        key = TTSCache.key(piece.text, self.tts.name, self.tts.voice, self.tts.rate)
+        audio = self.cache.get(key) if self.cache else None
+        if audio is not None:
+            self.cached += 1
+            return audio
+        audio, _ = await render(piece.text, self.stream, self.semaphore, self.retry)
+        self.synthesized += 1
+        if self.cache:
+            self.cache.put(key, audio, {"engine": self.tts.name, "voice": self.tts.voice,
+                                        "rate": self.tts.rate, "chars": len(piece.text)})
+        return audio
+
+    async def produce(self, pieces, queue):
+        try:
+            for piece in pieces:
+                await queue.put((piece, asyncio.ensure_future(self.render(piece))))
+        finally:
+            await queue.put(None)
+
+    def write_index(self, source, complete):
+        index = {
+            "source": source,
+            "engine": self.tts.name,
+            "voice": self.tts.voice,
+            "rate": self.tts.rate,
+            "complete": complete,
+            "durationSec": round(sum(s["durationSec"] for s in self.sections), 3),
+            "sections": self.sections,
+        }
+        atomic_write_bytes(os.path.join(self.output_dir, INDEX_NAME),
+                           json.dumps(index, ensure_ascii=False, indent=2).encode("utf-8"))
+
+    async def narrate(self, source, on_section=None):
+        """
+        Narrate the document at `source` into `output_dir`. `on_section(entry)`
+        is called as each section is published. Raises if a piece fails; the
+        sections published so far stay listed in the index (complete: false).
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        queue = asyncio.Queue(maxsize=self.ahead)
+        with open(source, encoding="utf-8") as f:
+            producer = asyncio.ensure_future(self.produce(split_pieces(parse_document(f), self.max_chars), queue))
+            writer, previous = None, None
+            try:
+                while (item := await queue.get()) is not None:
+                    piece, rendering = item
+                    audio = await rendering
+                    if writer is None or piece.section != writer.index:
+                        if writer is not None:
+                            self._publish(writer, source, on_section)
+                        writer = SectionWriter(self.section_path(piece.section), piece.section, piece.section_title)
+                    gap = self.continued_gap if piece.kind == "continued" else PAUSES.get(previous, 0.0)
+                    writer.append(piece, audio, gap)
+                    previous = "paragraph" if piece.kind == "continued" else piece.kind
+                if writer is not None:
+                    self._publish(writer, source, on_section)
+                    writer = None
+                await producer
+            except BaseException:
+                if writer is not None:
+                    writer.abort()
+                producer.cancel()
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    if item is not None:
+                        item[1].cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+                raise
+        self.write_index(source, complete=True)
+        self.prune()
+
+    def _publish(self, writer, source, on_section):
+        self.sections.append(writer.publish())
+        self.write_index(source, complete=False)
+        if on_section is not None:
+            on_section(self.sections[-1])
+
+    def prune(self):
+        """Remove section files left over from an earlier, longer narration."""
+        keep = {s["file"] for s in self.sections}
+        for name in os.listdir(self.output_dir):
+            if re.fullmatch(r"section\d+\.mp3", name) and name not in keep:
+                os.unlink(os.path.join(self.output_dir, name))
+
+
+def document_dir(source, output_dir=DEFAULT_OUTPUT_DIR):
+    """public/audio/documents/contract-sovereignty.en for content/lessons/contract-sovereignty.en.txt."""
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(source))[0])
+
+
+def print_outline(source):
+    with open(source, encoding="utf-8") as f:
+        for piece in parse_document(f):
+            if piece.kind == "paragraph":
+                print(f"      {piece.text[:70]}{'…' if len(piece.text) > 70 else ''} ({len(piece.text)} chars)")
+            else:
+                indent = "    " if piece.kind == "subheading" else ""
+                print(f"   {piece.section:02d} {indent}{piece.kind}: {piece.text}")
+
+
+async def narrate_document(source, tts, args):
+    """Narrate `source` with the TTSEngine `tts`. Returns True on success."""
+    output_dir = args.output_dir or document_dir(source)
+    limiter = None if args.no_rate_limit else limiter_for(tts.name, args.rate_profile)
+    narrator = Narrator(tts, output_dir, cache_from_args(args), limiter, args.ahead, args.concurrency,
+                        RetryPolicy(args.retries, args.backoff), args.max_chunk_chars, args.sentence_gap_ms / 1000)
+    started = time.perf_counter()
+
+    def on_section(entry):
+        print(f"   ✓ {entry['file']} ({entry['title']}): {len(entry['paragraphs'])} pieces, "
+              f"{entry['durationSec']:.1f}s audio, published at {time.perf_counter() - started:.1f}s")
+
+    try:
+        await narrator.narrate(source, on_section)
+    except Exception as e:
+        print(f"   ✗ Stopped after {len(narrator.sections)} section(s): {type(e).__name__}: {e}")
+        return False
+    total = sum(s["durationSec"] for s in narrator.sections)
+    print(f"   {len(narrator.sections)} sections, {total / 60:.1f} min of audio in "
+          f"{time.perf_counter() - started:.1f}s: {narrator.synthesized} synthesized, {narrator.cached} from cache")
+    if limiter is not None:
+        print(f"   Rate limiter settled at {limiter}")
+    print(f"   Index: {os.path.join(output_dir, INDEX_NAME)}")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m audio_pipeline.narration", description=__doc__.split("\n\n")[0])
+    parser.add_argument("source", help="plain-text document, e.g. content/lessons/contract-sovereignty.en.txt")
+    parser.add_argument("--output-dir", help=f"where sections go (default: {DEFAULT_OUTPUT_DIR}/<document name>)")
+    parser.add_argument("--outline", action="store_true", help="print what would be spoken and exit")
+    parser.add_argument("--ahead", type=int, default=DEFAULT_AHEAD, help="pieces rendered ahead of the writer")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel TTS requests")
+    parser.add_argument("--retries", type=int, default=2, help="retries per piece")
+    parser.add_argument("--backoff", type=float, default=1.0, help="base backoff delay in seconds")
+    parser.add_argument("--max-chunk-chars", type=int, default=DEFAULT_MAX_CHARS,
+                        help="split longer paragraphs into separate requests (0 = never split)")
+    parser.add_argument("--sentence-gap-ms", type=int, default=DEFAULT_GAP_MS,
+                        help="silence between the pieces of a split paragraph")
+    add_engine_arguments(parser, "edge")
+    add_cache_arguments(parser)
+    add_ratelimit_arguments(parser)
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.source):
+        print(f"Error: no such document: {args.source}")
+        return 1
+    if args.outline:
+        print_outline(args.source)
+        return 0
+    tts = engine_from_args(args)
+    print(f"🎙  Narrating {args.source}")
+    print(f"Voice: {tts}")
+    return 0 if asyncio.run(narrate_document(args.source, tts, args)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+Quiz question audio in bulk.
+
+public/data/questions/lessonN.json holds a lesson's quiz; every question and
+its correct answer become a short clip next to the files VoiceQuiz already
+plays:
+
+    public/audio/questions/lesson8/question1.mp3   "Question 1. <question>"
+    public/audio/questions/lesson8/answer1.mp3     "<correct_answer>"
+    public/audio/questions/lesson8/manifest.json
+
+A clip is a second or two of speech, so one provider request per clip spends
+more time on the handshake than on synthesis (Edge TTS opens a fresh
+websocket for every request and closes it afterwards). Instead, clips are
+packed: a worker sends up to `--batch-chars` of consecutive clips as one
+request, separated by paragraph breaks, and cuts the returned MP3 apart at
+frame boundaries halfway through each pause, using the WordBoundary events
+to find them. Nothing is re-encoded. A batch whose boundaries don't line up
+with its clips is redone one clip per request. Engines without word
+boundaries (gtts) always go one clip per request.
+
+`--workers` tasks pull batches from a shared queue through the usual
+adaptive rate limiter, so throughput is bounded by the provider. Clips are
+cached by text in the TTS cache, and the manifest (sourceHash per clip, as in
+manifest.py) means a rerun only synthesizes questions that changed.
+"""
+
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+
+from . import mp3
+from .cache import TTSCache, cache_from_args
+from .fsutil import atomic_write_bytes
+from .manifest import MANIFEST_NAME
+from .ratelimit import limiter_for
+from .scheduler import RetryPolicy
+from .timing import align_words
+
+DEFAULT_QUESTIONS_DIR = "public/data/questions"
+DEFAULT_OUTPUT_DIR = "public/audio/questions"
+DEFAULT_BATCH_CHARS = 2500  # stays under Edge TTS's own split size, so a batch is one websocket
+DEFAULT_BATCH_CLIPS = 24
+SEPARATOR = "\n\n"
+
+_LESSON = re.compile(r"lesson(\d+)\.json$")
+
+
+@dataclass
+class Clip:
+    lesson: int
+    filename: str
+    text: str
+    output_path: str
+    source_hash: str = None
+
+    @property
+    def label(self):
+        return f"questions/lesson{self.lesson}/{self.filename}"
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def find_question_files(questions_dir=DEFAULT_QUESTIONS_DIR):
+    """{lesson: path} for every lessonN.json."""
+    found = {}
+    for path in glob.glob(os.path.join(questions_dir, "lesson*.json")):
+        match = _LESSON.search(os.path.basename(path))
+        if match:
+            found[int(match.group(1))] = path
+    return found
+
+
+def load_clips(path, lesson, output_dir, answers=True):
+    """The clips for one questions file, in playback order."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    lesson_dir = os.path.join(output_dir, f"lesson{lesson}")
+    clips = []
+    for number, question in enumerate(data.get("questions", []), start=1):
+        texts = [(f"question{number}.mp3", f"Question {number}. {question['question']}")]
+        if answers and question.get("correct_answer"):
+            texts.append((f"answer{number}.mp3", question["correct_answer"]))
+        for filename, text in texts:
+            clips.append(Clip(lesson, filename, text.strip(), os.path.join(lesson_dir, filename)))
+    return data.get("lessonTitle", ""), clips
+
+
+class QuestionsManifest:
+    """public/audio/questions/lessonN/manifest.json: one entry per clip this tool wrote."""
+
+    def __init__(self, lesson_dir, lesson_id, title=""):
+        self.lesson_dir = lesson_dir
+        self.path = os.path.join(lesson_dir, MANIFEST_NAME)
+        self.lesson_id = lesson_id
+        self.title = title
+        self.clips = {}
+
+    @classmethod
+    def load(cls, lesson_dir, lesson_id, title=""):
+        manifest = cls(lesson_dir, lesson_id, title)
+        try:
+            with open(manifest.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return manifest
+        manifest.clips = {info["file"]: info for info in data.get("clips", [])}
+        return manifest
+
+    def is_current(self, clip):
+        info = self.clips.get(clip.filename)
+        if not info or info.get("sourceHash") != clip.source_hash:
+            return False
+        try:
+            return os.path.getsize(clip.output_path) == info["bytes"]
+        except OSError:
+            return False
+
+    def record(self, clip, data, packed):
+        self.clips[clip.filename] = {
+            "file": clip.filename,
+            "text": clip.text,
+            "sourceHash": clip.source_hash,
+            "outputHash": hashlib.sha256(data).hexdigest(),
+            "bytes": len(data),
+            "durationSec": round(mp3.duration(data), 3),
+            "packed": packed,
+            "generatedAt": _now(),
+        }
+
+    def prune(self, current):
+        """Delete clips this manifest wrote that the questions file no longer has."""
+        removed = []
+        for filename in sorted(set(self.clips) - set(current)):
+            try:
+                os.unlink(os.path.join(self.lesson_dir, filename))
+            except FileNotFoundError:
+                pass
+            del self.clips[filename]
+            removed.append(os.path.join(self.lesson_dir, filename))
+        return removed
+
+    def save(self, engine, voice, rate):
+        clips = sorted(self.clips.values(), key=lambda c: (int(re.sub(r"\D", "", c["file"]) or 0),
+                                                        not c["file"].startswith("question")))
+        data = {
+            "lessonId": self.lesson_id,
+            "lessonTitle": self.title,
+            "engine": engine,
+            "voice": voice,
+            "rate": rate,
+            "clips": clips,
+            "totalDurationSec": round(sum(c["durationSec"] for c in clips), 3),
+            "updatedAt": _now(),
+        }
+        atomic_write_bytes(self.path, (json.dumps(data, ensure_ascii=False, indent=2) + "\n").encode("utf-8"))
+
+
+def pack(clips, max_chars=DEFAULT_BATCH_CHARS, max_clips=DEFAULT_BATCH_CLIPS):
+    """Consecutive runs of clips totalling at most `max_chars` (a longer clip goes alone)."""
+    batches, current, size = [], [], 0
+    for clip in clips:
+        if current and (size + len(SEPARATOR) + len(clip.text) > max_chars or len(current) == max_clips):
+            batches.append(current)
+            current, size = [], 0
+        size += (len(SEPARATOR) if current else 0) + len(clip.text)
+        current.append(clip)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_packed(audio, boundaries, texts):
+    """
+    Cut the MP3 for SEPARATOR.join(texts) into one MP3 per text, at the frame
+    nearest the middle of each pause. Raises ValueError if the word
+    boundaries can't be matched to the texts.
+    """
+    joined = SEPARATOR.join(texts)
+    starts, position = [], 0
+    for text in texts:
+        starts.append(position)
+        position += len(text) + len(SEPARATOR)
+    spans = [None] * len(texts)  # (first word start, last word end) in ms
+    clip = 0
+    for start_ms, duration_ms, char_start, _ in align_words(joined, boundaries):
+        if char_start >= 0:
+            while clip + 1 < len(texts) and char_start >= starts[clip + 1]:
+                clip += 1
+        first, last = spans[clip] or (start_ms, start_ms)
+        spans[clip] = (first, max(last, start_ms + duration_ms))
+    if any(span is None for span in spans):
+        raise ValueError("no word boundaries for some of the packed texts")
+    cuts = [0.0]
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        if start < end:
+            raise ValueError("packed texts overlap in time")
+        cuts.append((end + start) / 2000)
+    cuts.append(float("inf"))
+
+    frames = mp3.audio_frames(audio)
+    if not frames:
+        raise ValueError("no MPEG frames in the packed response")
+    parts, clock, index = [bytearray() for _ in texts], 0.0, 0
+    for frame in frames:
+        while clock >= cuts[index + 1]:
+            index += 1
+        parts[index].extend(audio[frame.offset:frame.offset + frame.length])
+        clock += frame.duration
+    if not all(parts):
+        raise ValueError("a packed text got no audio frames")
+    return [bytes(part) for part in parts]
+
+
+async def _collect(stream, text):
+    audio, boundaries = bytearray(), []
+    async for chunk in stream(text):
+        if chunk["type"] == "audio":
+            audio.extend(chunk["data"])
+        elif chunk["type"] == "WordBoundary":
+            boundaries.append(chunk)
+    if not audio:
+        raise RuntimeError("TTS stream ended without audio")
+    return bytes(audio), boundaries
+
+
+class QuestionBatcher:
+    """Worker tasks that turn batches of clips into published MP3s."""
+
+    def __init__(self, tts, cache=None, limiter=None, workers=4, retry=None, timeout=120):
+        self.tts = tts
+        self.cache = cache
+        self.stream = limiter.wrap(tts.stream) if limiter is not None else tts.stream
+        self.workers = max(1, workers)
+        self.retry = retry or RetryPolicy(retries=2)
+        self.timeout = timeout
+        self.variant = f"{tts.name};packed" if tts.word_boundaries else tts.name
+        self.requests = 0
+        self.fallbacks = 0
+        self.cached = 0
+        self.failed = []
+
+    def cache_key(self, clip):
+        return TTSCache.key(clip.text, self.variant, self.tts.voice, self.tts.rate)
+
+    async def _attempt(self, text):
+        for attempt in range(self.retry.retries + 1):
+            self.requests += 1
+            try:
+                return await asyncio.wait_for(_collect(self.stream, text), self.timeout)
+            except Exception:
+                if attempt == self.retry.retries:
+                    raise
+            await asyncio.sleep(self.retry.delay(attempt))
+
+    async def render(self, batch):
+        """[(clip, mp3 bytes)] for a batch: one request if it splits cleanly, else one per clip."""
+        if len(batch) > 1:
+            audio, boundaries = await self._attempt(SEPARATOR.join(clip.text for clip in batch))
+            try:
+                return list(zip(batch, split_packed(audio, boundaries, [clip.text for clip in batch])))
+            except ValueError as exc:
+                self.fallbacks += 1
+                print(f"   ↻ {len(batch)} clips from {batch[0].label} didn't split ({exc}); one request each")
+        rendered = []
+        for clip in batch:
+            audio, _ = await self._attempt(clip.text)
+            rendered.append((clip, mp3.strip_to_frames(audio)))
+        return rendered
+
+    async def _worker(self, queue, on_clip):
+        while True:
+            try:
+                batch = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                rendered = await self.render(batch)
+            except Exception as exc:
+                error = str(exc) or type(exc).__name__
+                for clip in batch:
+                    self.failed.append((clip, error))
+                    print(f"   ✗ {clip.label}: {error}")
+                continue
+            for clip, data in rendered:
+                atomic_write_bytes(clip.output_path, data)
+                if self.cache:
+                    self.cache.put(self.cache_key(clip), data, {"engine": self.variant, "voice": self.tts.voice,
+                                                                "rate": self.tts.rate, "chars": len(clip.text)})
+                on_clip(clip, data, len(batch) > 1)
+
+    async def run(self, clips, on_clip, max_chars=DEFAULT_BATCH_CHARS, max_clips=DEFAULT_BATCH_CLIPS):
+        """Synthesize `clips`, calling `on_clip(clip, data, packed)` as each one is published."""
+        todo = []
+        for clip in clips:
+            cached = self.cache.get(self.cache_key(clip)) if self.cache else None
+            if cached is None:
+                todo.append(clip)
+                continue
+            if not os.path.exists(clip.output_path) or os.path.getsize(clip.output_path) != len(cached):
+                atomic_write_bytes(clip.output_path, cached)
+            self.cached += 1
+            on_clip(clip, cached, False)
+        if not self.tts.word_boundaries:
+            max_clips = 1
+        queue = asyncio.Queue()
+        for batch in pack(todo, max_chars, max_clips):
+            queue.put_nowait(batch)
+        await asyncio.gather(*(self._worker(queue, on_clip) for _ in range(self.workers)))
+
+
+async def generate_questions(lessons, tts, args):
+    """Build the question clips for `lessons` ({lesson: questions json path}). Returns True if none failed."""
+    started = time.perf_counter()
+    manifests, todo, unchanged = {}, [], 0
+    for lesson, path in sorted(lessons.items()):
+        title, clips = load_clips(path, lesson, args.output_dir, not args.no_answers)
+        lesson_dir = os.path.join(args.output_dir, f"lesson{lesson}")
+        manifest = QuestionsManifest.load(lesson_dir, lesson, title)
+        manifest.title = title
+        manifests[lesson] = (manifest, {clip.filename for clip in clips})
+        for clip in clips:
+            clip.source_hash = TTSCache.key(clip.text, tts.name, tts.voice, tts.rate)
+            if not args.force and manifest.is_current(clip):
+                unchanged += 1
+            else:
+                todo.append(clip)
+    print(f"   {unchanged} unchanged, generating {len(todo)} clips with {args.workers} workers "
+          f"(up to {args.batch_chars} characters per request)")
+
+    limiter = None if args.no_rate_limit else limiter_for(tts.name, args.rate_profile)
+    batcher = QuestionBatcher(tts, cache_from_args(args), limiter, args.workers,
+                              RetryPolicy(args.retries, args.backoff), args.timeout)
+
+    def on_clip(clip, data, packed):
+        manifests[clip.lesson][0].record(clip, data, packed)
+
+    await batcher.run(todo, on_clip, args.batch_chars)
+    for lesson, (manifest, current) in sorted(manifests.items()):
+        for path in manifest.prune(current):
+            print(f"   🗑  Pruned {path}")
+        manifest.save(tts.name, tts.voice, tts.rate)
+
+    elapsed = time.perf_counter() - started
+    built = len(todo) - len(batcher.failed)
+    print(f"\n   {built} clips in {elapsed:.1f}s ({built / elapsed if elapsed else 0:.1f}/s): "
+          f"{batcher.requests} provider requests, {batcher.cached} from cache, "
+          f"{batcher.fallbacks} batches redone per clip, {len(batcher.failed)} failed")
+    if limiter is not None:
+        print(f"   Rate limiter settled at {limiter}")
+    return not batcher.failed
+
+
+def add_questions_arguments(parser):
+    parser.add_argument("--questions-dir", default=DEFAULT_QUESTIONS_DIR, help="where the lessonN.json quizzes are")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=4, help="parallel provider requests")
+    parser.add_argument("--batch-chars", type=int, default=DEFAULT_BATCH_CHARS,
+                        help="characters of consecutive clips packed into one request (0 = one clip per request)")
+    parser.add_argument("--no-answers", action="store_true", help="only the questions, not the answers")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds per request")
+    parser.add_argument("--force", action="store_true", help="regenerate clips even if the manifest says they are current")
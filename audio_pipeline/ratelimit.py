@@ -0,0 +1,180 @@
+"""
+Adaptive rate limiting for TTS provider calls.
+
+One AdaptiveLimiter is shared by every call a run makes to a provider. It
+combines a token bucket (requests per second) with a concurrency window, and
+tunes both with AIMD like TCP congestion control: every full window of
+successful calls raises the limits additively, and a throttling response
+(HTTP 429/503, a refused websocket handshake, ...) cuts them multiplicatively.
+Batch runs therefore settle near the highest throughput the provider accepts,
+without hand-tuned sleeps.
+"""
+
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+
+from .telemetry import span
+
+THROTTLE_STATUSES = {429, 503}
+_THROTTLE_HINTS = ("429", "503", "too many requests", "rate limit", "service unavailable", "throttl")
+_WEBSOCKET_ERRORS = ("WebSocketError", "WSServerHandshakeError", "ConnectionResetError", "ServerDisconnectedError")
+
+
+@dataclass
+class LimiterProfile:
+    rate: float             # starting requests per second
+    concurrency: int        # starting concurrent calls
+    min_rate: float = 0.2
+    max_rate: float = 50.0
+    min_concurrency: int = 1
+    max_concurrency: int = 32
+    rate_step: float = 0.5  # additive increase per successful window
+    backoff: float = 0.5    # multiplicative decrease on throttling
+
+
+# The PHP ElevenLabs path (elevenlabs_tts.php / audio_generator.php) keeps its
+# own request loop; the profile is here for Python callers of the same API.
+PROVIDER_PROFILES = {
+    "edge": LimiterProfile(rate=8.0, concurrency=6, max_rate=40.0, max_concurrency=16),
+    "gtts": LimiterProfile(rate=2.0, concurrency=3, max_rate=8.0, max_concurrency=8),
+    "elevenlabs": LimiterProfile(rate=1.0, concurrency=2, max_rate=5.0, max_concurrency=5),
+    "local": LimiterProfile(rate=1000.0, concurrency=64, max_rate=1000.0, max_concurrency=256),
+}
+
+
+def is_throttle(exc):
+    """Best-effort check whether `exc` means "slow down" rather than a real failure."""
+    for candidate in (exc, getattr(exc, "__cause__", None), getattr(exc, "rsp", None)):
+        if candidate is None:
+            continue
+        status = getattr(candidate, "status", None) or getattr(candidate, "status_code", None)
+        if status in THROTTLE_STATUSES:
+            return True
+    if any(name in type(exc).__name__ for name in _WEBSOCKET_ERRORS):
+        return True
+    message = str(exc).lower()
+    return any(hint in message for hint in _THROTTLE_HINTS)
+
+
+class AdaptiveLimiter:
+    def __init__(self, profile, name="tts"):
+        self.name = name
+        self.profile = profile
+        self.rate = profile.rate
+        self.limit = profile.concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.throttles = 0
+        self._tokens = 1.0
+        self._refilled = time.monotonic()
+        self._last_decrease = -math.inf
+        self._window = 0
+        self._concurrency_bound = False  # did callers actually hit each limit this window?
+        self._rate_bound = False
+        self._changed = asyncio.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        burst = max(1.0, self.rate)
+        self._tokens = min(burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    async def acquire(self):
+        """Wait for a concurrency slot and a token. Returns a ticket to pass to release()."""
+        with span("rate_limit_wait"):
+            return await self._acquire()
+
+    async def _acquire(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self._concurrency_bound = True
+        try:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return time.monotonic()
+                self._rate_bound = True
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+        except BaseException:
+            await self._release()
+            raise
+
+    async def _release(self):
+        async with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    async def release(self, ticket, ok=True, exc=None):
+        """
+        Return a slot. `ok` means the call completed; `exc` is what it failed
+        with, if anything. Only calls started after the last decrease can
+        trigger another one, so one burst of 429s halves the limits once.
+        """
+        p = self.profile
+        if ok:
+            self.successes += 1
+            self._window += 1
+            if self._window >= self.limit:
+                # Only grow a limit that was actually in the way.
+                if self._concurrency_bound:
+                    self.limit = min(p.max_concurrency, self.limit + 1)
+                if self._rate_bound:
+                    self.rate = min(p.max_rate, self.rate + p.rate_step)
+                self._window = 0
+                self._concurrency_bound = self._rate_bound = False
+        elif exc is not None and is_throttle(exc):
+            self.throttles += 1
+            if ticket > self._last_decrease:
+                self._last_decrease = time.monotonic()
+                self._window = 0
+                self.limit = max(p.min_concurrency, int(self.limit * p.backoff))
+                self.rate = max(p.min_rate, self.rate * p.backoff)
+                self._tokens = 0.0
+        await self._release()
+
+    def wrap(self, stream):
+        """Wrap a `stream(text)` chunk-stream factory so every call goes through the limiter."""
+        async def limited(text):
+            ticket = await self.acquire()
+            ok, error = False, None
+            try:
+                async for chunk in stream(text):
+                    yield chunk
+                ok = True
+            except Exception as exc:
+                error = exc
+                raise
+            finally:
+                await self.release(ticket, ok, error)
+        return limited
+
+    def snapshot(self):
+        return {
+            "provider": self.name,
+            "rate": round(self.rate, 2),
+            "concurrency": self.limit,
+            "inFlight": self.in_flight,
+            "successes": self.successes,
+            "throttles": self.throttles,
+        }
+
+    def __str__(self):
+        s = self.snapshot()
+        return (f"{s['provider']}: {s['rate']} req/s, concurrency {s['concurrency']} "
+                f"({s['successes']} ok, {s['throttles']} throttled)")
+
+
+def limiter_for(engine, profile_name=None):
+    name = profile_name or engine
+    return AdaptiveLimiter(PROVIDER_PROFILES.get(name, PROVIDER_PROFILES["edge"]), name)
+
+
+def add_ratelimit_arguments(parser):
+    parser.add_argument("--rate-profile", choices=sorted(PROVIDER_PROFILES),
+                        help="provider limits to start from (default: the engine's own)")
+    parser.add_argument("--no-rate-limit", action="store_true", help="call the provider without the adaptive limiter")
@@ -0,0 +1,146 @@
+"""
+The generation loop shared by the generator scripts.
+
+A script builds its SynthesisJobs, picks a TTS engine (see engines.py) and
+calls `generate()`. That plans against the lesson manifests, skips what a
+resumed run already finished, runs the rest through the scheduler (cache,
+rate limiter, retries, journal) and saves the manifests and the word-timing
+indexes (timing.py).
+"""
+
+import functools
+import time
+
+from .bgmix import add_bgmix_arguments, mix_lessons
+from .cache import add_cache_arguments, cache_from_args, stream_cached
+from .chunking import add_chunking_arguments, cache_variant, chunked_stream
+from .engines import add_engine_arguments
+from .journal import JobJournal, add_journal_arguments, default_journal_path
+from .ladder import add_ladder_arguments, build_ladders, rendition_cache
+from .manifest import add_manifest_arguments, finish_lessons, plan_lessons
+from .ratelimit import add_ratelimit_arguments, limiter_for
+from .sentences import SentenceStore, add_sentence_arguments, plan_dedup, sentence_variant
+from .scheduler import JobResult, RetryPolicy, print_result, print_retry, print_summary, run_jobs
+from .sprite import SPRITE_NAME, add_sprite_arguments, build_sprite, lesson_slide_files
+from .telemetry import add_telemetry_arguments, telemetry_from_args
+from .timing import write_lesson_timing, write_slide_timing
+
+
+def add_run_arguments(parser, engine="edge", concurrency=6, timeout=120):
+    add_engine_arguments(parser, engine)
+    parser.add_argument("--concurrency", type=int, default=concurrency, help="parallel TTS requests")
+    parser.add_argument("--timeout", type=float, default=timeout, help="seconds per slide attempt")
+    add_cache_arguments(parser)
+    add_manifest_arguments(parser)
+    add_journal_arguments(parser)
+    add_chunking_arguments(parser)
+    add_sentence_arguments(parser)
+    add_ratelimit_arguments(parser)
+    add_telemetry_arguments(parser)
+    add_sprite_arguments(parser)
+    add_ladder_arguments(parser)
+    add_bgmix_arguments(parser)
+
+
+def slide_variant(engine, args):
+    """
+    text -> the engine label a slide is cached and manifested under, given how
+    `args` builds it (chunk size and pauses, or sentence clips).
+    """
+    if getattr(args, "sentence_cache", False):
+        label = sentence_variant(engine, args.sentence_gap_ms, args.paragraph_gap_ms)
+        return lambda text: label
+    return lambda text: cache_variant(engine, text, args.max_chunk_chars, args.sentence_gap_ms)
+
+
+async def synthesize_job(job, stream, cache, engine, voice, rate, args, sentences=None):
+    """Publish one slide (through the cache) and its timing sidecar. Returns StreamStats."""
+    if sentences is not None:
+        stats = await stream_cached(cache, job.text, job.output_path, sentences.variant, voice, rate,
+                                    lambda: sentences.slide_stream(job.text))
+    else:
+        variant = cache_variant(engine, job.text, args.max_chunk_chars, args.sentence_gap_ms)
+        stats = await stream_cached(
+            cache, job.text, job.output_path, variant, voice, rate,
+            lambda: chunked_stream(job.text, stream, args.max_chunk_chars, args.sentence_gap_ms,
+                                   args.chunk_concurrency, RetryPolicy(args.retries, args.backoff)))
+    write_slide_timing(job, stats.boundaries)
+    return stats
+
+
+async def generate(jobs, tts, args, script_path, lesson_slides=None):
+    """
+    Build every job that needs building with the TTSEngine `tts`. Returns
+    (ok, results, unchanged) where `results` covers generated and resumed
+    slides in (lesson, slide) order. Pass `lesson_slides` ({lesson: all
+    slide numbers}) when `jobs` is a selection, so the rest isn't pruned.
+    """
+    engine, voice, rate, stream = tts.name, tts.voice, tts.rate, tts.stream
+    manifests, todo, unchanged = plan_lessons(jobs, engine, voice, rate, args.force, slide_variant(engine, args))
+    journal = JobJournal(args.journal or default_journal_path(script_path), resume=args.resume)
+    todo, resumed = journal.split(todo)
+    print(f"   {len(unchanged)} unchanged, {len(resumed)} resumed, generating {len(todo)} "
+          f"(concurrency {args.concurrency})")
+
+    def on_result(result):
+        journal.record_result(result)
+        print_result(result)
+
+    def on_retry(job, attempt, error, delay):
+        journal.record_retry(job, attempt, error, delay)
+        print_retry(job, attempt, error, delay)
+
+    limiter = None
+    if not args.no_rate_limit:
+        limiter = limiter_for(engine, args.rate_profile)
+        stream = limiter.wrap(stream)
+    cache = cache_from_args(args)
+    sentences = None
+    if args.sentence_cache:
+        dedup = plan_dedup(job.text for job in todo)
+        print(dedup.plan_report())
+        sentences = SentenceStore(cache, stream, engine, voice, rate, args.concurrency,
+                                  RetryPolicy(args.retries, args.backoff),
+                                  args.sentence_gap_ms, args.paragraph_gap_ms, stats=dedup)
+    worker = functools.partial(synthesize_job, stream=stream, cache=cache, engine=engine,
+                               voice=voice, rate=rate, args=args, sentences=sentences)
+    telemetry = telemetry_from_args(args, engine, script_path)
+    started = time.perf_counter()
+    try:
+        results = await run_jobs(todo, worker, args.concurrency, args.timeout, on_result=on_result,
+                                 retry=RetryPolicy(args.retries, args.backoff), on_retry=on_retry,
+                                 telemetry=telemetry)
+    finally:
+        journal.close()
+        if telemetry is not None:
+            telemetry.close()
+    ok = print_summary(results, time.perf_counter() - started)
+    if telemetry is not None and results:
+        print(telemetry.summary())
+        print(f"   Metrics: {telemetry.events_path}, {telemetry.prom_path}")
+    if sentences is not None:
+        print(sentences.stats.report())
+    if limiter is not None:
+        print(f"   Rate limiter settled at {limiter}")
+    if journal.dead:
+        print(f"   Dead-lettered jobs written to {journal.path}.dead.json; rerun with --resume")
+
+    results = sorted(results + [JobResult(job, True, 0.0, value="resumed") for job in resumed],
+                     key=lambda r: r.job.key)
+    for path in finish_lessons(manifests, jobs, results, engine, voice, rate, prune=not args.no_prune,
+                               lesson_slides=lesson_slides):
+        print(f"   🗑  Pruned {path}")
+    for manifest in manifests.values():
+        write_lesson_timing(manifest)
+        if args.sprite:
+            index = build_sprite(manifest.lesson_dir, manifest.lesson_id, lesson_slide_files(manifest.lesson_dir))
+            if index is not None:
+                print(f"   🎞  {manifest.lesson_dir}/{SPRITE_NAME}: {len(index['slides'])} slides, "
+                      f"{index['bytes'] / 1e6:.1f} MB")
+    if args.ladder:
+        lessons = [(m.lesson_dir, m.lesson_id, None) for _, m in sorted(manifests.items())]
+        renditions = rendition_cache(args.cache_dir, args.ladder_cache_mb) if cache else None
+        ok = build_ladders(lessons, args.ladder, renditions, args.ladder_workers) and ok
+    if args.bg_music:
+        ok = mix_lessons([m.lesson_dir for _, m in sorted(manifests.items())], args.bg_music, args.bg_workers) and ok
+    return ok, results, unchanged
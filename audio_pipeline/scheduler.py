@@ -0,0 +1,135 @@
+"""
+Bounded-concurrency scheduler for TTS synthesis jobs.
+
+All (lesson, slide) jobs are started at once; an asyncio.Semaphore keeps at
+most `concurrency` of them talking to the provider, and each job gets its own
+timeout. Results come back sorted by (lesson, slide) no matter which job
+finished first, so progress output and manifests stay stable between runs.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+
+from .telemetry import add_span
+
+
+@dataclass
+class SynthesisJob:
+    lesson: int
+    slide: int
+    text: str
+    output_path: str
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def key(self):
+        return (self.lesson, self.slide)
+
+    @property
+    def label(self):
+        return f"lesson{self.lesson}/slide{self.slide}.mp3"
+
+
+@dataclass
+class JobResult:
+    job: SynthesisJob
+    ok: bool
+    elapsed: float  # time spent inside worker calls, excluding queueing and backoff
+    error: str = None
+    value: object = None
+    attempts: int = 1
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff: attempt n waits uniform(0, min(max_delay, base_delay * 2**n))."""
+    retries: int = 0
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+async def run_jobs(jobs, worker, concurrency=4, timeout=120.0, on_result=None,
+                   retry=None, on_retry=None, telemetry=None):
+    """
+    Run `await worker(job)` for every job with at most `concurrency` in flight.
+
+    Each attempt gets `timeout` seconds. A failed attempt is retried according
+    to `retry` (a RetryPolicy), calling `on_retry(job, attempt, error, delay)`
+    first; the job's concurrency slot is released while it backs off. A job
+    that runs out of attempts is reported as failed and never cancels the
+    others. `on_result(result)` is called as each job finishes (completion
+    order), the returned list is in (lesson, slide) order. With `telemetry`
+    (a telemetry.Telemetry) every job is traced from queueing to its result.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    retry = retry or RetryPolicy()
+
+    async def attempt(job):
+        queued = time.perf_counter()
+        async with semaphore:
+            started = time.perf_counter()
+            add_span("queue_wait", started - queued)
+            try:
+                ok, value = True, await asyncio.wait_for(worker(job), timeout=timeout)
+            except asyncio.TimeoutError:
+                ok, value = False, f"timed out after {timeout:.0f}s"
+            except Exception as exc:
+                ok, value = False, f"{type(exc).__name__}: {exc}"
+            return ok, value, time.perf_counter() - started
+
+    async def run_one(job):
+        trace = telemetry.start(job) if telemetry is not None else None
+        busy = 0.0
+        for n in range(retry.retries + 1):
+            ok, value, seconds = await attempt(job)
+            busy += seconds
+            if ok:
+                result = JobResult(job, True, busy, value=value, attempts=n + 1)
+                break
+            if n == retry.retries:
+                result = JobResult(job, False, busy, error=value, attempts=n + 1)
+                break
+            delay = retry.delay(n)
+            if on_retry is not None:
+                on_retry(job, n + 1, value, delay)
+            if telemetry is not None:
+                telemetry.retry(job, n + 1, value, delay)
+            await asyncio.sleep(delay)
+            add_span("backoff", delay)
+        if trace is not None:
+            telemetry.finish(trace, result)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    results = await asyncio.gather(*(run_one(job) for job in jobs))
+    return sorted(results, key=lambda r: r.job.key)
+
+
+def print_result(result):
+    """Default progress line, in the same style the generators always used."""
+    if result.ok:
+        note = f", {result.value}" if result.value is not None else ""
+        print(f"    ✓ Saved {result.job.output_path} ({result.elapsed:.1f}s{note})")
+    else:
+        print(f"    ✗ Failed {result.job.label} after {result.attempts} attempt(s): {result.error}")
+
+
+def print_retry(job, attempt, error, delay):
+    print(f"    ↻ {job.label} attempt {attempt} failed ({error}), retrying in {delay:.1f}s")
+
+
+def print_summary(results, wall_time):
+    failed = [r for r in results if not r.ok]
+    busy = sum(r.elapsed for r in results)
+    cached = sum(1 for r in results if getattr(r.value, "status", r.value) == "cached")
+    print(f"\n   {len(results) - len(failed)}/{len(results)} slides in {wall_time:.1f}s "
+          f"(serial estimate {busy:.1f}s, {cached} from cache)")
+    for r in failed:
+        print(f"   ✗ {r.job.label}: {r.error}")
+    return not failed
@@ -0,0 +1,139 @@
+"""
+Sentence-granularity synthesis store.
+
+Much of the narration repeats: lesson 4 exists in two generators, and lessons
+5 and 6 share whole definitions ("Human activity is activity aimed at
+achieving goals without using violence", the praxeology paragraphs, ...).
+In sentence mode every slide is split into sentences, each unique normalized
+sentence is rendered once per engine/voice/rate and kept in the TTS cache,
+and slides are assembled from those clips at MPEG frame level. Concurrent
+slides asking for the same sentence share a single in-flight synthesis.
+
+Per-sentence synthesis loses a little cross-sentence prosody, so this is an
+opt-in mode (--sentence-cache) rather than the default.
+"""
+
+import asyncio
+import re
+from dataclasses import dataclass
+
+from .cache import TTSCache, normalize_text
+from .chunking import DEFAULT_GAP_MS, SENTENCE_END, join_rendered, render
+from .scheduler import RetryPolicy
+
+DEFAULT_PARAGRAPH_GAP_MS = 600
+
+
+def split_sentences(text):
+    """[(sentence, starts_paragraph)] for every sentence in `text`."""
+    result = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        sentences = [s.strip() for s in SENTENCE_END.split(" ".join(paragraph.split())) if s.strip()]
+        result.extend((sentence, i == 0) for i, sentence in enumerate(sentences))
+    return result
+
+
+@dataclass
+class DedupStats:
+    sentences: int = 0
+    unique: int = 0
+    chars: int = 0
+    unique_chars: int = 0
+    synthesized: int = 0
+    synthesized_chars: int = 0
+
+    @property
+    def ratio(self):
+        """Sentence occurrences per unique sentence (1.0 = no repetition)."""
+        return self.sentences / self.unique if self.unique else 1.0
+
+    def plan_report(self):
+        return (f"   Sentences: {self.sentences} total, {self.unique} unique (dedup ratio {self.ratio:.2f}), "
+                f"{self.unique_chars}/{self.chars} chars need a clip")
+
+    def report(self):
+        saved = self.chars - self.synthesized_chars
+        return (f"   Sentence store: {self.synthesized} TTS calls, {self.synthesized_chars}/{self.chars} chars sent "
+                f"({saved} saved, {saved / self.chars:.0%})" if self.chars else "   Sentence store: nothing to do")
+
+
+def plan_dedup(texts):
+    """Dedup statistics for a set of slide texts before anything is synthesized."""
+    stats = DedupStats()
+    seen = set()
+    for text in texts:
+        for sentence, _ in split_sentences(text):
+            norm = normalize_text(sentence)
+            stats.sentences += 1
+            stats.chars += len(norm)
+            if norm not in seen:
+                seen.add(norm)
+                stats.unique += 1
+                stats.unique_chars += len(norm)
+    return stats
+
+
+def sentence_variant(engine, sentence_gap_ms=DEFAULT_GAP_MS, paragraph_gap_ms=DEFAULT_PARAGRAPH_GAP_MS):
+    """Engine label for whole-slide cache keys of slides assembled from sentence clips."""
+    return f"{engine};sentence;gap={sentence_gap_ms / 1000}/{paragraph_gap_ms / 1000}"
+
+
+class SentenceStore:
+    def __init__(self, cache, stream, engine, voice, rate, concurrency=4, retry=None,
+                 sentence_gap_ms=DEFAULT_GAP_MS, paragraph_gap_ms=DEFAULT_PARAGRAPH_GAP_MS, stats=None):
+        self.cache = cache  # None with --no-cache: nothing is read from or kept on disk
+        self.stream = stream
+        self.engine = f"{engine};sentence"
+        self.voice = voice
+        self.rate = rate
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.retry = retry or RetryPolicy(retries=2)
+        self.sentence_gap = sentence_gap_ms / 1000
+        self.paragraph_gap = paragraph_gap_ms / 1000
+        self.variant = sentence_variant(engine, sentence_gap_ms, paragraph_gap_ms)
+        self.stats = stats or DedupStats()  # usually plan_dedup() of the slides about to be built
+        self._inflight = {}
+
+    async def clip(self, sentence):
+        """(mp3_bytes, boundaries) for one sentence, synthesizing it at most once."""
+        norm = normalize_text(sentence)
+        key = TTSCache.key(norm, self.engine, self.voice, self.rate)
+        if key not in self._inflight:
+            task = asyncio.ensure_future(self._load_or_render(key, norm))
+            # The slide that started it may be cancelled; don't warn about an unread error.
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return await asyncio.shield(self._inflight[key])
+
+    async def _load_or_render(self, key, norm):
+        # Once this finishes the disk cache (if any) has the clip, or a failure
+        # must be retried by the next slide, so the in-flight entry is dropped.
+        try:
+            data = self.cache.get(key) if self.cache else None
+            if data is not None:
+                return data, (self.cache.metadata(key) or {}).get("boundaries", [])
+            data, boundaries = await render(norm, self.stream, self.semaphore, self.retry)
+            self.stats.synthesized += 1
+            self.stats.synthesized_chars += len(norm)
+            if self.cache:
+                self.cache.put(key, data, {"engine": self.engine, "voice": self.voice, "rate": self.rate,
+                                           "chars": len(norm), "text": norm, "boundaries": boundaries})
+            return data, boundaries
+        finally:
+            self._inflight.pop(key, None)
+
+    async def slide_stream(self, text):
+        """Chunk stream for a slide assembled from sentence clips."""
+        sentences = split_sentences(text)
+        gaps = [self.paragraph_gap if new_paragraph else self.sentence_gap
+                for _, new_paragraph in sentences[1:]]
+        async for chunk in join_rendered([self.clip(s) for s, _ in sentences], gaps):
+            yield chunk
+
+
+def add_sentence_arguments(parser):
+    parser.add_argument("--sentence-cache", action="store_true",
+                        help="assemble slides from per-sentence clips shared across lessons")
+    parser.add_argument("--paragraph-gap-ms", type=int, default=DEFAULT_PARAGRAPH_GAP_MS,
+                        help="silence between paragraphs in --sentence-cache mode "
+                             "(--sentence-gap-ms is used between sentences)")
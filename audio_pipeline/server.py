@@ -0,0 +1,474 @@
+"""
+On-demand audio service.
+
+    python3 -m audio_pipeline.server [--port 8765] [--engine edge] [--memory-mb 64]
+
+Serves public/audio over HTTP at the URLs the app already uses
+(/audio/lesson6/slide3.mp3), so the player can point at it in development or
+on a preview box instead of depending on someone having run a generator:
+
+- files that exist are served with an ETag (If-None-Match -> 304) and
+  single-range Range support (206/416, If-Range honoured);
+- a slideN.mp3 that is missing, or whose script text changed since its
+  manifest entry was written, is synthesized on first request from the lesson
+  corpus (corpus.py). Bytes are streamed to the client as the provider
+  produces them, while the same stream is published atomically, stored in the
+  TTS cache and recorded in the lesson manifest and timing index, exactly as
+  a generator run would;
+- concurrent requests for one slide share a single synthesis;
+- a byte-bounded in-memory LRU of whole files sits in front of the disk and
+  is revalidated against (mtime, size) on every hit.
+
+Slides the manifest does not know (e.g. written by the JS generators) are
+served as they are. Only GET and HEAD are supported.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+
+from .cache import add_cache_arguments, cache_from_args, normalize_text, stream_cached
+from .chunking import add_chunking_arguments, cache_variant, chunked_stream
+from .corpus import DEFAULT_STORE_DIR, CorpusIndex
+from .engines import add_engine_arguments, engine_from_args
+from .manifest import MANIFEST_NAME, LessonManifest
+from .ratelimit import add_ratelimit_arguments, limiter_for
+from .scheduler import RetryPolicy, SynthesisJob
+from .timing import write_lesson_timing, write_slide_timing
+
+DEFAULT_PORT = 8765
+DEFAULT_MEMORY_MB = 64
+CORPUS_RECHECK_SECONDS = 2.0
+READ_CHUNK = 256 * 1024
+MAX_HEADER_LINES = 100
+
+_SLIDE_PATH = re.compile(r"^/audio/lesson(\d+)/slide(\d+)\.mp3$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+REASONS = {
+    200: "OK", 206: "Partial Content", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 416: "Range Not Satisfiable", 502: "Bad Gateway",
+}
+
+mimetypes.add_type("audio/ogg", ".opus")
+
+
+class MemoryLRU:
+    """Byte-bounded LRU of whole files, keyed by path and checked against (mtime, size)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry = max_bytes // 4  # a sprite must not flush every slide out
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> (fingerprint, data, etag)
+
+    def get(self, path, st):
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == (st.st_mtime_ns, st.st_size):
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1], entry[2]
+        self.misses += 1
+        return None
+
+    def put(self, path, st, data, etag):
+        self.discard(path)
+        if len(data) > self.max_entry:
+            return
+        self._entries[path] = ((st.st_mtime_ns, st.st_size), data, etag)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, (_, old, _) = self._entries.popitem(last=False)
+            self.size -= len(old)
+
+    def discard(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def __str__(self):
+        return (f"{len(self._entries)} files, {self.size / 1e6:.1f}/{self.max_bytes / 1e6:.0f} MB, "
+                f"{self.hits} hits, {self.misses} misses")
+
+
+def parse_range(header, size):
+    """
+    Half-open (start, end) for a single `bytes=` range of a `size`-byte body,
+    or None if the header should be ignored (malformed, multi-range). Raises
+    ValueError if the range can't be satisfied.
+    """
+    match = _RANGE.match(header.replace(" ", ""))
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        if int(last) == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - int(last)), size
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(f"range starts past {size} bytes")
+    return start, min(int(last) + 1, size) if last else size
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return os.fstat(f.fileno()), f.read()
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+
+class Synthesis:
+    """One in-flight synthesis of a slide; every request for it watches the same object."""
+
+    def __init__(self, job):
+        self.job = job
+        self.audio = bytearray()
+        self.done = False
+        self.error = None
+        self.stats = None
+        self.requests = 1
+        self.task = None
+        self._changed = asyncio.Condition()
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def tee(self, stream):
+        """Pass a chunk stream through, keeping a copy of its audio for the waiting clients."""
+        async for chunk in stream:
+            if chunk["type"] == "audio":
+                self.audio.extend(chunk["data"])
+                await self._notify()
+            yield chunk
+
+    async def finish(self, stats=None, error=None):
+        self.stats, self.error, self.done = stats, error, True
+        await self._notify()
+
+    async def wait(self, have):
+        """Wait until more than `have` bytes arrived or the synthesis ended."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.done or len(self.audio) > have)
+
+
+class AudioServer:
+    def __init__(self, tts, args, root="."):
+        self.tts = tts
+        self.args = args
+        self.root = root
+        self.base_dir = os.path.realpath(os.path.join(root, args.base_dir))
+        self.memory = MemoryLRU(int(args.memory_mb * 1024 * 1024))
+        self.cache = cache_from_args(args)
+        self.stream = tts.stream
+        self.limiter = None
+        if not args.no_rate_limit:
+            self.limiter = limiter_for(tts.name, args.rate_profile)
+            self.stream = self.limiter.wrap(self.stream)
+        self.retry = RetryPolicy(args.retries, args.backoff)
+        self.inflight = {}  # (lesson, slide) -> Synthesis
+        self.synthesized = 0
+        self.coalesced = 0
+        self._corpus = None
+        self._corpus_checked = 0.0
+        self._text_hashes = {}  # manifest path -> ((mtime_ns, size), {slide: textHash})
+
+    # -- corpus and staleness ------------------------------------------------
+
+    def corpus(self):
+        """The lesson corpus, reopened (and rebuilt if a script changed) at most every few seconds."""
+        now = time.monotonic()
+        if self._corpus is None or now - self._corpus_checked > CORPUS_RECHECK_SECONDS:
+            if self._corpus is not None:
+                self._corpus.close()
+            self._corpus = CorpusIndex.open(self.root, self.args.corpus_dir)
+            self._corpus_checked = now
+        return self._corpus
+
+    def slide_job(self, lesson, slide):
+        """SynthesisJob for a slide in the corpus, or None if there is no script for it."""
+        corpus = self.corpus()
+        if lesson not in corpus.lessons() or slide not in corpus.slides(lesson):
+            return None
+        output_path = os.path.join(self.base_dir, f"lesson{lesson}", f"slide{slide}.mp3")
+        return SynthesisJob(lesson, slide, corpus.text(lesson, slide), output_path)
+
+    def manifest_text_hashes(self, lesson_dir, lesson):
+        """
+        {slide: textHash} from the lesson's manifest. It is parsed again only
+        when its (mtime, size) changes, so requests for existing slides cost a
+        stat() rather than a JSON parse on the event loop.
+        """
+        path = os.path.join(lesson_dir, MANIFEST_NAME)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._text_hashes.pop(path, None)
+            return {}
+        fingerprint = (st.st_mtime_ns, st.st_size)
+        entry = self._text_hashes.get(path)
+        if entry is None or entry[0] != fingerprint:
+            manifest = LessonManifest.load(lesson_dir, lesson)
+            entry = fingerprint, {slide: info.get("textHash") for slide, info in manifest.slides.items()}
+            self._text_hashes[path] = entry
+        return entry[1]
+
+    def needs_synthesis(self, job):
+        """Missing, or the manifest recorded it for a different script text."""
+        if not os.path.exists(job.output_path):
+            return True
+        hashes = self.manifest_text_hashes(os.path.dirname(job.output_path), job.lesson)
+        if job.slide not in hashes:
+            return False
+        text_hash = hashlib.sha256(normalize_text(job.text).encode("utf-8")).hexdigest()
+        return hashes[job.slide] != text_hash
+
+    # -- synthesis -----------------------------------------------------------
+
+    def synthesis_for(self, job):
+        synthesis = self.inflight.get(job.key)
+        if synthesis is not None:
+            synthesis.requests += 1
+            self.coalesced += 1
+            return synthesis
+        synthesis = Synthesis(job)
+        self.inflight[job.key] = synthesis
+        synthesis.task = asyncio.ensure_future(self._synthesize(synthesis))
+        return synthesis
+
+    async def _synthesize(self, synthesis):
+        """Runs detached from any one request, so a client hanging up doesn't cancel it."""
+        job, tts, args = synthesis.job, self.tts, self.args
+        print(f"   🎙  {job.label}: synthesizing ({len(job.text)} chars)")
+        variant = cache_variant(tts.name, job.text, args.max_chunk_chars, args.sentence_gap_ms)
+        stats = error = None
+        for attempt in range(self.retry.retries + 1):
+            try:
+                stats = await asyncio.wait_for(stream_cached(
+                    self.cache, job.text, job.output_path, variant, tts.voice, tts.rate,
+                    lambda: synthesis.tee(chunked_stream(job.text, self.stream, args.max_chunk_chars,
+                                                         args.sentence_gap_ms, args.chunk_concurrency,
+                                                         self.retry))), args.timeout)
+                self._record(job, stats, variant)
+                error = None
+                break
+            except Exception as exc:
+                error = str(exc) or type(exc).__name__
+                if synthesis.audio or attempt == self.retry.retries:
+                    break  # bytes already went out: a retry can't be spliced onto them
+                await asyncio.sleep(self.retry.delay(attempt))
+        del self.inflight[job.key]
+        if error is None:
+            self.synthesized += 1
+            print(f"   ✓ {job.label}: {stats} ({synthesis.requests} request(s))")
+        else:
+            print(f"   ✗ {job.label}: {error}")
+        await synthesis.finish(stats, error)
+
+    def _record(self, job, stats, variant):
+        write_slide_timing(job, stats.boundaries)
+        job.meta["sourceHash"] = LessonManifest.source_hash(job.text, variant, self.tts.voice, self.tts.rate)
+        manifest = LessonManifest.load(os.path.dirname(job.output_path), job.lesson)
+        manifest.record(job, self.tts.name, self.tts.voice, self.tts.rate)
+        manifest.save()
+        write_lesson_timing(manifest)
+        self.memory.discard(job.output_path)
+
+    # -- HTTP ----------------------------------------------------------------
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers = request
+                keep_alive = await self.respond(writer, method, path, headers)
+                await writer.drain()
+                if not keep_alive or headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError:
+            return None
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method, target.split("?", 1)[0], headers
+
+    @staticmethod
+    def _head(writer, status, headers=(), length=None):
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}", f"Date: {formatdate(usegmt=True)}",
+                 "Server: audio_pipeline"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    def _error(self, writer, status, message=""):
+        body = f"{status} {REASONS[status]}\n{message}\n".encode("utf-8")
+        self._head(writer, status, [("Content-Type", "text/plain; charset=utf-8")], len(body))
+        writer.write(body)
+        return True
+
+    def _resolve(self, path):
+        if not path.startswith("/audio/"):
+            return None
+        full = os.path.realpath(os.path.join(self.base_dir, path[len("/audio/"):]))
+        return full if full.startswith(self.base_dir + os.sep) else None
+
+    async def respond(self, writer, method, path, headers):
+        """Write one response. Returns whether the connection can be reused."""
+        if method not in ("GET", "HEAD"):
+            return self._error(writer, 405)
+        full_path = self._resolve(path)
+        if full_path is None:
+            return self._error(writer, 404)
+        slide = _SLIDE_PATH.match(path)
+        job = self.slide_job(int(slide.group(1)), int(slide.group(2))) if slide else None
+        if job is not None and (job.key in self.inflight or self.needs_synthesis(job)):
+            synthesis = self.synthesis_for(job)
+            if "range" not in headers and method == "GET":
+                return await self._stream_synthesis(writer, synthesis)
+            await synthesis.wait(float("inf"))  # ranges need the finished file
+            if synthesis.error is not None:
+                return self._error(writer, 502, synthesis.error)
+        return await self._serve_file(writer, method, full_path, headers)
+
+    async def _stream_synthesis(self, writer, synthesis):
+        """Send audio as it arrives. The length isn't known yet, so the connection ends the body."""
+        await synthesis.wait(0)
+        if synthesis.error is not None and not synthesis.audio:
+            return self._error(writer, 502, synthesis.error)
+        if synthesis.done and not synthesis.audio:  # a cache hit: nothing streamed, the file is ready
+            return await self._serve_file(writer, "GET", synthesis.job.output_path, {})
+        self._head(writer, 200, [("Content-Type", "audio/mpeg"), ("Cache-Control", "no-cache"),
+                                 ("Connection", "close")])
+        sent = 0
+        while True:
+            if len(synthesis.audio) > sent:
+                writer.write(bytes(synthesis.audio[sent:]))
+                sent = len(synthesis.audio)
+                await writer.drain()
+            if synthesis.done:
+                return False
+            await synthesis.wait(sent)
+
+    async def _serve_file(self, writer, method, path, headers):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return self._error(writer, 404)
+        if not os.path.isfile(path):
+            return self._error(writer, 404)
+        cached = self.memory.get(path, st)
+        if cached is not None:
+            data, etag = cached
+        elif st.st_size <= self.memory.max_entry:
+            st, data = await asyncio.to_thread(_read, path)
+            etag = f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+            self.memory.put(path, st, data, etag)
+        else:
+            data, etag = None, f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        size = st.st_size if data is None else len(data)
+
+        common = [("ETag", etag), ("Accept-Ranges", "bytes"), ("Cache-Control", "no-cache"),
+                  ("Last-Modified", formatdate(st.st_mtime, usegmt=True))]
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            self._head(writer, 304, common)
+            return True
+        status, start, end = 200, 0, size
+        if "range" in headers and headers.get("if-range", etag) == etag:
+            try:
+                requested = parse_range(headers["range"], size)
+            except ValueError:
+                self._head(writer, 416, [("Content-Range", f"bytes */{size}")], 0)
+                return True
+            if requested is not None:
+                status, (start, end) = 206, requested
+                common.append(("Content-Range", f"bytes {start}-{end - 1}/{size}"))
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self._head(writer, status, [("Content-Type", content_type)] + common, end - start)
+        if method == "HEAD":
+            return True
+        if data is not None:
+            writer.write(data[start:end])
+            return True
+        for offset in range(start, end, READ_CHUNK):
+            writer.write(await asyncio.to_thread(_read_range, path, offset, min(READ_CHUNK, end - offset)))
+            await writer.drain()
+        return True
+
+    def status(self):
+        parts = [f"{self.synthesized} synthesized", f"{self.coalesced} coalesced", f"memory: {self.memory}"]
+        if self.limiter is not None:
+            parts.append(str(self.limiter))
+        return "; ".join(parts)
+
+
+async def serve(server, host, port):
+    listener = await asyncio.start_server(server.handle, host, port)
+    engine = server.tts
+    print(f"🔊 Serving {server.base_dir} at http://{host}:{port}/audio/ with {engine}")
+    async with listener:
+        try:
+            await listener.serve_forever()
+        finally:
+            print(f"   {server.status()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m audio_pipeline.server", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--base-dir", default="public/audio", help="directory served as /audio/")
+    parser.add_argument("--memory-mb", type=float, default=DEFAULT_MEMORY_MB, help="in-memory LRU size")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds per slide synthesis attempt")
+    parser.add_argument("--retries", type=int, default=2, help="retries before any audio was sent")
+    parser.add_argument("--backoff", type=float, default=1.0, help="base delay for retry backoff")
+    parser.add_argument("--corpus-dir", default=DEFAULT_STORE_DIR, help="where the compiled lesson corpus is kept")
+    add_engine_arguments(parser, "edge")
+    add_cache_arguments(parser)
+    add_chunking_arguments(parser)
+    add_ratelimit_arguments(parser)
+    args = parser.parse_args(argv)
+    server = AudioServer(engine_from_args(args), args)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Per-lesson audio sprite: all slides of a lesson in one MP3.
+
+The slides' audio frames are concatenated as they are (ID3 tags and Xing/Info
+frames dropped, nothing re-encoded) into lessonN/lesson.mp3, with an index
+mapping every slide to its byte and time range:
+
+    public/audio/lesson6/lesson.sprite.json
+    {"lessonId": 6, "file": "lesson.mp3", "bytes": ..., "durationSec": ...,
+     "sampleRate": 24000, "channels": 1,
+     "slides": [{"slide": 1, "file": "slide1.mp3", "byteStart": 0, "byteEnd": 199296,
+                 "startSec": 0.0, "durationSec": 33.216}, ...]}
+
+byteEnd is exclusive (HTTP Range is `bytes=byteStart-(byteEnd-1)`). Every
+slide starts on a frame whose encoder began a fresh bit reservoir, so a
+per-slide Range read decodes on its own, and a client can also fetch the
+whole lesson once and seek by startSec. The slideN.mp3 files stay as they are.
+All slides must share sample rate and channel count; a lesson mixing
+formats is skipped, since joining it would need a re-encode.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from . import mp3
+from .fsutil import atomic_write_bytes, file_sha256
+
+SPRITE_NAME = "lesson.mp3"
+INDEX_NAME = "lesson.sprite.json"
+
+
+def lesson_slide_files(lesson_dir):
+    """{slide: filename} for the slideN.mp3 files in `lesson_dir`."""
+    files = {}
+    for name in os.listdir(lesson_dir):
+        if name.startswith("slide") and name.endswith(".mp3") and name[5:-4].isdigit():
+            files[int(name[5:-4])] = name
+    return files
+
+
+def _load_index(lesson_dir):
+    try:
+        with open(os.path.join(lesson_dir, INDEX_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_sprite(lesson_dir, lesson_id, files=None, force=False):
+    """
+    Write lesson.mp3 and lesson.sprite.json for `files` ({slide: filename},
+    default: every slideN.mp3). Returns the index, or None if the slides
+    can't be joined. Unchanged inputs (by content hash) are not rebuilt.
+    """
+    files = files if files is not None else lesson_slide_files(lesson_dir)
+    if not files:
+        return None
+    sources = {str(slide): file_sha256(os.path.join(lesson_dir, name)) for slide, name in sorted(files.items())}
+    previous = _load_index(lesson_dir)
+    if (not force and previous is not None and previous.get("sources") == sources
+            and os.path.exists(os.path.join(lesson_dir, SPRITE_NAME))):
+        return previous
+
+    audio, entries, offset, start, fmt = [], [], 0, 0.0, None
+    for slide, name in sorted(files.items()):
+        with open(os.path.join(lesson_dir, name), "rb") as f:
+            data = f.read()
+        frames = mp3.audio_frames(data)
+        if not frames:
+            print(f"   ✗ Sprite for {lesson_dir}: {name} has no audio frames")
+            return None
+        slide_fmt = (frames[0].sample_rate, frames[0].channels)
+        if fmt is None:
+            fmt = slide_fmt
+        elif slide_fmt != fmt or any((f.sample_rate, f.channels) != fmt for f in frames):
+            print(f"   ✗ Sprite for {lesson_dir}: {name} is {slide_fmt[0]} Hz/{slide_fmt[1]} ch, "
+                  f"others are {fmt[0]} Hz/{fmt[1]} ch; not joining")
+            return None
+        chunk = b"".join(data[f.offset:f.offset + f.length] for f in frames)
+        seconds = sum(f.duration for f in frames)
+        entries.append({"slide": slide, "file": name, "byteStart": offset, "byteEnd": offset + len(chunk),
+                        "startSec": round(start, 3), "durationSec": round(seconds, 3)})
+        audio.append(chunk)
+        offset += len(chunk)
+        start += seconds
+
+    index = {
+        "lessonId": lesson_id,
+        "file": SPRITE_NAME,
+        "bytes": offset,
+        "durationSec": round(start, 3),
+        "sampleRate": fmt[0],
+        "channels": fmt[1],
+        "slides": entries,
+        "sources": sources,
+    }
+    atomic_write_bytes(os.path.join(lesson_dir, SPRITE_NAME), b"".join(audio))
+    atomic_write_bytes(os.path.join(lesson_dir, INDEX_NAME),
+                       (json.dumps(index, ensure_ascii=False, indent=1) + "\n").encode("utf-8"))
+    return index
+
+
+def refresh_sprite(lesson_dir, lesson_id=None):
+    """Rebuild an existing sprite after its slides were rewritten (e.g. by the loudness pass)."""
+    previous = _load_index(lesson_dir)
+    if previous is None:
+        return None
+    files = {entry["slide"]: entry["file"] for entry in previous["slides"]}
+    files = {slide: name for slide, name in files.items() if os.path.exists(os.path.join(lesson_dir, name))}
+    return build_sprite(lesson_dir, lesson_id if lesson_id is not None else previous.get("lessonId"), files)
+
+
+def add_sprite_arguments(parser):
+    parser.add_argument("--sprite", action="store_true",
+                        help="also write lessonN/lesson.mp3 with a byte/time index (lesson.sprite.json)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m audio_pipeline.sprite", description=__doc__.split("\n\n")[0])
+    parser.add_argument("lessons", type=int, nargs="+", help="lesson numbers under --base-dir")
+    parser.add_argument("--base-dir", default="public/audio")
+    parser.add_argument("--force", action="store_true", help="rebuild even if no slide changed")
+    args = parser.parse_args(argv)
+    ok = True
+    for lesson in args.lessons:
+        lesson_dir = os.path.join(args.base_dir, f"lesson{lesson}")
+        index = build_sprite(lesson_dir, lesson, force=args.force) if os.path.isdir(lesson_dir) else None
+        if index is None:
+            print(f"   ✗ Lesson {lesson}: no sprite")
+            ok = False
+            continue
+        print(f"   ✓ {lesson_dir}/{SPRITE_NAME}: {len(index['slides'])} slides, "
+              f"{index['bytes'] / 1e6:.1f} MB, {index['durationSec'] / 60:.1f} min")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Streaming output stage for TTS providers.
+
+Instead of `communicate.save(path)` (no progress, and a half-written MP3 left
+at the final path if the process dies) we consume the provider's chunk stream
+as it arrives: audio chunks go through a bounded write buffer into a temp file
+beside the destination, which is fsync'd and renamed into place only once the
+stream ends cleanly. WordBoundary/SentenceBoundary events from the same stream
+are collected on the way, and time to first audio byte is measured per slide.
+
+Streams yield Edge TTS style dicts: {"type": "audio", "data": b"..."} or
+{"type": "WordBoundary", "offset": ..., "duration": ..., "text": ...}.
+"""
+
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+from .fsutil import publish_mode
+from .telemetry import add_bytes, add_span
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+
+@dataclass
+class StreamStats:
+    status: str = "synthesized"
+    bytes: int = 0
+    chunks: int = 0
+    ttfb: float = None  # seconds until the first audio chunk
+    seconds: float = 0.0
+    boundaries: list = field(default_factory=list)
+
+    def __str__(self):
+        if self.ttfb is None:
+            return self.status
+        return f"{self.status}, {self.bytes / 1024:.0f} KB, first byte {self.ttfb:.2f}s"
+
+
+class AtomicFileWriter:
+    """Buffered writer to a temp file that only appears at `path` on commit()."""
+
+    def __init__(self, path, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.path = path
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=os.path.splitext(path)[1], dir=directory)
+        self._file = os.fdopen(fd, "wb", buffering=buffer_size)
+
+    def write(self, data):
+        self._file.write(data)
+
+    def commit(self):
+        self._file.flush()
+        publish_mode(self._file.fileno(), self.path)
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        elif not self._file.closed:
+            self.commit()
+        return False
+
+
+async def stream_to_file(stream, path, buffer_size=DEFAULT_BUFFER_SIZE, on_chunk=None):
+    """
+    Drain an async chunk stream into `path` atomically. Returns StreamStats.
+    `on_chunk(stats)` is called after every audio chunk for progress reporting.
+    Raises (and leaves `path` untouched) if the stream fails or yields no audio.
+    The running job's trace gets connect/ttfb/stream/publish spans.
+    """
+    stats = StreamStats()
+    started = time.perf_counter()
+    first_event = None
+    with AtomicFileWriter(path, buffer_size) as writer:
+        async for chunk in stream:
+            if first_event is None:
+                first_event = time.perf_counter()
+                add_span("connect", first_event - started)
+            if chunk["type"] == "audio":
+                if stats.ttfb is None:
+                    stats.ttfb = time.perf_counter() - started
+                    add_span("ttfb", stats.ttfb)
+                writer.write(chunk["data"])
+                stats.bytes += len(chunk["data"])
+                stats.chunks += 1
+                if on_chunk is not None:
+                    on_chunk(stats)
+            elif chunk["type"] in ("WordBoundary", "SentenceBoundary"):
+                stats.boundaries.append({
+                    "type": chunk["type"],
+                    "offset": chunk["offset"],
+                    "duration": chunk["duration"],
+                    "text": chunk["text"],
+                })
+        if not stats.bytes:
+            raise RuntimeError("TTS stream ended without audio")
+        streamed = time.perf_counter()
+        add_span("stream", streamed - started - stats.ttfb)
+    stats.seconds = time.perf_counter() - started
+    add_span("publish", started + stats.seconds - streamed)
+    add_bytes(stats.bytes)
+    return stats
@@ -0,0 +1,205 @@
+"""
+Per-job timing and throughput instrumentation.
+
+Every synthesis job gets a JobTrace that records where its time went:
+
+    queue_wait       waiting for a scheduler slot
+    rate_limit_wait  waiting for the provider rate limiter
+    connect          provider call until its first event (includes rate_limit_wait)
+    ttfb             provider call until the first audio byte
+    stream           first audio byte until the stream ended
+    publish          fsync + rename of the output and cache insert
+    cache_copy       copying a cached MP3 into place
+    backoff          sleeping between retries
+
+plus chars, bytes and retry counts. The trace for the running job lives in a
+context variable, so the streaming, cache and limiter layers add to it without
+being passed anything; chunk pieces of one slide inherit the same trace, so
+their spans are summed (they may overlap in wall-clock time).
+
+At the end of a run the traces are written as a JSON-lines event log and a
+Prometheus textfile (for node_exporter's textfile collector), and summarized
+in a table per lesson and engine.
+"""
+
+import contextvars
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from .fsutil import atomic_write_bytes
+
+SPANS = ("queue_wait", "rate_limit_wait", "connect", "ttfb", "stream", "publish", "cache_copy", "backoff")
+DEFAULT_METRICS_DIR = ".tts-telemetry"
+
+_current = contextvars.ContextVar("tts_job_trace", default=None)
+
+
+class JobTrace:
+    def __init__(self, job, engine):
+        self.job = job
+        self.engine = engine
+        self.spans = defaultdict(float)
+        self.chars = len(job.text)
+        self.bytes = 0
+        self.retries = 0
+        self.started = time.time()
+        self.seconds = 0.0
+        self.ok = None
+        self.status = None
+        self.error = None
+
+    def to_event(self):
+        return {
+            "event": "job",
+            "lesson": self.job.lesson,
+            "slide": self.job.slide,
+            "engine": self.engine,
+            "ok": self.ok,
+            "status": self.status,
+            "error": self.error,
+            "chars": self.chars,
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "seconds": round(self.seconds, 4),
+            "spans": {name: round(seconds, 4) for name, seconds in self.spans.items()},
+            "startedAt": round(self.started, 3),
+        }
+
+
+def add_span(name, seconds):
+    """Add `seconds` to span `name` of the job running in this context (no-op outside a job)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.spans[name] += seconds
+
+
+def add_bytes(count):
+    trace = _current.get()
+    if trace is not None:
+        trace.bytes += count
+
+
+@contextmanager
+def span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - started)
+
+
+class Telemetry:
+    def __init__(self, engine, events_path=None, prom_path=None):
+        self.engine = engine
+        self.events_path = events_path
+        self.prom_path = prom_path
+        self.traces = []
+        self.started = time.perf_counter()
+        self._events = None
+        if events_path:
+            os.makedirs(os.path.dirname(events_path) or ".", exist_ok=True)
+            self._events = open(events_path, "a", encoding="utf-8")
+
+    def start(self, job):
+        """Create the job's trace and make it current for this task and its children."""
+        trace = JobTrace(job, self.engine)
+        _current.set(trace)
+        self.traces.append(trace)
+        return trace
+
+    def retry(self, job, attempt, error, delay):
+        self._write({"event": "retry", "lesson": job.lesson, "slide": job.slide, "engine": self.engine,
+                     "attempt": attempt, "error": error, "delay": round(delay, 3)})
+
+    def finish(self, trace, result):
+        trace.seconds = time.time() - trace.started
+        trace.ok = result.ok
+        trace.error = result.error
+        trace.status = getattr(result.value, "status", None) if result.ok else "failed"
+        trace.retries = result.attempts - 1
+        self._write(trace.to_event())
+
+    def _write(self, event):
+        if self._events is not None:
+            self._events.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self._events.flush()
+
+    def close(self):
+        wall = time.perf_counter() - self.started
+        self._write({"event": "run", "engine": self.engine, "jobs": len(self.traces),
+                     "wallSec": round(wall, 3), "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())})
+        if self._events is not None:
+            self._events.close()
+        if self.prom_path:
+            atomic_write_bytes(self.prom_path, self.prometheus(wall).encode("utf-8"))
+
+    def _groups(self):
+        groups = defaultdict(list)
+        for trace in self.traces:
+            groups[(trace.job.lesson, trace.engine)].append(trace)
+        return sorted(groups.items())
+
+    def prometheus(self, wall):
+        lines = [
+            "# HELP tts_jobs_total Synthesis jobs by outcome.",
+            "# TYPE tts_jobs_total counter",
+        ]
+        for (lesson, engine), traces in self._groups():
+            for status in sorted({t.status or "unknown" for t in traces}):
+                count = sum(1 for t in traces if (t.status or "unknown") == status)
+                lines.append(f'tts_jobs_total{{lesson="{lesson}",engine="{engine}",status="{status}"}} {count}')
+        for metric, help_text, attr in (("tts_chars_total", "Characters of slide text processed.", "chars"),
+                                        ("tts_bytes_total", "Audio bytes written.", "bytes"),
+                                        ("tts_retries_total", "Retried attempts.", "retries")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for (lesson, engine), traces in self._groups():
+                total = sum(getattr(t, attr) for t in traces)
+                lines.append(f'{metric}{{lesson="{lesson}",engine="{engine}"}} {total}')
+        lines += ["# HELP tts_span_seconds_total Time spent per job phase.",
+                  "# TYPE tts_span_seconds_total counter"]
+        for (lesson, engine), traces in self._groups():
+            for name in SPANS:
+                total = sum(t.spans.get(name, 0.0) for t in traces)
+                if total:
+                    lines.append(f'tts_span_seconds_total{{lesson="{lesson}",engine="{engine}",span="{name}"}} '
+                                 f'{total:.4f}')
+        lines += ["# HELP tts_run_duration_seconds Wall-clock duration of the last run.",
+                  "# TYPE tts_run_duration_seconds gauge",
+                  f'tts_run_duration_seconds{{engine="{self.engine}"}} {wall:.3f}',
+                  "# HELP tts_run_completed_timestamp_seconds When the last run finished.",
+                  "# TYPE tts_run_completed_timestamp_seconds gauge",
+                  f'tts_run_completed_timestamp_seconds{{engine="{self.engine}"}} {time.time():.0f}']
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Per lesson/engine table of averages, as printed at the end of a run."""
+        shown = ("queue_wait", "rate_limit_wait", "connect", "ttfb", "stream", "publish")
+        header = (f"   {'lesson':>6} {'engine':<8} {'ok':>4} {'fail':>4} {'retry':>5} {'chars':>7} {'MB':>6}  "
+                  + " ".join(f"{name[:10]:>10}" for name in shown))
+        rows = [header, "   " + "-" * (len(header) - 3)]
+        for (lesson, engine), traces in self._groups():
+            ok = sum(1 for t in traces if t.ok)
+            averages = [sum(t.spans.get(name, 0.0) for t in traces) / len(traces) for name in shown]
+            rows.append(f"   {lesson:>6} {engine:<8} {ok:>4} {len(traces) - ok:>4} "
+                        f"{sum(t.retries for t in traces):>5} {sum(t.chars for t in traces):>7} "
+                        f"{sum(t.bytes for t in traces) / 1e6:>6.2f}  "
+                        + " ".join(f"{avg:>9.2f}s" for avg in averages))
+        rows.append("   (span columns are per-job averages)")
+        return "\n".join(rows)
+
+
+def telemetry_from_args(args, engine, script_path):
+    if args.no_metrics:
+        return None
+    name = os.path.splitext(os.path.basename(script_path))[0]
+    directory = args.metrics_dir
+    return Telemetry(engine, os.path.join(directory, f"{name}.events.jsonl"), os.path.join(directory, f"{name}.prom"))
+
+
+def add_telemetry_arguments(parser):
+    parser.add_argument("--metrics-dir", default=DEFAULT_METRICS_DIR,
+                        help="where the JSON-lines event log and Prometheus textfile go")
+    parser.add_argument("--no-metrics", action="store_true", help="don't write the event log or textfile")
@@ -0,0 +1,141 @@
+"""
+Word-timestamp sidecars written during synthesis.
+
+The WordBoundary events a provider streams alongside the audio (see
+streaming.py) are kept instead of discarded. Every slide gets a compact
+sidecar next to its MP3, and every lesson a merged index, so the player and
+audit scripts can look up durations, sentence starts and word offsets instead
+of probing MP3s:
+
+    public/audio/lesson6/slide3.timing.json
+    {"lessonId": 6, "slide": 3, "file": "slide3.mp3", "durationSec": 41.232,
+     "sentences": [[startMs, charStart, charEnd], ...],
+     "words": [[startMs, durationMs, charStart, "word"], ...]}
+
+    public/audio/lesson6/timing.json
+    {"lessonId": 6, "totalDurationSec": ..., "slides": [{"slide": 3,
+     "startSec": <offset in the lesson>, ...the slide sidecar...}, ...]}
+
+Character offsets point into the slide text (-1 when the provider rewrote a
+word, e.g. spelled out a number), so highlighting needs no fuzzy matching.
+Slides built before sidecars existed appear in the lesson index with their
+manifest duration only ("words": []) until they are regenerated.
+"""
+
+import json
+import os
+import re
+
+from . import mp3
+from .chunking import TICKS_PER_SECOND
+from .fsutil import atomic_write_bytes
+from .sprite import lesson_slide_files
+
+SIDECAR_SUFFIX = ".timing.json"
+LESSON_INDEX = "timing.json"
+
+_SENTENCE = re.compile(r"\S.*?(?:[.!?…][\"'”’»)]*(?=\s|$)|$)", re.S)
+
+
+def sidecar_path(output_path):
+    return os.path.splitext(output_path)[0] + SIDECAR_SUFFIX
+
+
+def _ms(ticks):
+    return round(ticks * 1000 / TICKS_PER_SECOND)
+
+
+def align_words(text, boundaries):
+    """[[startMs, durationMs, charStart, word]] for the WordBoundary events, located in `text`."""
+    words, position = [], 0
+    for boundary in boundaries:
+        if boundary.get("type", "WordBoundary") != "WordBoundary":
+            continue
+        word = boundary["text"]
+        found = text.find(word, position)
+        if found < 0:  # provider normalized the word (numbers, abbreviations): keep it, unanchored
+            start = -1
+        else:
+            start, position = found, found + len(word)
+        words.append([_ms(boundary["offset"]), _ms(boundary["duration"]), start, word])
+    return words
+
+
+def sentence_starts(text, words):
+    """[[startMs, charStart, charEnd]]: each sentence starts with its first aligned word."""
+    anchored = [w for w in words if w[2] >= 0]
+    sentences, i = [], 0
+    for match in _SENTENCE.finditer(text):
+        while i < len(anchored) and anchored[i][2] < match.start():
+            i += 1
+        if i == len(anchored) or anchored[i][2] >= match.end():
+            continue
+        sentences.append([anchored[i][0], match.start(), match.end()])
+    return sentences
+
+
+def slide_timing(job, boundaries, duration):
+    words = align_words(job.text, boundaries)
+    return {
+        "lessonId": job.lesson,
+        "slide": job.slide,
+        "file": os.path.basename(job.output_path),
+        "durationSec": round(duration, 3),
+        "sentences": sentence_starts(job.text, words),
+        "words": words,
+    }
+
+
+def _dump(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def write_slide_timing(job, boundaries):
+    """Write the sidecar for a freshly published slide. Returns its path."""
+    path = sidecar_path(job.output_path)
+    atomic_write_bytes(path, _dump(slide_timing(job, boundaries, mp3.file_duration(job.output_path))))
+    return path
+
+
+def _load_sidecar(output_path):
+    try:
+        with open(sidecar_path(output_path), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def retime_sidecar(output_path, trimmed_head, duration):
+    """Shift a sidecar after `trimmed_head` seconds were cut from the front of its MP3."""
+    timing = _load_sidecar(output_path)
+    if timing is None:
+        return False
+    shift = round(trimmed_head * 1000)
+    timing["durationSec"] = round(duration, 3)
+    timing["sentences"] = [[max(0, start - shift)] + rest for start, *rest in timing["sentences"]]
+    timing["words"] = [[max(0, start - shift)] + rest for start, *rest in timing["words"]]
+    atomic_write_bytes(sidecar_path(output_path), _dump(timing))
+    return True
+
+
+def write_lesson_timing(manifest):
+    """
+    Merge the sidecars of every slideN.mp3 in a LessonManifest's lesson
+    directory (owned by the manifest or not) into its timing.json. Durations
+    are measured from the MP3s themselves and summed unrounded, so startSec
+    matches lesson.sprite.json even where an older sidecar is off; slides
+    without a sidecar just have no sentences or words. Returns the path.
+    """
+    entries, start = [], 0.0
+    for slide, filename in sorted(lesson_slide_files(manifest.lesson_dir).items()):
+        output_path = os.path.join(manifest.lesson_dir, filename)
+        timing = _load_sidecar(output_path) or {"sentences": [], "words": []}
+        duration = mp3.file_duration(output_path)
+        entries.append({"slide": slide, "file": filename, "startSec": round(start, 3),
+                        "durationSec": round(duration, 3), "sentences": timing["sentences"],
+                        "words": timing["words"]})
+        start += duration
+    path = os.path.join(manifest.lesson_dir, LESSON_INDEX)
+    atomic_write_bytes(path, _dump({"lessonId": manifest.lesson_id, "totalDurationSec": round(start, 3),
+                                    "slides": entries}))
+    return path
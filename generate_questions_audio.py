@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Generate quiz question audio (question and answer clips) for every lesson
+that has public/data/questions/lessonN.json
+
+Output: public/audio/questions/lessonN/questionM.mp3, answerM.mp3, manifest.json
+
+Install: pip3 install edge-tts  (or run with --engine local, no dependencies)
+Run: python3 generate_questions_audio.py [--lessons 8 9 21] [--workers 4] [--batch-chars 2500]
+"""
+
+import argparse
+import asyncio
+import sys
+
+from audio_pipeline.cache import add_cache_arguments
+from audio_pipeline.engines import add_engine_arguments, engine_from_args
+from audio_pipeline.questions import add_questions_arguments, find_question_files, generate_questions
+from audio_pipeline.ratelimit import add_ratelimit_arguments
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Generate quiz question audio")
+    parser.add_argument("--lessons", "--lesson", type=int, nargs="+",
+                        help="lessons to generate (default: every questions file)")
+    add_questions_arguments(parser)
+    add_engine_arguments(parser, "edge")
+    parser.add_argument("--retries", type=int, default=2, help="retries per request")
+    parser.add_argument("--backoff", type=float, default=1.0, help="base backoff delay in seconds")
+    add_cache_arguments(parser)
+    add_ratelimit_arguments(parser)
+    args = parser.parse_args()
+    tts = engine_from_args(args)
+
+    available = find_question_files(args.questions_dir)
+    missing = sorted(set(args.lessons or ()) - set(available))
+    if missing:
+        print(f"❌ No questions file for lesson(s) {', '.join(map(str, missing))} in {args.questions_dir}")
+        return 1
+    lessons = {n: available[n] for n in (args.lessons or sorted(available))}
+
+    print("🎬 Quiz Questions Audio Generator")
+    print(f"Voice: {tts}")
+    print(f"Lessons: {', '.join(map(str, lessons))}")
+    if not await generate_questions(lessons, tts, args):
+        return 1
+
+    print(f"\n🎉 Done! Audio files saved to: {args.output_dir}/lessonN/")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -2,6 +2,7 @@
 set -euo pipefail
 
 # Adds background music to all slide*.mp3 files of lesson 1.
+# Any lesson: python3 -m audio_pipeline.bgmix --lesson N --music /path/to/music.mp3
 # Default music file is the one provided by the user.
 #
 # Usage:
@@ -34,8 +35,8 @@ if ! command -v ffmpeg >/dev/null 2>&1; then
   exit 1
 fi
 
-if ! command -v ffprobe >/dev/null 2>&1; then
-  echo "Error: ffprobe not found in PATH"
+if ! python3 -c "import numpy" >/dev/null 2>&1; then
+  echo "Error: python3 with numpy not found (pip3 install numpy)"
   exit 1
 fi
 
@@ -49,56 +50,19 @@ if [[ ! -f "$MUSIC_FILE" ]]; then
   exit 1
 fi
 
-mkdir -p "$OUTPUT_DIR"
-
-shopt -s nullglob
-slides=("$SOURCE_DIR"/slide*.mp3)
-
-if [[ ${#slides[@]} -eq 0 ]]; then
-  echo "Error: no slide*.mp3 found in $SOURCE_DIR"
-  exit 1
-fi
-
-echo "Source dir : $SOURCE_DIR"
-echo "Output dir : $OUTPUT_DIR"
-echo "Music file : $MUSIC_FILE"
-echo "Slides     : ${#slides[@]}"
-echo
-
-for input_file in "${slides[@]}"; do
-  filename="$(basename "$input_file")"
-  output_file="$OUTPUT_DIR/$filename"
-
-  duration="$(ffprobe -v error -show_entries format=duration -of default=nokey=1:noprint_wrappers=1 "$input_file" || true)"
-  if [[ -z "$duration" ]]; then
-    echo "Skip $filename: cannot detect duration"
-    continue
-  fi
-
-  fade_out_start="$(
-    awk -v d="$duration" -v f="$FADE_OUT_SEC" 'BEGIN { s = d - f; if (s < 0) s = 0; printf "%.3f", s }'
-  )"
-  use_fades="$(
-    awk -v d="$duration" -v fi="$FADE_IN_SEC" -v fo="$FADE_OUT_SEC" 'BEGIN { print (d > (fi + fo + 0.4)) ? 1 : 0 }'
-  )"
-
-  if [[ "$use_fades" == "1" ]]; then
-    bg_filter="volume=${BG_VOLUME},afade=t=in:st=0:d=${FADE_IN_SEC},afade=t=out:st=${fade_out_start}:d=${FADE_OUT_SEC}"
-  else
-    bg_filter="volume=${BG_VOLUME}"
-  fi
-
-  echo "Processing $filename (duration: ${duration}s)"
-  ffmpeg -y \
-    -i "$input_file" \
-    -ss "$MUSIC_OFFSET_SEC" \
-    -stream_loop -1 -i "$MUSIC_FILE" \
-    -filter_complex "[0:a]volume=${VOICE_VOLUME}[voice];[1:a]${bg_filter}[bg];[voice][bg]amix=inputs=2:duration=first:dropout_transition=0:normalize=0,volume=${MIX_GAIN},alimiter=limit=0.97[out]" \
-    -map "[out]" \
-    -c:a libmp3lame -q:a 2 \
-    "$output_file" \
-    -loglevel error
-done
+# The mixing itself lives in audio_pipeline/bgmix.py: the music is decoded once
+# and the slides are mixed in parallel (python3 -m audio_pipeline.bgmix --help).
+# PYTHONPATH instead of cd, so relative paths still resolve against the caller's cwd.
+PYTHONPATH="$ROOT_DIR${PYTHONPATH:+:$PYTHONPATH}" python3 -m audio_pipeline.bgmix \
+  --source-dir "$SOURCE_DIR" \
+  --output-dir "$OUTPUT_DIR" \
+  --music "$MUSIC_FILE" \
+  --voice-volume "$VOICE_VOLUME" \
+  --bg-volume "$BG_VOLUME" \
+  --mix-gain "$MIX_GAIN" \
+  --music-offset "$MUSIC_OFFSET_SEC" \
+  --fade-in "$FADE_IN_SEC" \
+  --fade-out "$FADE_OUT_SEC"
 
 echo
 echo "Done. Files with background music are saved to:"